@@ -0,0 +1,147 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import hashlib
+import resource
+import subprocess
+import tempfile
+from synthetic import make_games, team_nickname
+from streak_finder.array_store import ArrayStore, ArrayStoreWriter, STORE_GAME_COLUMNS
+from streak_finder.streak_data import GameData, StreakData, STREAK_GAME_COLUMNS
+
+
+"""
+Array store benchmark (see streak_finder/array_store.py).
+
+Writes a long synthetic league history (see synthetic.py) to an array
+store a few seasons at a time, then runs the same streak queries in
+separate processes, each reporting its time and peak memory use:
+
+- memory: the store's columns copied into an in-memory data frame
+  (like loading the games cache), then all seasons
+- store: the memory-mapped store (StreakData.from_store), all seasons
+- store, last N seasons: the store, only the last --window seasons
+- memory, last N seasons: in memory, only the last --window seasons
+
+and checks that the memory and store queries find the same streaks.
+
+    python benchmarks/bench_array_store.py
+    python benchmarks/bench_array_store.py --teams 100 --seasons 1000 --days 150 --keep /tmp/big_store
+"""
+
+
+def build_store(path, teams, seasons, days, chunk_seasons):
+    """Write a synthetic league to an array store, chunk_seasons seasons at a time"""
+    writer = ArrayStoreWriter(path)
+    for first in range(0, seasons, chunk_seasons):
+        n = min(chunk_seasons, seasons - first)
+        df = make_games(teams, n, days, seed=first)
+        df['season'] += first
+        writer.append(df[STORE_GAME_COLUMNS])
+    return writer.close()
+
+
+def peak_memory_mb():
+    """
+    Peak memory use of this process, in MB. This is VmHWM on Linux
+    (ru_maxrss would include the memory of the parent process,
+    which it keeps across fork and exec), ru_maxrss elsewhere.
+    """
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])/1024.0
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    scale = 1024.0*1024.0 if sys.platform == 'darwin' else 1024.0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/scale
+
+
+def run_query(mode, path, teams, window, min_length):
+    """Run one query (in a child process) and return its result as a dict"""
+    start = time.perf_counter()
+    store = ArrayStore(path)
+    team_names = [team_nickname(i) for i in range(teams)]
+    seasons = store.seasons[-window:] if window else store.seasons
+    options = argparse.Namespace(team=team_names, versus_team=team_names,
+                                 season=[str(s+1) for s in seasons],
+                                 winning=True, min=min_length)
+    if mode == 'memory':
+        games = GameData(store.frame(STREAK_GAME_COLUMNS).copy(deep=True))
+        sd = StreakData(options, games=games)
+    else:
+        sd = StreakData.from_store(options, path)
+    streaks, _ = sd.find_streaks()
+    elapsed = time.perf_counter() - start
+
+    key = streaks[['Team Name', 'Streak Length', 'Streak Season', 'Streak Start']].values.tolist()
+    return {
+        "seconds": elapsed,
+        "peak_mb": peak_memory_mb(),
+        "streaks": len(key),
+        "hash": hashlib.sha1(json.dumps(key).encode('utf-8')).hexdigest()
+    }
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark memory-mapped array store queries on a long synthetic league history")
+    p.add_argument('--teams', type=int, default=40, help='Number of teams (default 40)')
+    p.add_argument('--seasons', type=int, default=300, help='Number of seasons (default 300)')
+    p.add_argument('--days', type=int, default=120, help='Days per season (default 120)')
+    p.add_argument('--chunk-seasons', type=int, default=20, help='Seasons to make and write at a time (default 20)')
+    p.add_argument('--window', type=int, default=5, help='Number of seasons for the last-seasons queries (default 5)')
+    p.add_argument('--min', type=int, default=8, help='Minimum streak length (default 8)')
+    p.add_argument('--keep', default='', help='Write the store here and keep it (default: a temporary directory)')
+    p.add_argument('--child', default='', help=argparse.SUPPRESS)
+    p.add_argument('--path', default='', help=argparse.SUPPRESS)
+    args = p.parse_args()
+
+    if args.child:
+        window = args.window if args.child.endswith('window') else 0
+        result = run_query(args.child.split('-')[0], args.path, args.teams, window, args.min)
+        print(json.dumps(result))
+        return
+
+    path = args.keep or tempfile.mkdtemp(prefix='array_store_')
+    try:
+        print("Writing %d seasons of %d days for %d teams"%(args.seasons, args.days, args.teams))
+        start = time.perf_counter()
+        store = build_store(path, args.teams, args.seasons, args.days, args.chunk_seasons)
+        size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+        print("%d games, %.1f MB on disk, written in %.2f s"%(len(store), size/1e6, time.perf_counter() - start))
+
+        modes = [
+            ('memory', "memory, all seasons"),
+            ('store', "store, all seasons"),
+            ('memory-window', "memory, last %d seasons"%(args.window)),
+            ('store-window', "store, last %d seasons"%(args.window))
+        ]
+        print("%-26s %10s %14s %10s"%("Query", "Seconds", "Peak RSS MB", "Streaks"))
+        results = {}
+        for mode, label in modes:
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--child', mode, '--path', path,
+                 '--teams', str(args.teams), '--window', str(args.window), '--min', str(args.min)],
+                check=True, stdout=subprocess.PIPE, universal_newlines=True
+            ).stdout
+            results[mode] = json.loads(out.strip().splitlines()[-1])
+            r = results[mode]
+            print("%-26s %10.3f %14.1f %10d"%(label, r['seconds'], r['peak_mb'], r['streaks']))
+
+        for a, b in [('memory', 'store'), ('memory-window', 'store-window')]:
+            if results[a]['hash'] != results[b]['hash']:
+                print("FAIL: the %s query found different streaks in memory and in the store"%(b))
+                sys.exit(1)
+        print("OK: the store finds the same streaks as the in-memory data")
+    finally:
+        if not args.keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
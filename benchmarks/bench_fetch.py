@@ -0,0 +1,60 @@
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+from fetch_games_data import make_session, fetch_days
+from fake_blaseball_server import start_server, make_day_games
+
+
+"""
+Fetch throughput benchmark for scripts/fetch_games_data.py.
+
+Starts the local fake blaseball API (fake_blaseball_server.py) with a fixed
+delay per request and a 503 on every Nth request, then fetches the same
+backfill with different numbers of workers. For each run it checks that
+every day came back in order with the right games, and reports days/second.
+
+    python benchmarks/bench_fetch.py
+    python benchmarks/bench_fetch.py --days 300 --latency 0.05 --workers 1 --workers 16
+"""
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark concurrent day fetching against a local fake API")
+    p.add_argument('--days', type=int, default=120, help='Number of days to fetch (default 120)')
+    p.add_argument('--latency', type=float, default=0.02, help='Seconds of delay per request (default 0.02)')
+    p.add_argument('--fail-every', type=int, default=10, help='Fail every Nth request with a 503 (default 10)')
+    p.add_argument('--workers', type=int, action='append', help='Worker counts to test (default 1, 2, 4, 8, 16)')
+    args = p.parse_args()
+    worker_counts = args.workers or [1, 2, 4, 8, 16]
+
+    httpd, url = start_server(latency=args.latency, fail_every=args.fail_every)
+    dates = [(season, day) for season in range(5) for day in range(99)][:args.days]
+    expected = {date: make_day_games(*date) for date in dates}
+
+    print("%-8s %10s %10s %10s"%("Workers", "Seconds", "Days/sec", "Requests"))
+    try:
+        for workers in worker_counts:
+            session = make_session(workers, retries=5, backoff=0.01)
+            httpd.fake['requests'] = 0
+            start = time.perf_counter()
+            fetched = list(fetch_days(session, dates, workers, url))
+            elapsed = time.perf_counter() - start
+
+            if [date for date, _ in fetched] != dates:
+                print("FAIL: days were not returned in order")
+                sys.exit(1)
+            for date, games in fetched:
+                if games != expected[date]:
+                    print("FAIL: wrong games for season %d day %d"%(date[0]+1, date[1]+1))
+                    sys.exit(1)
+
+            print("%-8d %10.2f %10.1f %10d"%(workers, elapsed, len(dates)/elapsed, httpd.fake['requests']))
+    finally:
+        httpd.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import os
+import re
+import sys
+import time
+import json
+import tempfile
+import subprocess
+import argparse
+
+
+"""
+Import-time benchmark for the streak-finder command line tool.
+
+Runs `python -X importtime` on the command module (which is what the
+streak-finder entry point imports before it parses any arguments),
+and fails if the total import time goes over the startup budget,
+or if any of the heavy modules are imported at startup.
+
+Then runs `python -m streak_finder.command --version` with an empty
+cache directory (STREAK_FINDER_CACHE_DIR), as on a first run or after a
+data update, and fails if it takes longer than the run budget or if any
+of the heavy modules are in sys.modules once it is done.
+
+    python benchmarks/bench_import_time.py
+    python benchmarks/bench_import_time.py --budget-ms 100 --repeat 5
+"""
+
+
+# Module imported by the streak-finder console script
+ENTRY_MODULE = "streak_finder.command"
+
+# Modules that should only be imported when a query actually runs
+HEAVY_MODULES = ["pandas", "numpy", "blaseball_core_game_data"]
+
+DEFAULT_BUDGET_MS = 100
+DEFAULT_RUN_BUDGET_MS = 300
+
+# Runs the command line tool in this interpreter, then prints the
+# heavy modules that were imported
+VERSION_RUN = """
+import sys, json, runpy
+sys.argv = ['streak-finder', '--version']
+try:
+    runpy.run_module('%s', run_name='__main__', alter_sys=True)
+except SystemExit:
+    pass
+print(json.dumps(sorted(set(m.split('.')[0] for m in sys.modules).intersection(%r))))
+"""
+
+
+def main():
+    p = argparse.ArgumentParser(description="Check the import time of the streak-finder command line tool")
+    p.add_argument('--budget-ms',
+                   type=float,
+                   default=DEFAULT_BUDGET_MS,
+                   help='Maximum allowed import time in milliseconds (default %d)'%(DEFAULT_BUDGET_MS))
+    p.add_argument('--run-budget-ms',
+                   type=float,
+                   default=DEFAULT_RUN_BUDGET_MS,
+                   help='Maximum allowed time for a cold --version run in milliseconds (default %d)'%(DEFAULT_RUN_BUDGET_MS))
+    p.add_argument('--repeat',
+                   type=int,
+                   default=5,
+                   help='Number of runs (the fastest run is compared to the budget)')
+    args = p.parse_args()
+
+    timings = []
+    for _ in range(args.repeat):
+        total_us, modules = measure_import_time(ENTRY_MODULE)
+        timings.append(total_us)
+
+        heavy = sorted(set(modules).intersection(HEAVY_MODULES))
+        if len(heavy)>0:
+            print("FAIL: %s imports heavy modules at startup: %s"%(ENTRY_MODULE, ", ".join(heavy)))
+            sys.exit(1)
+
+    best_ms = min(timings)/1000.0
+    print("Import time for %s: best %.1f ms, worst %.1f ms (budget %.1f ms)"%(
+        ENTRY_MODULE, best_ms, max(timings)/1000.0, args.budget_ms
+    ))
+    if best_ms > args.budget_ms:
+        print("FAIL: startup import time is over budget")
+        sys.exit(1)
+
+    timings = []
+    for _ in range(args.repeat):
+        seconds, heavy = measure_version_run(ENTRY_MODULE)
+        timings.append(seconds)
+        if len(heavy)>0:
+            print("FAIL: --version with an empty cache imports heavy modules: %s"%(", ".join(heavy)))
+            sys.exit(1)
+
+    best_ms = 1000.0*min(timings)
+    print("Cold --version run: best %.1f ms, worst %.1f ms (budget %.1f ms)"%(
+        best_ms, 1000.0*max(timings), args.run_budget_ms
+    ))
+    if best_ms > args.run_budget_ms:
+        print("FAIL: --version run time is over budget")
+        sys.exit(1)
+    print("OK")
+
+
+def measure_import_time(module):
+    """
+    Run `python -X importtime -c "import module"` in a fresh interpreter.
+    Returns the total (cumulative) import time in microseconds for all
+    top-level imports, and the names of all modules imported.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import %s"%(module)],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True
+    )
+    # Lines look like: "import time:       316 |       7100 | json"
+    # (nested imports are indented, top-level imports are not)
+    line_re = re.compile(r"^import time:\s+(\d+)\s*\|\s*(\d+)\s*\|(\s*)(\S+)")
+    total_us = 0
+    modules = []
+    for line in proc.stderr.splitlines():
+        m = line_re.match(line)
+        if m is None:
+            continue
+        cumulative, indent, name = int(m.group(2)), m.group(3), m.group(4)
+        modules.append(name.split('.')[0])
+        if len(indent)<=1:
+            total_us += cumulative
+    return total_us, modules
+
+
+def measure_version_run(module):
+    """
+    Run `python -m module --version` in a fresh interpreter with an empty
+    cache directory. Returns the wall clock time of the run in seconds,
+    and the heavy modules it imported.
+    """
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = dict(os.environ, STREAK_FINDER_CACHE_DIR=cache_dir)
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-m", module, "--version"], env=env,
+                       stdout=subprocess.DEVNULL, check=True)
+        seconds = time.perf_counter() - start
+        out = subprocess.run([sys.executable, "-c", VERSION_RUN%(module, HEAVY_MODULES)], env=env,
+                             stdout=subprocess.PIPE, universal_newlines=True, check=True).stdout
+        if len(os.listdir(cache_dir))>0:
+            print("FAIL: --version wrote to the cache directory: %s"%(", ".join(os.listdir(cache_dir))))
+            sys.exit(1)
+    return seconds, json.loads(out.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    main()
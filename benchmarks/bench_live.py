@@ -0,0 +1,156 @@
+import sys
+import time
+import argparse
+import threading
+import pandas as pd
+
+from fake_blaseball_server import start_server, make_day_games, make_stream_events
+from streak_finder.incremental import StreakState
+from streak_finder.live import LiveTracker, state_game, stream_events, STREAM_PATH
+
+
+"""
+Live streak tracker benchmark and check for streak-finder live.
+
+Seeds the streak state from a few seasons of the fake blaseball API's
+games, then has the fake server replay the next season's streamData feed
+(fake_blaseball_server.py --replay) much faster than real time, and
+follows it with the same code as streak-finder live. It checks that:
+
+- the streaks at the end are the same as building the streak state
+  from scratch from all of the games
+- the alerts are the same as a brute force walk through every game
+
+and reports how long adding one completed game takes, compared to
+rebuilding the streak state from scratch after each game day (what
+polling and recomputing would do).
+
+    python benchmarks/bench_live.py
+    python benchmarks/bench_live.py --seasons 5 --days 99 --speed 0
+"""
+
+
+def season_games(season, days):
+    """All the games of a season from the fake API, for StreakState"""
+    games = []
+    for day in range(days):
+        games += [g for g in (state_game(game) for game in make_day_games(season, day)) if g is not None]
+    return games
+
+
+def brute_force_alerts(seed_games, live_games, alert_at, top):
+    """
+    Walk through every game, keeping every team's streak and the lengths
+    of all finished streaks in plain lists, and list the alerts the live
+    games should raise (as (kind, team, won, length, season, day) tuples,
+    0-indexed, plus the rank for top alerts)
+    """
+    current = {}
+    finished = {True: [], False: []}
+    alerted = set()
+    alerts = []
+    for live, games in ((False, seed_games), (True, live_games)):
+        if live:
+            # Streaks going when the live feed starts alert only if they
+            # are not already among the longest
+            for team, streak in current.items():
+                longest = sorted(finished[streak[0]], reverse=True)
+                if not (top > 0 and len(longest) >= top and streak[2] > longest[top-1]):
+                    alerted.discard(team)
+        for g in games:
+            for team, won in ((g['winningTeamNickname'], True), (g['losingTeamNickname'], False)):
+                streak = current.get(team)
+                if streak is not None and (streak[0] != won or streak[1] != g['season']):
+                    finished[streak[0]].append(streak[2])
+                    alerted.discard(team)
+                    streak = None
+                if streak is None:
+                    streak = [won, g['season'], 0]
+                streak[2] += 1
+                current[team] = streak
+                if live and streak[2] in alert_at:
+                    alerts.append(("streak", team, won, streak[2], g['season'], g['day'], None))
+                longest = sorted(finished[won], reverse=True)
+                is_top = top > 0 and len(longest) >= top and streak[2] > longest[top-1]
+                if is_top and team not in alerted:
+                    alerted.add(team)
+                    if live:
+                        rank = 1 + sum(1 for j in longest if j >= streak[2])
+                        alerts.append(("top", team, won, streak[2], g['season'], g['day'], rank))
+    return alerts
+
+
+def alert_tuple(alert):
+    return (alert["alert"], alert["team"], alert["winning"], alert["length"],
+            alert["season"]-1, alert["day"]-1, alert.get("rank"))
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark and check the live streak tracker against a replayed feed")
+    p.add_argument('--seasons', type=int, default=3, help='Number of seasons to seed the streak state with (default 3)')
+    p.add_argument('--days', type=int, default=99, help='Number of days per season (default 99)')
+    p.add_argument('--updates', type=int, default=3, help='Feed events per day (default 3)')
+    p.add_argument('--speed', type=float, default=1000.0,
+                   help='How many times faster than real time to replay the feed (default 1000, 0 for no waiting)')
+    p.add_argument('--alert-at', type=int, action='append', help='Streak lengths to alert on (default 3, 5, 10)')
+    p.add_argument('--top', type=int, default=10, help='Alert on streaks in the N longest (default 10)')
+    args = p.parse_args()
+    alert_at = args.alert_at or [3, 5, 10]
+
+    seed_games = []
+    for season in range(args.seasons):
+        seed_games += season_games(season, args.days)
+    live_season = args.seasons
+    live_games = season_games(live_season, args.days)
+    events = make_stream_events(live_season, args.days, updates=args.updates)
+
+    tracker = LiveTracker(StreakState.from_games(pd.DataFrame(seed_games)), alert_at, args.top)
+
+    # Follow the replayed feed, as streak-finder live does
+    httpd, url = start_server(replay=events, speed=args.speed)
+    alerts = []
+    update_seconds = 0.0
+    start = time.perf_counter()
+    try:
+        n_events = 0
+        for data in stream_events(url + STREAM_PATH):
+            t = time.perf_counter()
+            alerts += tracker.add_event(data)
+            update_seconds += time.perf_counter() - t
+            n_events += 1
+            if n_events >= len(events):
+                break
+    finally:
+        threading.Thread(target=httpd.shutdown, daemon=True).start()
+    elapsed = time.perf_counter() - start
+
+    # The streaks at the end must match building them from scratch
+    expected = StreakState.from_games(pd.DataFrame(seed_games + live_games))
+    if tracker.state.to_dict() != expected.to_dict():
+        print("FAIL: the live streak state does not match the state built from all games")
+        sys.exit(1)
+
+    # And the alerts must match a brute force walk through the games
+    expected_alerts = brute_force_alerts(seed_games, live_games, set(alert_at), args.top)
+    if [alert_tuple(a) for a in alerts] != expected_alerts:
+        print("FAIL: the live alerts do not match the brute force alerts")
+        sys.exit(1)
+
+    # Time recomputing from scratch after each game day
+    t = time.perf_counter()
+    day_games = [[g for g in live_games if g['day'] == day] for day in range(args.days)]
+    games_so_far = list(seed_games)
+    for games in day_games:
+        games_so_far += games
+        StreakState.from_games(pd.DataFrame(games_so_far))
+    rebuild_seconds = time.perf_counter() - t
+
+    n_games = len(live_games)
+    print("Replayed %d events (%d completed games) in %.2f s, %d alerts: OK"%(len(events), n_games, elapsed, len(alerts)))
+    print("%-28s %12s"%("", "ms/game"))
+    print("%-28s %12.4f"%("live update (per game)", 1000*update_seconds/n_games))
+    print("%-28s %12.4f"%("rebuild after each day", 1000*rebuild_seconds/n_games))
+
+
+if __name__ == "__main__":
+    main()
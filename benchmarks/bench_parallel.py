@@ -0,0 +1,75 @@
+import os
+import sys
+import time
+import argparse
+from synthetic import make_games, team_nickname
+from streak_finder.streak_data import GameData, StreakData
+
+
+"""
+Parallel speedup benchmark for --jobs.
+
+Builds a large synthetic league (see synthetic.py), then runs the same
+all-teams streak query with 1, 2, 4, ... worker processes (up to the
+number of cores, or --max-jobs), checks that every run finds the same
+streaks, and prints the speedup over a single process, along with the
+time of the filter stage (always run in this process) and the aggregate
+stage (whose run finding is split between the workers).
+
+    python benchmarks/bench_parallel.py
+    python benchmarks/bench_parallel.py --teams 400 --seasons 40 --days 200 --max-jobs 16
+"""
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark streak finding with multiple processes on a synthetic league")
+    p.add_argument('--teams', type=int, default=200, help='Number of teams (default 200)')
+    p.add_argument('--seasons', type=int, default=40, help='Number of seasons (default 40)')
+    p.add_argument('--days', type=int, default=150, help='Days per season (default 150)')
+    p.add_argument('--min', type=int, default=2, help='Minimum streak length (default 2)')
+    p.add_argument('--max-jobs', type=int, default=os.cpu_count() or 1, help='Largest number of processes to try (default: number of cores)')
+    p.add_argument('--repeat', type=int, default=3, help='Number of runs for each number of processes (the fastest run is reported)')
+    args = p.parse_args()
+
+    print("Making %d seasons of %d days for %d teams"%(args.seasons, args.days, args.teams))
+    games = GameData(make_games(args.teams, args.seasons, args.days))
+    print("%d games, %d cores"%(games.df.shape[0], os.cpu_count() or 1))
+
+    teams = [team_nickname(i) for i in range(args.teams)]
+    job_counts = [1]
+    while job_counts[-1]*2 <= args.max_jobs:
+        job_counts.append(job_counts[-1]*2)
+    if job_counts[-1] != args.max_jobs:
+        job_counts.append(args.max_jobs)
+
+    print("%-6s %10s %9s %10s %10s %10s"%("Jobs", "Seconds", "Speedup", "Filter", "Aggregate", "Streaks"))
+    baseline = None
+    for jobs in job_counts:
+        # (streak_table=False finds the streaks instead of looking them up)
+        options = argparse.Namespace(team=teams, versus_team=teams, season=['all'],
+                                     winning=True, min=args.min, engine='rle', jobs=jobs,
+                                     streak_table=False)
+        sd = StreakData(options, games=games)
+        # Warm up (starts the worker processes)
+        sd.find_streaks()
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            streaks, _ = sd.find_streaks()
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+                stages = {s.name: s.seconds for s in sd.timings.stages[-2:]}
+
+        key = streaks[['Team Name', 'Streak Length', 'Streak Season', 'Streak Start']].values.tolist()
+        if baseline is None:
+            baseline = (best, key)
+        elif key != baseline[1]:
+            print("FAIL: %d jobs found different streaks than 1 job"%(jobs))
+            sys.exit(1)
+        print("%-6d %10.3f %8.2fx %10.3f %10.3f %10d"%(jobs, best, baseline[0]/best,
+                                                   stages['filter'], stages['aggregate'], streaks.shape[0]))
+
+
+if __name__ == "__main__":
+    main()
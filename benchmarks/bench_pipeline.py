@@ -0,0 +1,234 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+from synthetic import make_games, team_nickname
+from streak_finder.games_cache import drop_ties, compact_frame, write_cache, read_cache
+from streak_finder.streak_data import GameData, StreakData, PositionIndex, PITCHER_GAME_COLUMNS
+from streak_finder.finder import StreakResult
+from streak_finder.view import TextView, MarkdownView
+from streak_finder.util import CaptureStdout
+
+
+"""
+Benchmark suite for the streak finding pipeline, on synthetic game data
+(see synthetic.py) of any size.
+
+Times each stage of a streak query:
+- load: read the games cache file, and build the GameData indexes
+- filter: StreakData.filter_step, for all teams and for a few teams,
+  and with a pitcher filter (plus building the pitcher index)
+- aggregate: StreakData.aggregate_step with each engine, with --top 10,
+  and a lookup in the streak table, plus the head-to-head matrix
+- render: the short and long tables, as text and as Markdown
+
+Each run is appended to a results file (one JSON object per line) along
+with the data size, git commit, and library versions, and compared to the
+last recorded run with the same data size, so slowdowns stand out. The
+results file is local to each machine (it is not checked in): the first
+run with a given data size records the baseline for the runs after it.
+
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --teams 100 --seasons 40 --days 150 --ties 0.01
+    python benchmarks/bench_pipeline.py --no-record --threshold 1.25 --fail-on-regression
+"""
+
+
+RESULTS_JSONL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", "pipeline.jsonl")
+
+# Stages that are slow in proportion to the loop engine's row-by-row work
+# are only run on data sets up to this many games
+LOOP_MAX_GAMES = 50000
+
+
+def time_stage(fn, repeat):
+    """Run fn repeat times, return (best, median) seconds and the last return value"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = fn()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times[0], times[len(times)//2], value
+
+
+def render(view_class, options, result):
+    """Render a view into a string"""
+    with CaptureStdout() as so:
+        view_class(options, result).table()
+    return str(so)
+
+
+def git_commit():
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True
+        )
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark the load, filter, aggregate, and render stages on synthetic data")
+    p.add_argument('--teams', type=int, default=40, help='Number of teams (default 40)')
+    p.add_argument('--seasons', type=int, default=20, help='Number of seasons (default 20)')
+    p.add_argument('--days', type=int, default=120, help='Days per season (default 120)')
+    p.add_argument('--ties', type=float, default=0.005, help='Fraction of tie games (default 0.005)')
+    p.add_argument('--min', type=int, default=3, help='Minimum streak length (default 3)')
+    p.add_argument('--repeat', type=int, default=5, help='Number of runs of each stage (default 5)')
+    p.add_argument('--results', default=RESULTS_JSONL, help='Results file (default benchmarks/results/pipeline.jsonl)')
+    p.add_argument('--no-record', action='store_true', default=False, help='Do not add this run to the results file')
+    p.add_argument('--threshold', type=float, default=1.2,
+                   help='Flag stages that are this many times slower than the last recorded run (default 1.2)')
+    p.add_argument('--fail-on-regression', action='store_true', default=False,
+                   help='Exit with an error if any stage is flagged as slower')
+    args = p.parse_args()
+
+    import numpy as np
+    import pandas as pd
+
+    print("Making %d seasons of %d days for %d teams (%.1f%% ties)"%(args.seasons, args.days, args.teams, 100*args.ties))
+    raw = make_games(args.teams, args.seasons, args.days, ties=args.ties)
+    df = drop_ties(raw).reset_index(drop=True)
+    print("%d games (%d after dropping ties)"%(raw.shape[0], df.shape[0]))
+
+    timings = {}
+    def run(name, fn):
+        best, median, value = time_stage(fn, args.repeat)
+        timings[name] = {"best": best, "median": median}
+        return value
+
+    # Load
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_file = os.path.join(tmp, "games_data.npz")
+        write_cache(cache_file, "benchmark", df)
+        run("load/cache_all_columns", lambda: read_cache(cache_file, "benchmark"))
+        cached = run("load/cache_streak_columns",
+                     lambda: read_cache(cache_file, "benchmark", ['season', 'day', 'winningTeamNickname', 'losingTeamNickname',
+                                                                 'awayTeamNickname', 'awayScore', 'homeScore', 'homeTeamNickname']))
+    games = run("load/game_data", lambda: GameData(cached))
+
+    # Filter
+    teams = [team_nickname(i) for i in range(args.teams)]
+    few = teams[:3]
+    def make_sd(our, their, engine='rle', winning=True, top=0, our_pitcher=None, data=games):
+        options = argparse.Namespace(team=our, versus_team=their, season=['all'], winning=winning,
+                                     min=args.min, top=top, our_pitcher=our_pitcher, engine=engine, jobs=1,
+                                     streak_table=False)
+        return StreakData(options, games=data)
+    sd_all = make_sd(teams, teams)
+    sd_few = make_sd(few, teams[len(teams)//2:])
+    all_data = run("filter/all_teams", lambda: sd_all.filter_step(sd_all.our_teams, sd_all.their_teams))
+    few_data = run("filter/few_teams", lambda: sd_few.filter_step(sd_few.our_teams, sd_few.their_teams))
+    games_full = GameData(compact_frame(df))
+    run("filter/pitcher_index_build",
+        lambda: {col: PositionIndex(games_full.df[col]) for col in PITCHER_GAME_COLUMNS})
+    pitchers = list(pd.unique(games_full.df['winningPitcherName']))[:10]
+    sd_pitchers = make_sd(teams, teams, our_pitcher=pitchers, data=games_full)
+    run("filter/our_pitchers", lambda: sd_pitchers.filter_step(sd_pitchers.our_teams, sd_pitchers.their_teams))
+
+    # Aggregate
+    streaks = run("aggregate/rle_all_teams", lambda: sd_all.aggregate_step(all_data))
+    run("aggregate/rle_few_teams", lambda: sd_few.aggregate_step(few_data))
+    sd_top = make_sd(teams, teams, top=10)
+    run("aggregate/rle_top10_all_teams", lambda: sd_top.aggregate_step(all_data))
+    if games.df.shape[0] <= LOOP_MAX_GAMES:
+        sd_loop = make_sd(few, teams[len(teams)//2:], engine='loop')
+        run("aggregate/loop_few_teams", lambda: sd_loop.aggregate_step(few_data))
+    run("aggregate/head_to_head_all_teams", lambda: sd_all.head_to_head_step(sd_all.our_teams, sd_all.their_teams))
+    run("aggregate/streak_table_build", lambda: games.streak_table.build(games))
+    run("aggregate/streak_table_lookup",
+        lambda: sd_all.sort_streaks(games.streak_table.streaks(games, teams, sd_all.seasons, True, args.min)))
+
+    # Render
+    result = StreakResult(streaks, games, sd_all.our_teams, sd_all.their_teams, ['all'], True, args.min)
+    for length in ['short', 'long']:
+        options = argparse.Namespace(short=(length=='short'), long=(length=='long'),
+                                     nickname=True, fullname=False, output='')
+        run("render/%s_text"%(length), lambda: render(TextView, options, result))
+        run("render/%s_markdown"%(length), lambda: render(MarkdownView, options, result))
+
+    width = stage_width(timings)
+    print("%-*s %10s %10s"%(width, "Stage", "Best (s)", "Median (s)"))
+    for name, timing in timings.items():
+        print("%-*s %10.4f %10.4f"%(width, name, timing["best"], timing["median"]))
+
+    record = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "params": {
+            "teams": args.teams,
+            "seasons": args.seasons,
+            "days": args.days,
+            "ties": args.ties,
+            "min": args.min
+        },
+        "games": int(games.df.shape[0]),
+        "streaks": int(streaks.shape[0]),
+        "timings": timings
+    }
+
+    regressions = compare(record, args.results, args.threshold)
+
+    if not args.no_record:
+        results_dir = os.path.dirname(os.path.abspath(args.results))
+        if not os.path.exists(results_dir):
+            os.makedirs(results_dir)
+        with open(args.results, 'a') as f:
+            f.write(json.dumps(record) + "\n")
+        print("Recorded results in %s"%(args.results))
+
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+def stage_width(timings):
+    """Width of the stage name column: the longest stage name"""
+    return max([len("Stage")] + [len(name) for name in timings])
+
+
+def compare(record, results_file, threshold):
+    """
+    Compare a run to the last recorded run with the same parameters.
+    Prints the change for each stage and returns the list of stages
+    that are more than threshold times slower (by best time).
+    """
+    last = None
+    if os.path.exists(results_file):
+        with open(results_file, 'r') as f:
+            for line in f:
+                previous = json.loads(line)
+                if previous["params"] == record["params"]:
+                    last = previous
+    if last is None:
+        print("No earlier run with these parameters to compare to")
+        return []
+
+    print("\nCompared to %s (commit %s):"%(last["time"], last["commit"]))
+    width = stage_width(record["timings"])
+    regressions = []
+    for name, timing in record["timings"].items():
+        if name not in last["timings"]:
+            continue
+        ratio = timing["best"] / max(last["timings"][name]["best"], 1e-9)
+        flag = ""
+        if ratio > threshold:
+            flag = "  <-- slower"
+            regressions.append(name)
+        print("%-*s %9.2fx%s"%(width, name, ratio, flag))
+    return regressions
+
+
+if __name__ == "__main__":
+    main()
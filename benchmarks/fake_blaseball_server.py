@@ -0,0 +1,231 @@
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+
+"""
+A local fake of the blaseball.com API endpoints used by
+scripts/fetch_games_data.py, for offline benchmarks and checks:
+
+- /database/games?season=S&day=D returns a deterministic list of games
+  for that day (same fields as the real API), after a configurable delay,
+  and can fail every Nth request with a 503 to exercise retries.
+- /events/streamData sends one server-sent event with the current
+  season and day, or, in replay mode, plays back a recording of the
+  feed (as written by streak-finder live --record, or made by
+  make_stream_events) as a stream of events, sped up by a factor.
+
+Run it on its own:
+
+    python benchmarks/fake_blaseball_server.py --port 8081 --latency 0.05
+    python scripts/fetch_games_data.py --api-url http://127.0.0.1:8081
+
+    python benchmarks/fake_blaseball_server.py --port 8081 --replay events.jsonl --speed 60
+    streak-finder live --api-url http://127.0.0.1:8081
+
+or start it from another script with start_server().
+"""
+
+
+TEAMS = [
+    ("Lovers", "San Francisco Lovers"), ("Jazz Hands", "Breckenridge Jazz Hands"),
+    ("Tacos", "Unlimited Tacos"), ("Breath Mints", "Kansas City Breath Mints"),
+    ("Moist Talkers", "Canada Moist Talkers"), ("Garages", "Seattle Garages"),
+    ("Sunbeams", "Hellmouth Sunbeams"), ("Dale", "Miami Dale"),
+    ("Fridays", "Hawaii Fridays"), ("Pies", "Philly Pies"),
+    ("Magic", "Yellowstone Magic"), ("Millennials", "New York Millennials"),
+    ("Crabs", "Baltimore Crabs"), ("Steaks", "Dallas Steaks"),
+    ("Wild Wings", "Mexico City Wild Wings"), ("Tigers", "Hades Tigers"),
+    ("Spies", "Houston Spies"), ("Firefighters", "Chicago Firefighters"),
+    ("Shoe Thieves", "Charleston Shoe Thieves"), ("Flowers", "Boston Flowers")
+]
+
+
+def make_day_games(season, day):
+    """Make the (deterministic) list of games for a season and day, in the API format"""
+    rng = random.Random(season*1000 + day)
+    teams = list(TEAMS)
+    rng.shuffle(teams)
+    games = []
+    for i in range(0, len(teams), 2):
+        (home, home_name), (away, away_name) = teams[i], teams[i+1]
+        games.append({
+            "id": "fake-%d-%d-%d"%(season, day, i//2),
+            "season": season,
+            "day": day,
+            "homeTeamNickname": home,
+            "homeTeamName": home_name,
+            "homeTeamEmoji": "0x1F3%02d"%(TEAMS.index((home, home_name))),
+            "homePitcherName": "%s Pitcher %d"%(home, rng.randint(1, 5)),
+            "homeScore": rng.randint(0, 10),
+            "homeOdds": round(rng.random(), 3),
+            "awayTeamNickname": away,
+            "awayTeamName": away_name,
+            "awayTeamEmoji": "0x1F3%02d"%(TEAMS.index((away, away_name))),
+            "awayPitcherName": "%s Pitcher %d"%(away, rng.randint(1, 5)),
+            "awayScore": rng.randint(0, 10),
+            "awayOdds": round(rng.random(), 3),
+            "isPostseason": False,
+            "shame": False
+        })
+    return games
+
+
+def make_stream_events(season, days, first_day=0, updates=3, interval=5.0):
+    """
+    Make a recording of the streamData feed for days first_day, first_day+1, ...
+    of a season, in the format streak-finder live --record writes (a list of
+    {"time": seconds, "data": event}). Each day has updates events, interval
+    seconds apart: the day's games in progress, then all complete in the last one.
+    """
+    events = []
+    t = 0.0
+    for day in range(first_day, first_day+days):
+        final = make_day_games(season, day)
+        for i in range(1, updates+1):
+            schedule = []
+            for game in final:
+                game = dict(game)
+                game['gameComplete'] = (i == updates)
+                if not game['gameComplete']:
+                    game['homeScore'] = game['homeScore']*i//updates
+                    game['awayScore'] = game['awayScore']*i//updates
+                schedule.append(game)
+            sim = {"season": season, "day": day}
+            events.append({"time": t, "data": {"value": {"games": {"sim": sim, "schedule": schedule}}}})
+            t += interval
+    return events
+
+
+def load_recording(filename):
+    """Load a recording of the feed (one JSON object per line)"""
+    with open(filename, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class FakeBlaseballServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Room for many concurrent clients (the default backlog is 5)
+    request_queue_size = 128
+
+
+class FakeBlaseballHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        fake = self.server.fake
+        if url.path == '/database/games':
+            with fake['lock']:
+                fake['requests'] += 1
+                n = fake['requests']
+            if fake['latency'] > 0:
+                time.sleep(fake['latency'])
+            if fake['fail_every'] > 0 and n % fake['fail_every'] == 0:
+                self.send_body(503, b'{"error": "try again"}', 'application/json')
+                return
+            games = make_day_games(int(params['season'][0]), int(params['day'][0]))
+            self.send_body(200, json.dumps(games).encode('utf-8'), 'application/json')
+        elif url.path == '/events/streamData' and fake['replay']:
+            self.send_stream(fake['replay'], fake['speed'])
+        elif url.path == '/events/streamData':
+            sim = {"season": fake['season'], "day": fake['day']}
+            event = "data: %s\n\n"%(json.dumps({"value": {"games": {"sim": sim}}}))
+            self.send_body(200, event.encode('utf-8'), 'text/event-stream')
+        else:
+            self.send_body(404, b'{"error": "not found"}', 'application/json')
+
+    def send_body(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_stream(self, events, speed):
+        """
+        Send recorded events as a server-sent event stream, waiting between
+        them as long as the recording did, divided by speed (0 for no waiting).
+        The connection is closed after the last event.
+        """
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        last = None
+        try:
+            for event in events:
+                if last is not None and speed > 0:
+                    time.sleep(max(event['time'] - last, 0)/speed)
+                last = event['time']
+                self.wfile.write(("data: %s\n\n"%(json.dumps(event['data']))).encode('utf-8'))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped listening
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(host='127.0.0.1', port=0, latency=0.0, fail_every=0, season=0, day=0, replay=None, speed=1.0):
+    """
+    Start the fake server in a background thread.
+    Returns (httpd, base_url); call httpd.shutdown() to stop it.
+    httpd.fake['requests'] counts the /database/games requests.
+    If replay (a recording, see make_stream_events) is given,
+    /events/streamData plays it back, speed times faster.
+    """
+    httpd = FakeBlaseballServer((host, port), FakeBlaseballHandler)
+    httpd.fake = {
+        'latency': latency,
+        'fail_every': fail_every,
+        'season': season,
+        'day': day,
+        'replay': replay,
+        'speed': speed,
+        'requests': 0,
+        'lock': threading.Lock()
+    }
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    return httpd, "http://%s:%d"%(host, httpd.server_address[1])
+
+
+def main():
+    p = argparse.ArgumentParser(description="Fake blaseball.com API server for offline benchmarks")
+    p.add_argument('--host', default='127.0.0.1')
+    p.add_argument('--port', type=int, default=8081)
+    p.add_argument('--latency', type=float, default=0.05, help='Seconds to wait before answering each games request')
+    p.add_argument('--fail-every', type=int, default=0, help='Answer every Nth games request with a 503 (0 to never fail)')
+    p.add_argument('--season', type=int, default=1, help='Current season (0-indexed) for /events/streamData')
+    p.add_argument('--day', type=int, default=10, help='Current day (0-indexed) for /events/streamData')
+    p.add_argument('--replay', default='',
+                   help='Play back this recording of the feed (from streak-finder live --record) on /events/streamData')
+    p.add_argument('--replay-days', type=int, default=0,
+                   help='Play back a made up feed of this many days of --season, starting at --day')
+    p.add_argument('--speed', type=float, default=60.0, help='How many times faster than recorded to play back (default 60)')
+    args = p.parse_args()
+
+    replay = None
+    if args.replay:
+        replay = load_recording(args.replay)
+    elif args.replay_days > 0:
+        replay = make_stream_events(args.season, args.replay_days, args.day)
+    httpd, url = start_server(args.host, args.port, args.latency, args.fail_every, args.season, args.day,
+                              replay, args.speed)
+    print("Fake blaseball API on %s"%(url), file=sys.stderr)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        httpd.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+
+
+"""
+Synthetic game data for benchmarks: a league of any size, with the same
+columns as the real game data set (see games_cache.load_games), so it can
+be passed straight to GameData:
+
+    from synthetic import make_games
+    from streak_finder.streak_data import GameData
+
+    games = GameData(make_games(teams=200, seasons=50, days=150))
+
+Every team plays one game a day (teams are paired at random each day),
+a fraction of the games (ties) are tie games, and the output is the
+same for the same seed. Like the game data JSON, the frame includes the
+tie games; drop them (games_cache.drop_ties) before finding streaks.
+"""
+
+
+def team_nickname(i):
+    return "Team%04d"%(i)
+
+
+def make_games(teams=20, seasons=20, days=100, ties=0.0, seed=0):
+    """
+    Make a data frame of games for a league of teams (an even number)
+    playing every day of every season. ties is the fraction of tie games.
+    """
+    if teams % 2 != 0:
+        raise Exception("Error: the number of teams must be even")
+    rng = np.random.default_rng(seed)
+    n_days = seasons*days
+    n = n_days*(teams//2)
+
+    # Random pairing of the teams for each day: a random permutation per day,
+    # with consecutive teams in the permutation playing each other
+    pairs = rng.random((n_days, teams)).argsort(axis=1).reshape(n_days, teams//2, 2)
+    home = pairs[:, :, 0].ravel()
+    away = pairs[:, :, 1].ravel()
+    season = np.repeat(np.arange(n_days)//days, teams//2)
+    day = np.repeat(np.arange(n_days)%days, teams//2)
+
+    home_score = rng.integers(0, 12, n)
+    away_score = rng.integers(0, 12, n)
+    # Only the requested fraction of ties
+    away_score[away_score==home_score] += 1
+    tie = rng.random(n) < ties
+    away_score[tie] = home_score[tie]
+    home_won = home_score > away_score
+    # Like the game data, both the winner and the loser of a tie are the away team
+    home_lost = home_score < away_score
+
+    nicknames = np.array([team_nickname(i) for i in range(teams)], dtype=object)
+    names = np.array(["Synthetic %s"%(team_nickname(i)) for i in range(teams)], dtype=object)
+    emoji = np.array(["0x1F%03X"%(i) for i in range(teams)], dtype=object)
+    home_odds = rng.random(n).round(3)
+    away_odds = (1 - home_odds).round(3)
+    pitcher = rng.integers(0, 5, (2, n))
+    home_pitcher = np.char.add(nicknames[home].astype(str), np.char.add(" Pitcher ", pitcher[0].astype(str)))
+    away_pitcher = np.char.add(nicknames[away].astype(str), np.char.add(" Pitcher ", pitcher[1].astype(str)))
+
+    winner = np.where(home_won, home, away)
+    loser = np.where(home_lost, home, away)
+    df = pd.DataFrame({
+        "id": ["synthetic-%d"%(i) for i in range(n)],
+        "season": season,
+        "day": day,
+        "awayOdds": away_odds,
+        "awayPitcherName": away_pitcher,
+        "awayScore": away_score,
+        "awayTeamEmoji": emoji[away],
+        "awayTeamName": names[away],
+        "awayTeamNickname": nicknames[away],
+        "homeOdds": home_odds,
+        "homePitcherName": home_pitcher,
+        "homeScore": home_score,
+        "homeTeamEmoji": emoji[home],
+        "homeTeamName": names[home],
+        "homeTeamNickname": nicknames[home],
+        "isPostseason": False,
+        "shame": False,
+        "winningTeamName": names[winner],
+        "losingTeamName": names[loser],
+        "winningTeamNickname": nicknames[winner],
+        "losingTeamNickname": nicknames[loser],
+        "winningTeamEmoji": emoji[winner],
+        "losingTeamEmoji": emoji[loser],
+        "winningScore": np.maximum(home_score, away_score),
+        "losingScore": np.minimum(home_score, away_score),
+        "winningOdds": np.where(home_won, home_odds, away_odds),
+        "losingOdds": np.where(home_lost, home_odds, away_odds),
+        "winningPitcherName": np.where(home_won, home_pitcher, away_pitcher),
+        "losingPitcherName": np.where(home_lost, home_pitcher, away_pitcher),
+        "runDiff": np.abs(home_score - away_score),
+        "whoWon": np.where(home_won, "home", "away")
+    })
+    return df
@@ -0,0 +1,105 @@
+import os
+import sys
+import argparse
+import tempfile
+import pandas as pd
+from streak_finder.finder import StreakFinder
+from streak_finder.streak_data import GameData, StreakData, NoStreaksException
+from streak_finder.incremental import StreakState
+
+
+"""
+Consistency check for incremental streak maintenance.
+
+Replays the game data set one game day at a time into a StreakState
+(the way fetch_games_data.py adds new days), and checks that the streaks
+it reports match a full recompute with StreakData (finding the streaks
+again, not looking them up in the streak table), for winning and
+losing streaks and several --min values. The check runs at the end of
+every season and after the last day, and once more after saving
+and reloading the state.
+
+    python scripts/check_incremental_streaks.py
+"""
+
+
+CHECK_COLUMNS = ["Team Name", "Streak Length", "Streak Season", "Streak Start", "Streak Days"]
+
+
+def main():
+    p = argparse.ArgumentParser(description="Check incremental streaks against a full recompute")
+    p.add_argument('--min',
+                   type=int,
+                   action='append',
+                   help='Streak minimums to check (use flag multiple times, defaults to 1, 3, and 8)')
+    args = p.parse_args()
+    mins = args.min or [1, 3, 8]
+
+    finder = StreakFinder()
+    df = finder.games.df.sort_values(['season', 'day'], kind='mergesort')
+    teams = finder.team_index.teams
+
+    state = StreakState()
+    days = list(df.groupby(['season', 'day'], sort=True))
+    n_checks = 0
+    for i, ((season, day), day_df) in enumerate(days):
+        state.add_games(day_df)
+
+        last_day = (i+1 == len(days))
+        if last_day or days[i+1][0][0] != season:
+            # Compare against a full recompute over the seasons added so far
+            seasons = [s+1 for s in finder.games.seasons if s <= season]
+            sub = df.loc[df['season'] <= season]
+            sub = sub.loc[(sub['season'] < season) | (sub['day'] <= day)]
+            sub_games = GameData(sub)
+            for winning in [True, False]:
+                for m in mins:
+                    expected = recompute_streaks(sub_games, teams, seasons, winning, m)
+                    got = state.streaks(winning=winning, min=m, teams=teams)
+                    if not same_streaks(expected, got):
+                        print("FAIL: season %d day %d, winning=%s, min=%d: %d streaks expected, %d found"%(
+                            season+1, day+1, winning, m, expected.shape[0], got.shape[0]
+                        ))
+                        sys.exit(1)
+                    n_checks += 1
+
+    # The saved state should give the same streaks as the state in memory
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "streak_state.json")
+        state.save(filename)
+        loaded = StreakState.load(filename)
+    for winning in [True, False]:
+        if not same_streaks(state.streaks(winning=winning, min=1, teams=teams), loaded.streaks(winning=winning, min=1, teams=teams)):
+            print("FAIL: saved and reloaded streak state does not match")
+            sys.exit(1)
+
+    print("OK: incremental streaks match a full recompute (%d days, %d checks)"%(len(days), n_checks))
+
+
+def recompute_streaks(games, teams, seasons, winning, min):
+    """Find the streaks in games from scratch (without the streak table)"""
+    options = argparse.Namespace(team=teams, versus_team=teams, season=[str(s) for s in seasons],
+                                 winning=winning, min=min, engine='rle', jobs=1, streak_table=False)
+    try:
+        streaks, _ = StreakData(options, games=games).find_streaks()
+    except NoStreaksException:
+        streaks = pd.DataFrame(columns=CHECK_COLUMNS)
+    return streaks
+
+
+def same_streaks(expected, got):
+    """Compare two streak data frames on the streak columns"""
+    if expected.shape[0] != got.shape[0]:
+        return False
+    if expected.shape[0] == 0:
+        return True
+    for col in CHECK_COLUMNS:
+        a = [list(map(int, j)) if col == "Streak Days" else j for j in expected[col].tolist()]
+        b = [list(map(int, j)) if col == "Streak Days" else j for j in got[col].tolist()]
+        if a != b:
+            return False
+    return True
+
+
+if __name__ == "__main__":
+    main()
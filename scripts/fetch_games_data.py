@@ -2,48 +2,151 @@ import re
 import os
 import requests
 import json
+import argparse
 import sseclient
+from collections import deque
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import pandas as pd
+from streak_finder.incremental import StreakState, apply_games
+from streak_finder.game_store import GameStore
 
 
 root_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-data_path = os.path.abspath(os.path.join(root_path, 'cli', 'data'))
+data_path = os.path.abspath(os.path.join(root_path, 'streak_finder', 'data'))
 
+# Consolidated game data (written by compacting the store)
 GAMES_DATA_JSON = os.path.join(data_path, "games_data_trim.json")
-UPDATE_DATA_JSON = os.path.join(data_path, "update_data.json")
+# Append-only game store (one chunk per fetched day)
+GAMES_STORE_PATH = os.path.join(data_path, "store")
+STREAK_STATE_JSON = os.path.join(data_path, "streak_state.json")
+
+API_URL = "https://www.blaseball.com"
+# Season length to assume before any full season has been seen
+DEFAULT_SEASON_DAYS = 115
 
 
 def main():
+    p = argparse.ArgumentParser(description="Fetch missing game days from the blaseball.com API")
+    p.add_argument('--workers',
+                   type=int,
+                   default=8,
+                   help='Number of days to fetch at the same time (default 8)')
+    p.add_argument('--retries',
+                   type=int,
+                   default=5,
+                   help='Number of times to retry a failed request (default 5)')
+    p.add_argument('--api-url',
+                   default=API_URL,
+                   help='Base URL of the API (default %s)'%(API_URL))
+    p.add_argument('--save-state-every',
+                   type=int,
+                   default=50,
+                   help='Save the streak state after this many fetched days, as well as at the end (default 50)')
+    args = p.parse_args()
+
     print("Loading data")
-    gameData, updateData = load_game_data()
+    store = load_game_store()
+
+    # Start the streak state from the games we already have
+    state = load_streak_state(store)
 
-    lastDate = updateData["lastDate"]
+    lastDate = store.last_date() or (0, 0)
     print(f"Last date found was season {lastDate[0] + 1}, day {lastDate[1] + 1}")
 
-    currDate = get_game_day()
+    currDate = get_game_day(args.api_url)
     print(f"Current date is season {currDate[0] + 1}, day {currDate[1] + 1}")
 
-    missingDays = find_missing_days(lastDate, currDate)
+    missingDays = find_missing_days(store, currDate)
 
     print(f"It appears we're missing {len(missingDays)} days.")
 
     if(len(missingDays) > 0):
         print("Attempting to fetch intermediate games.")
-        for date in missingDays:
-            print(f"Fetching season {date[0] + 1}, day {date[1] + 1}")
-            if(date in updateData["gameDates"]):
-                # If we already have this date, drop it and re-download it
+        session = make_session(args.workers, args.retries)
+        rebuildState = False
+        unsavedDays = 0
+        # Days are fetched in parallel, but saved in order
+        for date, result in fetch_days(session, missingDays, args.workers, args.api_url):
+            print(f"Fetched season {date[0] + 1}, day {date[1] + 1}")
+            replaced = date in store
+            if(replaced):
+                # If we already have this date, re-download it
+                # (the store replaces the old games for that day)
                 print("Odd... we already have that day? Replacing it for safety.")
-                gameData = [game for game in gameData if (game["season"] != date[0] or game["day"] != date[1])]
-            # Get the game data and postprocess it
-            result = requests.get(f'https://www.blaseball.com/database/games?day={date[1]}&season={date[0]}')
-            result = result.json()
+                rebuildState = True
             post_result = postprocess_game_data(result)
-            for game in post_result:
-                gameData.append(game)
-            updateData["lastDate"] = date
-            updateData["gameDates"].append(date)
-            # Save to file each time (slower but safer)
-            save_game_data(gameData, updateData)
+            # Save each day as one append to the store (nothing already saved is rewritten)
+            store.append_day(date[0], date[1], post_result)
+            if(not rebuildState):
+                # Extend/close the streaks of the teams that played this day
+                # (in memory; the state file is only written every few days)
+                apply_games(state, post_result)
+                unsavedDays += 1
+                if(unsavedDays >= args.save_state_every):
+                    state.save(STREAK_STATE_JSON)
+                    unsavedDays = 0
+
+        if(rebuildState):
+            # The streak state already had a replaced day's games,
+            # so rebuild it once, after all the days are saved
+            print("Rebuilding streak state")
+            StreakState.from_games(pd.DataFrame(store.games())).save(STREAK_STATE_JSON)
+        else:
+            state.save(STREAK_STATE_JSON)
+
+        # Write the consolidated game data files
+        print("Compacting game data")
+        store.compact(GAMES_DATA_JSON)
+
+
+def make_session(workers, retries, backoff=0.5):
+    """
+    Make a requests session that keeps a pool of connections open
+    (one per worker) and retries failed requests with exponential backoff
+    (backoff, 2*backoff, 4*backoff, ... seconds).
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"]
+    )
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def fetch_day(session, date, api_url=API_URL):
+    """Fetch the games for one (season, day) from the API"""
+    result = session.get(f'{api_url}/database/games', params={"day": date[1], "season": date[0]}, timeout=30)
+    result.raise_for_status()
+    return result.json()
+
+
+def fetch_days(session, dates, workers, api_url=API_URL):
+    """
+    Fetch the games for a list of (season, day) dates using a pool of workers.
+    This is a generator that yields (date, games) in the same order as dates,
+    as soon as each date and all dates before it have been fetched.
+    At most 2*workers days are fetched ahead of the last day yielded.
+    """
+    dates = iter(dates)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for date in islice(dates, 2*workers):
+            pending.append((date, pool.submit(fetch_day, session, date, api_url)))
+        while len(pending) > 0:
+            date, future = pending.popleft()
+            # Keep the window full before waiting on the oldest day
+            next_date = next(dates, None)
+            if next_date is not None:
+                pending.append((next_date, pool.submit(fetch_day, session, next_date, api_url)))
+            yield date, future.result()
 
 
 def postprocess_game_data(gameData):
@@ -102,62 +205,75 @@ def postprocess_game_data(gameData):
     return trimGameData
 
 
-def get_game_day():
-    client = sseclient.SSEClient("https://www.blaseball.com/events/streamData")
+def get_game_day(api_url=API_URL):
+    client = sseclient.SSEClient(f"{api_url}/events/streamData")
     singleEvent = next(client) #.events())
     sim = json.loads(singleEvent.data)["value"]["games"]["sim"]
     print("season %s\nday %s"%(sim["season"], sim["day"]))
     return (sim["season"], sim["day"])
 
 
-def load_game_data():
-    gameDates = []
-    try:
+def load_game_store():
+    """
+    Open the append-only game store. If the store is empty but there is
+    a consolidated game data file, the games in it are imported first.
+    """
+    store = GameStore(GAMES_STORE_PATH)
+    if len(store) == 0 and os.path.exists(GAMES_DATA_JSON):
+        print("Importing existing game data into the game store")
         with open(GAMES_DATA_JSON, "r") as f:
-            gameData = []
-            arr = json.load(f)
-            for game in arr:
-                gameData.append(game)
-                gameDates.append((game['season'], game['day']))
-    except FileNotFoundError:
-        gameData = []
-
+            gameData = json.load(f)
+        byDate = {}
+        for game in gameData:
+            byDate.setdefault((game['season'], game['day']), []).append(game)
+        store.append_days(sorted(byDate.items()))
+    return store
+
+
+def load_streak_state(store):
+    """
+    Load the saved streak state. It is rebuilt from the store's games if
+    there is no saved state, or if it does not end on the store's last
+    game day (e.g., a run stopped before saving the state).
+    """
     try:
-        with open(UPDATE_DATA_JSON, "r") as f:
-            updateData = json.loads(f.read())
+        state = StreakState.load(STREAK_STATE_JSON)
     except FileNotFoundError:
-        updateData = {"lastDate": (0, 0)}
-
-    updateData["gameDates"] = gameDates
-    return (gameData, updateData)
-
-
-def save_game_data(gameData, updateData):
-    with open(GAMES_DATA_JSON, "w") as f:
-        json.dump(gameData, f)
-        # This makes the json data readable:
-        #json.dump(gameData, f, indent=4, sort_keys=True)
-
-    with open(UPDATE_DATA_JSON, "w") as f:
-        json.dump(updateData, f, sort_keys=True)
-
+        state = None
+    if state is None or state.last != store.last_game_date():
+        state = StreakState()
+        if store.last_game_date() is not None:
+            print("Building streak state")
+            state = StreakState.from_games(pd.DataFrame(store.games()))
+            state.save(STREAK_STATE_JSON)
+    return state
+
+
+def find_missing_days(store, currDate):
+    """
+    Find the days before currDate that are not in the store, in order.
+
+    The length of each past season is the number of days it had games
+    in the store. Seasons that are not in the store yet, and the last
+    season in the store (which may have been cut short), are assumed
+    to be as long as the longest season seen so far. Days fetched past
+    the end of a season come back with no games, and are kept in the
+    store so they are not fetched again.
+    """
+    lastDate = store.last_date()
+    pastLengths = [length for season, length in store.season_lengths.items() if season < currDate[0]]
+    typicalLength = max(pastLengths) if len(pastLengths) > 0 else DEFAULT_SEASON_DAYS
 
-def find_missing_days(lastDate, currDate):
-    # Find out which day's we're missing
     missingDays = []
-    if(lastDate[0] < currDate[0]):
-        for season in range(lastDate[0], currDate[0]):
-            if(season == lastDate[0]):
-                lastDay = lastDate[1]
-            else:
-                lastDay = 0
-            for day in range(lastDay, 115):
-                missingDays.append((season, day))
-        lastDay = -1
-    if(lastDate[0] == currDate[0]):
-        lastDay = lastDate[1]
-    for day in range(lastDay + 1, currDate[1]):
-        missingDays.append((currDate[0], day))
+    for season in range(0, currDate[0] + 1):
+        if(season == currDate[0]):
+            seasonLength = currDate[1]
+        elif(season in store.season_lengths and (lastDate is None or season < lastDate[0])):
+            seasonLength = store.season_lengths[season]
+        else:
+            seasonLength = max(store.season_lengths.get(season, 0), typicalLength)
+        # Only scans the season's days if some are missing
+        missingDays += [(season, day) for day in store.missing_days(season, seasonLength)]
     return missingDays
 
 
@@ -0,0 +1,347 @@
+import os
+import io
+import sys
+import json
+import uuid
+import argparse
+import numpy as np
+import pandas as pd
+
+
+"""
+The ArrayStore class reads game data from an array store: a directory
+with one file of fixed-width binary values per game data column, opened
+as memory-mapped NumPy arrays instead of being loaded into memory.
+
+This is for game data sets that are too big to load with the games cache
+(see games_cache.py), like simulated league histories with hundreds of
+seasons: the operating system only reads the pages of each column that a
+query touches, and processes reading the same store share those pages.
+
+    arrays.json                 the store's metadata (see below)
+    season.bin, day.bin, ...    one file per column
+
+Games are stored sorted by season and day, so the games of a season are a
+contiguous range of rows (the ranges are in the metadata), and a query on a
+few seasons only reads those rows. Text columns (team names, pitcher names,
+etc.) are stored as integer codes, with the text values in the metadata.
+All of the team nickname columns share one list of values, so the winning
+and losing team codes can be used to find streaks as they are.
+
+Stores are written with ArrayStoreWriter, which takes the games in chunks
+(so a store can be bigger than memory), or write_array_store for a whole
+data frame. Build a store from the game data set (or a game data JSON file)
+with:
+
+    python -m streak_finder.array_store path/to/store [--json games.json]
+
+and query it with streak-finder --store path/to/store.
+"""
+
+
+STORE_JSON = "arrays.json"
+ARRAY_FILE = "%s.bin"
+# Version of the store layout
+STORE_FORMAT = 1
+
+# Columns stored when building a store from the game data set: the ones
+# needed to find streaks, plus the ones the reports and filters use
+STORE_GAME_COLUMNS = [
+    'season', 'day', 'winningTeamNickname', 'losingTeamNickname',
+    'homeTeamNickname', 'awayTeamNickname', 'homeTeamName', 'awayTeamName',
+    'homeScore', 'awayScore', 'isPostseason', 'winningPitcherName', 'losingPitcherName'
+]
+
+# Columns that share one list of values (and so one set of codes)
+TEAM_COLUMNS = ['winningTeamNickname', 'losingTeamNickname', 'homeTeamNickname', 'awayTeamNickname']
+TEAMS = "teams"
+
+# Integer columns that always fit a smaller type than the default (int32)
+STORE_DTYPES = {'season': 'int16', 'day': 'int16'}
+
+# Rows per chunk when rewriting the text columns
+COPY_ROWS = 1 << 20
+
+
+class ArrayStoreError(Exception):
+    pass
+
+
+def code_dtype(n_values):
+    """The type pandas uses for the codes of a categorical with n_values values"""
+    for dtype in [np.int8, np.int16, np.int32]:
+        if n_values < np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+class ArrayStore(object):
+    """
+    An array store (see above), opened for reading.
+    Columns are memory-mapped the first time they are used.
+    """
+    def __init__(self, path):
+        self.path = path
+        meta_file = os.path.join(path, STORE_JSON)
+        if not os.path.exists(meta_file):
+            raise ArrayStoreError("Error: %s is not an array store (there is no %s)"%(path, STORE_JSON))
+        with open(meta_file, 'r') as f:
+            meta = json.load(f)
+        if meta.get("format") != STORE_FORMAT:
+            raise ArrayStoreError("Error: the array store %s has an unsupported format, rebuild it"%(path))
+        self.fingerprint = meta["fingerprint"]
+        self.rows = meta["rows"]
+        # column -> NumPy type name, and column -> name of its list of values (text columns)
+        self.dtypes = meta["dtypes"]
+        self.value_lists = meta["value_lists"]
+        self.values = meta["values"]
+        # season -> (first row, last row + 1)
+        self.season_bounds = {int(season): tuple(bounds) for season, bounds in meta["seasons"].items()}
+        self._arrays = {}
+
+    def __len__(self):
+        return self.rows
+
+    @property
+    def columns(self):
+        return list(self.dtypes.keys())
+
+    @property
+    def seasons(self):
+        """All (0-indexed) seasons in the store, in order"""
+        return sorted(self.season_bounds)
+
+    @property
+    def team_names(self):
+        """The team nicknames, in the order of their codes"""
+        return list(self.values.get(TEAMS, []))
+
+    def array(self, column):
+        """Get a column as a read-only memory-mapped array (codes, for text columns)"""
+        if column not in self._arrays:
+            if column not in self.dtypes:
+                raise ArrayStoreError("Error: the array store %s has no %s column"%(self.path, column))
+            dtype = np.dtype(self.dtypes[column])
+            if self.rows == 0:
+                # Empty files can not be memory-mapped
+                self._arrays[column] = np.zeros(0, dtype=dtype)
+            else:
+                filename = os.path.join(self.path, ARRAY_FILE%(column))
+                self._arrays[column] = np.memmap(filename, dtype=dtype, mode='r', shape=(self.rows,))
+        return self._arrays[column]
+
+    def frame(self, columns=None):
+        """
+        Get a data frame with the given columns (all columns by default),
+        backed by the memory-mapped arrays (nothing is copied).
+        Text columns are categoricals made from the stored codes.
+        """
+        if columns is None:
+            columns = self.columns
+        data = {}
+        for col in columns:
+            values = self.array(col)
+            if col in self.value_lists:
+                dtype = pd.CategoricalDtype(self.values[self.value_lists[col]])
+                values = pd.Categorical.from_codes(values, dtype=dtype, validate=False)
+            data[col] = values
+        return pd.DataFrame(data, columns=list(columns), copy=False)
+
+    def season_rows(self, seasons):
+        """Get the positions of the games in any of seasons (0-indexed), in order"""
+        ranges = [np.arange(*self.season_bounds[s]) for s in sorted(set(seasons)) if s in self.season_bounds]
+        return np.concatenate(ranges + [np.arange(0)])
+
+
+class ArrayStoreWriter(object):
+    """
+    Write an array store from chunks of games: call append() with each
+    chunk (a data frame, tie games already dropped), in season and day
+    order, then close(). Only one chunk is in memory at a time.
+
+    Each column's type is set by the first chunk: integers are stored as
+    int32 (see STORE_DTYPES for exceptions), floats as float64, text as
+    codes. Pass dtypes (column -> NumPy type) to store other types.
+    """
+    def __init__(self, path, fingerprint=None, dtypes=None):
+        self.path = path
+        self.fingerprint = fingerprint or uuid.uuid4().hex
+        self.dtypes = dict(STORE_DTYPES)
+        self.dtypes.update(dtypes or {})
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self.tmp = ".%d.tmp"%(os.getpid())
+
+        self.columns = None
+        self.value_lists = {}
+        # list name -> list of values, and list name -> value -> code
+        self.values = {}
+        self._codes = {}
+        self.season_bounds = {}
+        self.rows = 0
+        self._last = None
+        self._files = {}
+
+    def append(self, df):
+        """Add a chunk of games to the store"""
+        if self.columns is None:
+            self._start(df)
+        elif list(df.columns) != self.columns:
+            raise ArrayStoreError("Error: every chunk must have the same columns as the first one")
+        if df.shape[0] == 0:
+            return
+
+        df = df.sort_values(['season', 'day'], kind='mergesort')
+        seasons = df['season'].values
+        days = df['day'].values
+        first = (int(seasons[0]), int(days[0]))
+        if self._last is not None and first < self._last:
+            raise ArrayStoreError("Error: chunks must be added in season and day order")
+        self._last = (int(seasons[-1]), int(days[-1]))
+
+        # Row range of each season in this chunk
+        starts = np.flatnonzero(np.concatenate([[True], seasons[1:]!=seasons[:-1]]))
+        for start, stop in zip(starts, np.append(starts[1:], len(seasons))):
+            season = int(seasons[start])
+            first_row = self.season_bounds.get(season, (self.rows + start, None))[0]
+            self.season_bounds[season] = (int(first_row), int(self.rows + stop))
+
+        for col in self.columns:
+            if col in self.value_lists:
+                values = self._encode(col, df[col])
+            else:
+                values = fixed_width(df[col].values, np.dtype(self.dtypes[col]), col)
+            self._files[col].write(values.tobytes())
+        self.rows += df.shape[0]
+
+    def _start(self, df):
+        """Set the columns and their types from the first chunk"""
+        self.columns = list(df.columns)
+        for col in ['season', 'day']:
+            if col not in self.columns:
+                raise ArrayStoreError("Error: the games must have a %s column"%(col))
+        for col in self.columns:
+            if isinstance(df[col].dtype, pd.CategoricalDtype) or df[col].dtype == object or pd.api.types.is_string_dtype(df[col]):
+                name = TEAMS if col in TEAM_COLUMNS else col
+                self.value_lists[col] = name
+                self.values.setdefault(name, [])
+                self._codes.setdefault(name, {})
+                # Codes are written as int32, and narrowed when the store is closed
+                self.dtypes[col] = 'int32'
+            elif col not in self.dtypes:
+                if pd.api.types.is_bool_dtype(df[col]):
+                    self.dtypes[col] = 'bool'
+                elif pd.api.types.is_integer_dtype(df[col]):
+                    self.dtypes[col] = 'int32'
+                elif pd.api.types.is_float_dtype(df[col]):
+                    self.dtypes[col] = 'float64'
+                else:
+                    raise ArrayStoreError("Error: can not store the %s column (type %s)"%(col, df[col].dtype))
+            self._files[col] = open(os.path.join(self.path, ARRAY_FILE%(col) + self.tmp), 'wb')
+
+    def _encode(self, col, values):
+        """Turn a chunk of a text column into codes in the store's list of values (-1 if missing)"""
+        name = self.value_lists[col]
+        codes, uniques = pd.factorize(values)
+        lookup = np.empty(len(uniques)+1, dtype=np.int32)
+        for i, value in enumerate(uniques):
+            value = value.item() if hasattr(value, 'item') else value
+            if value not in self._codes[name]:
+                self._codes[name][value] = len(self.values[name])
+                self.values[name].append(value)
+            lookup[i] = self._codes[name][value]
+        # Missing values have code -1, which picks the last entry
+        lookup[-1] = -1
+        return lookup[codes]
+
+    def close(self):
+        """Finish writing the store, and return it opened for reading"""
+        if self.columns is None:
+            raise ArrayStoreError("Error: no games were added to the array store")
+        for f in self._files.values():
+            f.close()
+        for col in self.columns:
+            tmp_file = os.path.join(self.path, ARRAY_FILE%(col) + self.tmp)
+            if col in self.value_lists:
+                # Narrow the codes to the type pandas uses for this many values,
+                # so categoricals can use the stored codes without copying them
+                dtype = code_dtype(len(self.values[self.value_lists[col]]))
+                narrow_file = tmp_file + ".narrow"
+                with open(tmp_file, 'rb') as src, open(narrow_file, 'wb') as dst:
+                    while True:
+                        chunk = src.read(COPY_ROWS*4)
+                        if not chunk:
+                            break
+                        dst.write(np.frombuffer(chunk, dtype=np.int32).astype(dtype).tobytes())
+                os.replace(narrow_file, tmp_file)
+                self.dtypes[col] = dtype.name
+            os.replace(tmp_file, os.path.join(self.path, ARRAY_FILE%(col)))
+
+        # The metadata is written last: a store without it is not complete
+        meta = {
+            "format": STORE_FORMAT,
+            "fingerprint": self.fingerprint,
+            "rows": self.rows,
+            "dtypes": {col: self.dtypes[col] for col in self.columns},
+            "value_lists": self.value_lists,
+            "values": self.values,
+            "seasons": {str(season): list(bounds) for season, bounds in sorted(self.season_bounds.items())}
+        }
+        meta_file = os.path.join(self.path, STORE_JSON)
+        with open(meta_file + self.tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(meta_file + self.tmp, meta_file)
+        return ArrayStore(self.path)
+
+
+def fixed_width(values, dtype, col):
+    """Convert a chunk of a column to the store's type for it, checking that nothing is lost"""
+    converted = values.astype(dtype)
+    if dtype.kind != 'f' and not np.array_equal(converted, values):
+        raise ArrayStoreError("Error: the %s column does not fit in %s (pass a wider type in dtypes)"%(col, dtype.name))
+    return converted
+
+
+def write_array_store(path, df, fingerprint=None, dtypes=None, chunk_rows=COPY_ROWS):
+    """Write a data frame of games (tie games already dropped) to an array store, and return the store"""
+    writer = ArrayStoreWriter(path, fingerprint, dtypes)
+    df = df.sort_values(['season', 'day'], kind='mergesort')
+    if df.shape[0] == 0:
+        writer.append(df)
+    for start in range(0, df.shape[0], chunk_rows):
+        writer.append(df.iloc[start:start+chunk_rows])
+    return writer.close()
+
+
+def write_games_array_store(path, games_json=None):
+    """
+    Write the game data set (or a game data JSON string) to an array store,
+    with the STORE_GAME_COLUMNS columns and tie games dropped.
+    """
+    from .games_cache import get_games_json, get_fingerprint, drop_ties
+    if games_json is None:
+        games_json = get_games_json()
+    df = drop_ties(pd.read_json(io.StringIO(games_json)))
+    columns = [col for col in STORE_GAME_COLUMNS if col in df.columns]
+    return write_array_store(path, df[columns], fingerprint="store-%s"%(get_fingerprint(games_json)))
+
+
+def main(sysargs = None):
+    """Build an array store from the game data set (python -m streak_finder.array_store)"""
+    if sysargs is None:
+        sysargs = sys.argv[1:]
+    p = argparse.ArgumentParser(description="Build a memory-mapped array store of the game data")
+    p.add_argument('path', help='Directory to write the array store to')
+    p.add_argument('--json', default='', help='Game data JSON file to read (defaults to the installed game data set)')
+    args = p.parse_args(sysargs)
+
+    games_json = None
+    if args.json:
+        with open(args.json, 'r') as f:
+            games_json = f.read()
+    store = write_games_array_store(args.path, games_json)
+    print("Wrote %d games (%d seasons) to %s"%(len(store), len(store.seasons), args.path))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,21 +2,50 @@ import sys
 import os
 import json
 import configargparse
-from .view import TextView, MarkdownView
 from .util import (
-    get_league_division_team_data,
-    league_to_teams,
-    division_to_teams,
-    CaptureStdout
+    get_team_index,
+    all_teams,
+    CaptureStdout,
+    ENGINES
 )
+from .result_cache import ResultCache, TeeStdout, DEFAULT_MAX_MB
 
+# Note: the views (and pandas, and the game data) are imported
+# inside main(), after the arguments have been parsed, so that
+# --help and --version do not pay for loading them.
 
-def main(sysargs = sys.argv[1:]):
+
+def main(sysargs = None):
+
+    if sysargs is None:
+        sysargs = sys.argv[1:]
+
+    # streak-finder serve runs the streak query server instead
+    if len(sysargs)>0 and sysargs[0]=='serve':
+        from .server import main as serve_main
+        return serve_main(sysargs[1:])
+
+    # streak-finder live follows the live game feed instead
+    if len(sysargs)>0 and sysargs[0]=='live':
+        from .live import main as live_main
+        return live_main(sysargs[1:])
+
+    # --version is handled before the team index is loaded (which, the first
+    # time, reads the teams data set), so it never loads any game data
+    pre = configargparse.ArgParser(add_help=False)
+    pre.add('-v', '--version', action='store_true', default=False)
+    pre.add('-c', '--config', required=False, is_config_file=True)
+    pre_options, _ = pre.parse_known_args(sysargs)
+    if pre_options.version:
+        from . import _program, __version__
+        print(_program, __version__)
+        sys.exit(0)
 
     p = configargparse.ArgParser()
 
     # These are safe for command line usage (no accent in Dale)
-    LEAGUES, DIVISIONS, ALLTEAMS = get_league_division_team_data()
+    team_index = get_team_index()
+    LEAGUES, DIVISIONS, ALLTEAMS = team_index.leagues, team_index.divisions, team_index.teams
 
     p.add('-v',
           '--version',
@@ -72,6 +101,27 @@ def main(sysargs = sys.argv[1:]):
           action='append',
           help='Specify versus league')
 
+    # Only count home (or away) games of our team
+    v = p.add_mutually_exclusive_group()
+    v.add('--home',
+          action='store_true',
+          default=False,
+          help='Only count games where our team was the home team')
+    v.add('--away',
+          action='store_true',
+          default=False,
+          help='Only count games where our team was the away team')
+
+    # Pick pitchers
+    p.add('--our-pitcher',
+          required=False,
+          action='append',
+          help='Only count games where our team\'s pitcher was this pitcher (use flag multiple times for multiple pitchers)')
+    p.add('--versus-pitcher',
+          required=False,
+          action='append',
+          help='Only count games where the versus team\'s pitcher was this pitcher (use flag multiple times for multiple pitchers)')
+
     # Specify what season data to view
     p.add('--season',
           required=False,
@@ -85,6 +135,27 @@ def main(sysargs = sys.argv[1:]):
           default=3,
           help='Minimum number of wins to be considered a streak (defaults to 3, make this higher if looking at multiple teams)')
 
+    # Only show the longest streaks
+    p.add('--top',
+          required=False,
+          type=int,
+          default=0,
+          help='Only show the N longest streaks (ties broken by season, then start day; defaults to 0, all streaks)')
+
+    # Pick streak detection engine
+    p.add('--engine',
+          required=False,
+          choices=ENGINES,
+          default='rle',
+          help='Streak detection engine: rle (vectorized, default) or loop (original row-by-row version, for checking results)')
+
+    # Number of worker processes
+    p.add('--jobs',
+          required=False,
+          type=int,
+          default=1,
+          help='Experimental: number of processes to find streaks with (rle engine only, defaults to 1, use 0 for one per core)')
+
     p.add('--text',
           action='store_true',
           default=True,
@@ -93,11 +164,15 @@ def main(sysargs = sys.argv[1:]):
           action='store_true',
           default=False,
           help='Print streak data in Markdown table format')
+    p.add('--csv',
+          action='store_true',
+          default=False,
+          help='Print streak data in CSV format (for use with --matrix flag)')
     p.add('--output',
           required=False,
           type=str,
           default='',
-          help='Specify the name of the Markdown output file, for use with --markdown flag')
+          help='Specify the name of the Markdown or CSV output file, for use with --markdown or --csv flag')
 
     # Pick format for streak data
     m = p.add_mutually_exclusive_group()
@@ -109,6 +184,10 @@ def main(sysargs = sys.argv[1:]):
           action='store_true',
           default=False,
           help='Print streak data in short format (one line per streak)')
+    m.add('--matrix',
+          action='store_true',
+          default=False,
+          help='Print the longest and current head-to-head streak of every team against every versus team, as a matrix (--min and --top do not apply)')
 
     # Pick name format (nickname vs full name)
     m = p.add_mutually_exclusive_group()
@@ -121,31 +200,154 @@ def main(sysargs = sys.argv[1:]):
           default=False,
           help='Print full team names (e.g., Hellmouth Sunbeams)')
 
+    # Game data source
+    p.add('--store',
+          required=False,
+          type=str,
+          default='',
+          help='Read the game data from this array store directory (memory-mapped, for very large or simulated data sets; build one with python -m streak_finder.array_store) instead of the installed game data')
+
+    # Result cache
+    p.add('--no-cache',
+          action='store_true',
+          default=False,
+          help='Do not use (or add to) the cache of query results')
+    p.add('--cache-dir',
+          required=False,
+          type=str,
+          default='',
+          help='Directory for the cache of query results (defaults to a results directory in the data cache directory)')
+    p.add('--cache-size-mb',
+          required=False,
+          type=float,
+          default=DEFAULT_MAX_MB,
+          help='Most disk space used by the cache of query results, in MB (defaults to %d)'%(DEFAULT_MAX_MB))
+    p.add('--cache-stats',
+          action='store_true',
+          default=False,
+          help='Print the number of result cache hits and misses and exit')
+
+    # Diagnostics
+    p.add('--timings',
+          action='store_true',
+          default=False,
+          help='Print how long each stage of the query took (and how many rows it produced) to stderr')
+    p.add('--profile',
+          required=False,
+          type=str,
+          default='',
+          help='Profile the query with cProfile and save the stats to this file (view them with pstats or snakeviz)')
+
     # -----
 
     # Print help, if no arguments provided
-    if len(sys.argv[1:])==0:
+    if len(sysargs)==0:
         p.print_help()
         exit(0)
 
     # Parse arguments
-    options = p.parse_args(sys.argv[1:])
+    options = p.parse_args(sysargs)
 
-    # If the user asked for the version,
-    # print the version number and exit.
-    if options.version:
-        from . import _program, __version__
-        print(_program, __version__)
+    cache = ResultCache(
+        options.cache_dir or None,
+        max_bytes=int(options.cache_size_mb*1024*1024)
+    )
+    if options.cache_stats:
+        for k, val in cache.stats().items():
+            print("%s: %d"%(k, val))
         sys.exit(0)
 
+    # An array store of a simulated league has its own teams
+    store_teams = None
+    if options.store:
+        from .array_store import ArrayStore
+        options.store = os.path.abspath(options.store)
+        store_teams = ArrayStore(options.store).team_names
+
+    # Fill in defaults, and turn divisions/leagues into teams
+    normalize_options(options, team_index, store_teams)
+
+    # If this query has been run before on the same data, print the stored
+    # output (before pandas or the game data are loaded). Output written
+    # to a file with --output is not cached.
+    # (--timings and --profile always run the query)
+    use_cache = not options.no_cache and options.output == '' and not options.timings and not options.profile
+    if use_cache:
+        key = cache.key(options)
+        text = cache.get(key)
+        if text is not None:
+            sys.stdout.write(text)
+            return
+
+    if options.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    from .finder import StreakFinder
+    from .view import TextView, MarkdownView, CsvView, view_columns
+    from .streak_data import filter_columns
+    # Only load the game data columns this report (and its filters) uses
+    finder = StreakFinder(engine=options.engine, jobs=options.jobs, columns=view_columns(options) + filter_columns(options),
+                          store=options.store or None)
+    if options.matrix:
+        result = finder.query_head_to_head(options)
+    else:
+        result = finder.query(options)
+    if options.csv:
+        v = CsvView(options, result)
+    elif options.markdown:
+        v = MarkdownView(options, result)
+    else:
+        v = TextView(options, result)
+
+    if use_cache:
+        with TeeStdout() as tee:
+            v.table()
+        if tee.complete:
+            cache.put(key, tee.getvalue())
+    else:
+        v.table()
+
+    if options.profile:
+        profiler.disable()
+        profiler.dump_stats(options.profile)
+        print("Saved profile to %s"%(options.profile), file=sys.stderr)
+
+    if options.timings:
+        timings = finder.timings
+        timings.extend(result.timings)
+        print("\n" + timings.report(), file=sys.stderr)
+
+
+def normalize_options(options, team_index, store_teams=None):
+    """
+    Fill in defaults for options the user did not set,
+    and turn divisions and leagues into lists of teams.
+    store_teams is the list of teams in the array store the
+    query reads, if any (see util.all_teams).
+    This modifies options in place.
+    """
     # If user did not specify winning/losing, use default (winning)
     if (not options.winning) and (not options.losing):
         options.winning = True
 
-    # If the user did not specify long/short table format, use default (short)
-    if (not options.long) and (not options.short):
+    # If the user did not specify long/short/matrix table format, use default (short)
+    if (not options.long) and (not options.short) and (not getattr(options, 'matrix', False)):
         options.short = True
 
+    # CSV output is only available for head-to-head matrices
+    if getattr(options, 'csv', False):
+        if not getattr(options, 'matrix', False):
+            raise Exception("Error: the --csv flag can only be used with the --matrix flag")
+        if options.markdown:
+            raise Exception("Error: choose one of the --markdown and --csv flags")
+
+    # Head-to-head matrices count every game between two teams
+    if getattr(options, 'matrix', False):
+        if options.home or options.away or options.our_pitcher or options.versus_pitcher:
+            raise Exception("Error: the --matrix flag can not be used with the --home, --away, --our-pitcher, or --versus-pitcher flags")
+
     # If user did not specify a name format, use short
     if (not options.nickname) and (not options.fullname):
         options.nickname = True
@@ -154,60 +356,67 @@ def main(sysargs = sys.argv[1:]):
     if options.output != '':
         options.output = os.path.abspath(options.output)
 
+    # If nothing was provided for seasons, set it to 'all'
+    if not options.season:
+        options.season = ['all']
+    else:
+        try:
+            _ = [int(j) for j in options.season]
+        except ValueError:
+            raise Exception("Error: you must provide integers to the --season flag: --season 1 --season 2")
+
+    # Divisions and leagues change from season to season,
+    # so look up their teams in the seasons the user asked for
+    # (0-indexed), or the first season they appear in
+    if 'all' in options.season:
+        index_seasons = None
+    else:
+        index_seasons = [int(j)-1 for j in options.season]
+
     # If the user specified a division or a league,
     # turn that into a list of teams for them
     if options.division:
         divteams = []
         for div in options.division:
-            divteams += division_to_teams(div)
+            divteams += team_index.division_to_teams(div, index_seasons)
         options.team = divteams
         options.division = None
     if options.league:
         leateams = []
         for lea in options.league:
-            leateams += league_to_teams(lea)
+            leateams += team_index.league_to_teams(lea, index_seasons)
         options.team = leateams
         options.league = None
     # Same for versus
     if options.versus_division:
         vdivteams = []
         for div in options.versus_division:
-            vdivteams += division_to_teams(div)
+            vdivteams += team_index.division_to_teams(div, index_seasons)
         options.versus_team = vdivteams
         options.versus_division = None
     if options.versus_league:
         vleateams = []
         for lea in options.versus_league:
-            vleateams += league_to_teams(lea)
+            vleateams += team_index.league_to_teams(lea, index_seasons)
         options.versus_team = vleateams
         options.versus_league = None
 
     # If nothing was supplied for our team/division/league, use all teams
     if not options.team and not options.division and not options.league:
-        options.team = ALLTEAMS
+        options.team = all_teams(team_index, store_teams)
 
     # If nothing was supplied for versus team/division/league, use all teams
     if not options.versus_team and not options.versus_division and not options.versus_league:
-        options.versus_team = ALLTEAMS
-
-    # If nothing was provided for seasons, set it to 'all'
-    if not options.season:
-        options.season = ['all']
-    else:
-        try:
-            _ = [int(j) for j in options.season]
-        except ValueError:
-            raise Exception("Error: you must provide integers to the --season flag: --season 1 --season 2")
-
-    if options.markdown:
-        v = MarkdownView(options)
-        v.table()
-    else:
-        v = TextView(options)
-        v.table()
+        options.versus_team = all_teams(team_index, store_teams)
 
 
 def streak_summary(sysargs):
+    """
+    Run the command line tool with the given list of flags,
+    and return the printed output as a string.
+    (To run many queries without reloading the data,
+    use streak_finder.finder.StreakFinder instead.)
+    """
     with CaptureStdout() as so:
         main(sysargs)
     return str(so)
@@ -0,0 +1,264 @@
+import argparse
+import pandas as pd
+from .streak_data import GameData, StreakData, NoStreaksException
+from .timings import Timings
+from .util import get_team_index, all_teams
+
+
+"""
+The StreakFinder class is the Python API for finding streaks.
+It loads the game data once, and can then answer any number
+of streak queries without reloading or re-indexing the data:
+
+    from streak_finder.finder import StreakFinder
+
+    finder = StreakFinder()
+    result = finder.find_streaks(teams=['Tigers'], seasons=[3, 4], min=5)
+    print(result.streaks)
+
+    # Longest and current streak of every team against every other team
+    matrix = finder.head_to_head()
+    print(matrix.longest.loc['Tigers', 'Pies'])
+"""
+
+
+STREAK_COLUMNS = ["Team Name", "Streak Length", "Streak Season", "Streak Start", "Streak Days", "Game Rows"]
+
+# Game data columns used by StreakResult.to_records(games=True)
+RECORD_GAME_COLUMNS = ['season', 'day', 'awayTeamNickname', 'awayScore', 'homeTeamNickname', 'homeScore']
+
+
+class StreakResult(object):
+    """
+    The result of a streak query.
+
+    The streaks attribute is a data frame with one row per streak,
+    sorted from longest to shortest, with the columns:
+    - Team Name: team nickname
+    - Streak Length: number of games in the streak
+    - Streak Season: season of the streak (0-indexed)
+    - Streak Start: day the streak started (0-indexed)
+    - Streak Days: list of days in the streak (0-indexed)
+    - Game Rows: positions of the games in the streak in the game data frame
+
+    The remaining attributes record the query that produced the result,
+    and how long each stage of the query took (timings, see timings.py;
+    rendering the result with a view adds a render stage).
+    """
+    def __init__(self, streaks, games, teams, versus_teams, seasons, winning, min, top=0,
+                 venue=None, our_pitchers=None, versus_pitchers=None):
+        self.timings = Timings()
+        self.streaks = streaks
+        self.games = games
+        self.teams = teams
+        self.versus_teams = versus_teams
+        self.seasons = seasons
+        self.winning = winning
+        self.min = min
+        # Number of longest streaks kept (0 if all streaks were kept)
+        self.top = top
+        # Home/away and pitcher filters ('home', 'away', or None, and lists of pitcher names)
+        self.venue = venue
+        self.our_pitchers = our_pitchers or []
+        self.versus_pitchers = versus_pitchers or []
+
+    def __len__(self):
+        return self.streaks.shape[0]
+
+    def streak_games(self, i, columns=None):
+        """
+        Get a data frame with the games in the ith streak
+        (only the given columns, if columns is given)
+        """
+        df = self.games.df
+        if columns is not None:
+            df = df[columns]
+        return df.take(self.streaks['Game Rows'].iloc[i])
+
+    def to_records(self, games=False):
+        """
+        Get the streaks as a list of dicts, with 1-indexed seasons and days
+        (as displayed by the command line tool). If games is True, each
+        streak also gets a list of the games in the streak.
+        """
+        if games:
+            game_df = self.games.df[RECORD_GAME_COLUMNS]
+        records = []
+        for team, length, season, days, rows in self.streaks[["Team Name", "Streak Length", "Streak Season", "Streak Days", "Game Rows"]].itertuples(index=False):
+            record = {
+                "team": team,
+                "length": int(length),
+                "season": int(season)+1,
+                "days": [int(j)+1 for j in days]
+            }
+            if games:
+                record["games"] = [
+                    {
+                        "season": int(g_season)+1,
+                        "day": int(g_day)+1,
+                        "awayTeam": away_team,
+                        "awayScore": int(away_score),
+                        "homeTeam": home_team,
+                        "homeScore": int(home_score)
+                    }
+                    for g_season, g_day, away_team, away_score, home_team, home_score in game_df.take(rows).itertuples(index=False)
+                ]
+            records.append(record)
+        return records
+
+
+class HeadToHeadResult(object):
+    """
+    The result of a head-to-head query.
+
+    The longest, current, and games attributes are data frames with one
+    row per team and one column per opponent (both indexed by nickname):
+    - longest: the team's longest streak against the opponent
+    - current: the team's streak going into the next game against the
+      opponent (0 if the opponent won the last game for winning streaks,
+      or lost it for losing streaks)
+    - games: the number of games the two teams played
+
+    Streaks count consecutive games between the two teams, and carry
+    over from one season to the next. The remaining attributes record
+    the query that produced the result, and how long each stage took.
+    """
+    def __init__(self, longest, current, games, teams, versus_teams, seasons, winning):
+        self.timings = Timings()
+        self.longest = pd.DataFrame(longest, index=teams, columns=versus_teams)
+        self.current = pd.DataFrame(current, index=teams, columns=versus_teams)
+        self.games = pd.DataFrame(games, index=teams, columns=versus_teams)
+        self.teams = teams
+        self.versus_teams = versus_teams
+        self.seasons = seasons
+        self.winning = winning
+
+    def __len__(self):
+        """Number of (team, opponent) pairs that played each other"""
+        return int((self.games.values > 0).sum())
+
+
+class StreakFinder(object):
+    """
+    A streak finding session: loads and indexes the game data once,
+    then answers streak queries with find_streaks().
+    """
+    def __init__(self, engine='rle', games=None, jobs=1, columns=None, store=None):
+        """
+        engine is the streak detection engine (see StreakData).
+        games is an optional GameData object, to share data between finders.
+        jobs is the number of processes to find streaks with (0 for one per core).
+        columns is an optional list of game data columns to load (by default
+        all columns are loaded; the columns needed to find streaks always are).
+        store is an optional array store (or its path) to read the game data
+        from, instead of the game data set (see array_store.py).
+        """
+        self.engine = engine
+        self.jobs = jobs
+        # Time it took to load the game data (see timings.py)
+        self.timings = Timings()
+        if games is None:
+            with self.timings.stage("load") as stage:
+                games = GameData(columns=columns, store=store)
+                stage.rows = games.df.shape[0]
+        self.games = games
+        self.team_index = get_team_index()
+
+    @property
+    def all_teams(self):
+        """Teams to use when a query does not pick any (see util.all_teams)"""
+        return all_teams(self.team_index, self.games.team_names if self.games.store is not None else None)
+
+    def find_streaks(self, teams=None, versus_teams=None, seasons=None, winning=True, min=3, top=0,
+                     venue=None, our_pitchers=None, versus_pitchers=None):
+        """
+        Find winning (or losing, if winning is False) streaks of at least min games
+        by any of teams against any of versus_teams, in the given seasons.
+
+        teams and versus_teams are lists of team nicknames (all teams if not given).
+        seasons is a list of 1-indexed season numbers (all seasons if not given).
+        If top is given, only the top longest streaks are returned.
+        venue ('home' or 'away'), our_pitchers, and versus_pitchers (lists of
+        pitcher names) only count games with our team at home or away, or with
+        one of those pitchers for our team or the versus team.
+        Returns a StreakResult.
+        """
+        options = self.make_options(teams, versus_teams, seasons, winning, min, top,
+                                    venue, our_pitchers, versus_pitchers)
+        return self.query(options)
+
+    def head_to_head(self, teams=None, versus_teams=None, seasons=None, winning=True):
+        """
+        Find the longest and current winning (or losing, if winning is False)
+        streak of each of teams against each of versus_teams, in the given seasons
+        (arguments are the same as find_streaks). Returns a HeadToHeadResult.
+        """
+        options = self.make_options(teams, versus_teams, seasons, winning)
+        return self.query_head_to_head(options)
+
+    def make_options(self, teams=None, versus_teams=None, seasons=None, winning=True, min=3, top=0,
+                     venue=None, our_pitchers=None, versus_pitchers=None):
+        """Turn find_streaks arguments into an options namespace like the one command.main creates"""
+        if venue not in [None, 'home', 'away']:
+            raise Exception("Error: venue must be home or away, not %s"%(venue))
+        return argparse.Namespace(
+            team=list(teams) if teams else self.all_teams,
+            versus_team=list(versus_teams) if versus_teams else self.all_teams,
+            season=[str(j) for j in seasons] if seasons else ['all'],
+            winning=winning,
+            min=min,
+            top=top,
+            home=(venue=='home'),
+            away=(venue=='away'),
+            our_pitcher=list(our_pitchers) if our_pitchers else None,
+            versus_pitcher=list(versus_pitchers) if versus_pitchers else None,
+            engine=self.engine,
+            jobs=self.jobs
+        )
+
+    def query(self, options):
+        """
+        Run a streak query given an options namespace (as created by
+        command.main or make_options) and return a StreakResult.
+        """
+        sd = StreakData(options, games=self.games)
+        try:
+            streaks, _ = sd.find_streaks()
+        except NoStreaksException:
+            streaks = pd.DataFrame(columns=STREAK_COLUMNS)
+        result = StreakResult(
+            streaks,
+            self.games,
+            sd.our_teams,
+            sd.their_teams,
+            options.season,
+            options.winning,
+            options.min,
+            sd.top,
+            'home' if sd.home else ('away' if sd.away else None),
+            sd.our_pitchers,
+            sd.versus_pitchers
+        )
+        result.timings = sd.timings
+        result.all_teams = self.all_teams
+        return result
+
+    def query_head_to_head(self, options):
+        """
+        Run a head-to-head query given an options namespace
+        (as created by command.main or make_options) and return a HeadToHeadResult.
+        """
+        sd = StreakData(options, games=self.games)
+        longest, current, games = sd.find_head_to_head()
+        result = HeadToHeadResult(
+            longest,
+            current,
+            games,
+            sd.our_teams,
+            sd.their_teams,
+            options.season,
+            options.winning
+        )
+        result.timings = sd.timings
+        result.all_teams = self.all_teams
+        return result
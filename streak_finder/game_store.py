@@ -0,0 +1,260 @@
+import os
+import io
+import json
+from bisect import bisect_left, insort
+
+
+"""
+The GameStore class is an append-only store for game data, used by
+scripts/fetch_games_data.py to save each fetched game day without
+rewriting everything that was already saved.
+
+Games are stored as newline-delimited JSON in one segment file per
+season (season_000.0.ndjson, season_001.0.ndjson, ...). Each fetched day
+is appended to its season's segment as one chunk, and then a line
+recording the day and where its chunk lives is appended to the
+manifest (manifest.ndjson). Both appends are fsynced.
+
+If a day is fetched again, the new chunk is appended and the newer
+manifest entry replaces the older one, so nothing is rewritten.
+
+The store keeps an index of the days it holds (a dict keyed on
+(season, day), plus a sorted list of days for each season), so checking
+for a day, finding the last day, and counting the days of a season do not
+scan the store. Season lengths are taken from the days that had games.
+compact() writes the consolidated game data JSON file and rewrites
+the segments without the replaced chunks. Compacted segments get a new
+generation number (the last part of the file name), and the old
+segments are only removed once the new manifest is in place.
+"""
+
+
+MANIFEST_NDJSON = "manifest.ndjson"
+SEGMENT_NDJSON = "season_%03d.%d.ndjson"
+
+
+class GameStore(object):
+    """
+    Append-only store of game data, one chunk per (season, day).
+    """
+    def __init__(self, path):
+        self.path = path
+        self.manifest_file = os.path.join(path, MANIFEST_NDJSON)
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        # (season, day) -> manifest entry for the latest chunk of that day
+        self.days = {}
+        # season -> sorted list of days in the store
+        self.season_days = {}
+        # season -> number of days, up to the last day that had games
+        self.season_lengths = {}
+        # Segment generation (increases each time the store is compacted)
+        self.generation = 0
+        self._load_manifest()
+
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_file):
+            return
+        with open(self.manifest_file, 'rb') as f:
+            data = f.read()
+
+        # A partly written last line (e.g., after a crash) is dropped,
+        # so the next append starts on a new line
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            with open(self.manifest_file, 'r+b') as f:
+                f.truncate(end)
+            data = data[:end]
+
+        for line in data.decode('utf-8').splitlines():
+            entry = json.loads(line)
+            self._index(entry)
+            self.generation = max(self.generation, entry['generation'])
+
+    def _index(self, entry):
+        """Add a manifest entry to the day index"""
+        season, day = entry['season'], entry['day']
+        if (season, day) not in self.days:
+            insort(self.season_days.setdefault(season, []), day)
+        self.days[(season, day)] = entry
+        if entry['games'] > 0:
+            self.season_lengths[season] = max(self.season_lengths.get(season, 0), day+1)
+
+    def __len__(self):
+        return len(self.days)
+
+    def __contains__(self, date):
+        return tuple(date) in self.days
+
+    def dates(self):
+        """Sorted list of (season, day) pairs in the store"""
+        return [(season, day) for season in sorted(self.season_days) for day in self.season_days[season]]
+
+    def last_date(self):
+        """The latest (season, day) in the store, or None if the store is empty"""
+        if len(self.season_days)==0:
+            return None
+        season = max(self.season_days)
+        return (season, self.season_days[season][-1])
+
+    def last_game_date(self):
+        """The latest (season, day) in the store that had games, or None if there are none"""
+        if len(self.season_lengths)==0:
+            return None
+        season = max(self.season_lengths)
+        return (season, self.season_lengths[season] - 1)
+
+    def count_days(self, season, end=None):
+        """Number of days of a season in the store (only days before end, if given)"""
+        days = self.season_days.get(season, [])
+        if end is None:
+            return len(days)
+        return bisect_left(days, end)
+
+    def missing_days(self, season, end):
+        """List of days of a season, before end, that are not in the store"""
+        if self.count_days(season, end) == end:
+            return []
+        return [day for day in range(end) if (season, day) not in self.days]
+
+    def append_day(self, season, day, games):
+        """
+        Append one day's games to the store. If the day is already
+        in the store, the new games replace the old ones.
+        """
+        self.append_days([((season, day), games)])
+
+    def append_days(self, days):
+        """
+        Append several days' games to the store, given a list of
+        ((season, day), games) pairs. Each segment and the manifest get
+        one write and one fsync, however many days are appended.
+        Days already in the store are replaced.
+        """
+        # Write each season's chunks to its segment
+        by_segment = {}
+        for (season, day), games in days:
+            by_segment.setdefault(SEGMENT_NDJSON%(season, self.generation), []).append((season, day, games))
+        entries = []
+        for segment, segment_days in by_segment.items():
+            with open(os.path.join(self.path, segment), 'ab') as f:
+                offset = f.seek(0, io.SEEK_END)
+                chunks = []
+                for season, day, games in segment_days:
+                    data = "".join(json.dumps(game) + "\n" for game in games).encode('utf-8')
+                    entries.append({
+                        "season": season,
+                        "day": day,
+                        "segment": segment,
+                        "generation": self.generation,
+                        "offset": offset,
+                        "length": len(data),
+                        "games": len(games)
+                    })
+                    chunks.append(data)
+                    offset += len(data)
+                f.write(b"".join(chunks))
+                f.flush()
+                os.fsync(f.fileno())
+
+        # Then record them in the manifest
+        with open(self.manifest_file, 'a') as f:
+            f.write("".join(json.dumps(entry) + "\n" for entry in entries))
+            f.flush()
+            os.fsync(f.fileno())
+        for entry in entries:
+            self._index(entry)
+
+    def read_day(self, season, day):
+        """Get the list of games for one day"""
+        entry = self.days[(season, day)]
+        with open(os.path.join(self.path, entry['segment']), 'rb') as f:
+            f.seek(entry['offset'])
+            data = f.read(entry['length'])
+        return [json.loads(line) for line in data.decode('utf-8').splitlines()]
+
+    def games(self):
+        """Get a list of all games in the store, sorted by season and day"""
+        games = []
+        handles = {}
+        try:
+            for date in self.dates():
+                entry = self.days[date]
+                if entry['segment'] not in handles:
+                    handles[entry['segment']] = open(os.path.join(self.path, entry['segment']), 'rb')
+                f = handles[entry['segment']]
+                f.seek(entry['offset'])
+                data = f.read(entry['length'])
+                games += [json.loads(line) for line in data.decode('utf-8').splitlines()]
+        finally:
+            for f in handles.values():
+                f.close()
+        return games
+
+    def compact(self, games_json=None):
+        """
+        Consolidate the store:
+        - rewrite the segments and manifest without replaced chunks,
+        - write all games to games_json (if given), as one JSON list
+          (the format of the games_data_trim.json data set).
+        The games cache and the streak table are not written here: they are
+        keyed on the installed game data set (see games_cache.py), which the
+        command line tool reads, not on games_json.
+        """
+        day_data = {date: self.read_day(*date) for date in self.dates()}
+        games = []
+        for date in self.dates():
+            games += day_data[date]
+
+        # Rewrite each segment and the manifest with only the latest chunks
+        by_season = {}
+        for date in self.dates():
+            by_season.setdefault(date[0], []).append(date)
+        old_segments = set(entry['segment'] for entry in self.days.values())
+        generation = self.generation + 1
+        new_days = {}
+        for season, dates in by_season.items():
+            segment = SEGMENT_NDJSON%(season, generation)
+            with open(os.path.join(self.path, segment), 'wb') as f:
+                for date in dates:
+                    data = "".join(json.dumps(game) + "\n" for game in day_data[date]).encode('utf-8')
+                    new_days[date] = {
+                        "season": date[0],
+                        "day": date[1],
+                        "segment": segment,
+                        "generation": generation,
+                        "offset": f.tell(),
+                        "length": len(data),
+                        "games": len(day_data[date])
+                    }
+                    f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+
+        tmp_manifest = self.manifest_file + ".tmp"
+        with open(tmp_manifest, 'w') as f:
+            for date in sorted(new_days.keys()):
+                f.write(json.dumps(new_days[date]) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_manifest, self.manifest_file)
+        self.days = {}
+        self.season_days = {}
+        self.season_lengths = {}
+        for date in sorted(new_days.keys()):
+            self._index(new_days[date])
+        self.generation = generation
+
+        # The new manifest no longer points at the old segments
+        for segment in old_segments:
+            os.remove(os.path.join(self.path, segment))
+
+        if games_json is not None:
+            games_text = json.dumps(games)
+            tmp_json = games_json + ".tmp"
+            with open(tmp_json, 'w') as f:
+                f.write(games_text)
+            os.replace(tmp_json, games_json)
+
+        return games
@@ -0,0 +1,237 @@
+import os
+import io
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+import blaseball_core_game_data as gd
+from .util import cache_path, get_gd_version, get_data_stamp
+
+
+"""
+The games cache stores the game data set from blaseball_core_game_data
+in a compact columnar format (an uncompressed NumPy .npz file, one
+array per column) so that we only have to parse the game data JSON
+once per data version. Tie games are dropped before the cache is written.
+
+Columns are loaded one at a time, so a report only loads the columns it
+needs. Text columns (team names, pitcher names, etc.) are stored as integer
+codes and loaded as pandas categoricals, and integer columns are stored in
+the smallest integer type that fits them (e.g., int8 for seasons), which
+keeps the game data frame small in memory.
+
+The cache is keyed by the installed blaseball_core_game_data version
+plus a hash of the game data, and is rebuilt when either one changes.
+The cache also stores the cheap data stamp (util.get_data_stamp) it was
+built from, so that while the stamp is unchanged the game data JSON is
+not read or hashed at all.
+"""
+
+
+GAMES_CACHE_NPZ = "games_data.npz"
+# Version of the cache file layout (older files are rebuilt)
+CACHE_FORMAT = 2
+
+# Keys in the .npz file
+META_KEY = "__meta__"
+VALUES_PREFIX = "values:"
+CODES_PREFIX = "codes:"
+
+
+def get_games_json():
+    """
+    Get the raw game data JSON from blaseball_core_game_data.
+    This handles the data being returned either as a JSON string
+    or as the path to a JSON file.
+    """
+    raw = gd.get_games_data()
+    if isinstance(raw, bytes):
+        raw = raw.decode('utf-8')
+    if not raw.lstrip().startswith(('[', '{')) and os.path.isfile(raw):
+        with open(raw, 'r') as f:
+            raw = f.read()
+    return raw
+
+
+def get_fingerprint(games_json):
+    """Get the key used to tell whether the games cache is up to date"""
+    content_hash = hashlib.sha1(games_json.encode('utf-8')).hexdigest()
+    return "%s-%s"%(get_gd_version(), content_hash)
+
+
+def drop_ties(df):
+    """Drop tie games from a game data frame"""
+    return df.loc[df['homeScore']!=df['awayScore']]
+
+
+def get_stamp():
+    """The data stamp (util.get_data_stamp) as stored in the cache metadata"""
+    return json.loads(json.dumps(get_data_stamp()))
+
+
+def load_games(columns=None):
+    """
+    Load the game data set (with tie games dropped) into a data frame.
+    If columns is given, only those columns are loaded.
+
+    If the data stamp is the one the games cache was built from, the data
+    frame is loaded from the cache without reading the game data JSON.
+    Otherwise, the JSON is hashed and, if it changed, parsed and the
+    cache is rebuilt. The data fingerprint is stored in the data frame's attrs.
+    """
+    stamp = get_stamp()
+    cache_file = os.path.join(cache_path(), GAMES_CACHE_NPZ)
+
+    df = read_cache(cache_file, columns=columns, stamp=stamp)
+    if df is None:
+        games_json = get_games_json()
+        df = read_cache(cache_file, get_fingerprint(games_json))
+        if df is None:
+            df = write_games_cache(games_json, stamp)
+        else:
+            # Same data with a new stamp (e.g., reinstalled): store the new
+            # stamp, so the next run does not hash the JSON again
+            fingerprint = df.attrs['fingerprint']
+            try:
+                write_cache(cache_file, fingerprint, df, stamp)
+            except OSError:
+                pass
+            df.attrs['fingerprint'] = fingerprint
+        if columns is not None:
+            fingerprint = df.attrs['fingerprint']
+            df = df[list(columns)]
+            df.attrs['fingerprint'] = fingerprint
+    return df
+
+
+def write_games_cache(games_json, stamp=None):
+    """
+    Parse game data JSON, drop tie games, and write the result
+    to the games cache (with the data stamp it was built from, if given).
+    Returns the game data frame.
+    """
+    df = pd.read_json(io.StringIO(games_json))
+    df = drop_ties(df).reset_index(drop=True)
+    cache_file = os.path.join(cache_path(), GAMES_CACHE_NPZ)
+    try:
+        write_cache(cache_file, get_fingerprint(games_json), df, stamp)
+    except OSError:
+        # The cache is an optimization, so a read-only install is not an error
+        pass
+    df = compact_frame(df)
+    df.attrs['fingerprint'] = get_fingerprint(games_json)
+    return df
+
+
+def compact_frame(df):
+    """
+    Get a copy of a game data frame with text columns as categoricals
+    and integer columns in the smallest integer type that fits them
+    (the same types the games cache loads).
+    """
+    data = {}
+    for col in df.columns:
+        if df[col].dtype == object or pd.api.types.is_string_dtype(df[col]):
+            data[col] = df[col].astype('category')
+        elif pd.api.types.is_integer_dtype(df[col]):
+            data[col] = small_int(df[col].values)
+        else:
+            data[col] = df[col]
+    return pd.DataFrame(data, index=df.index)
+
+
+def small_int(values):
+    """Convert an integer array to the smallest signed integer type that fits its values"""
+    if len(values)==0:
+        return values
+    lo, hi = values.min(), values.max()
+    for dtype in [np.int8, np.int16, np.int32]:
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return values.astype(dtype)
+    return values.astype(np.int64)
+
+
+def write_cache(cache_file, fingerprint, df, stamp=None):
+    """
+    Write a data frame to the games cache file.
+    String (object) columns are stored as integer codes,
+    with the unique values stored in the metadata.
+    Integer columns are stored in the smallest integer type that fits.
+    """
+    arrays = {}
+    meta = {
+        "format": CACHE_FORMAT,
+        "fingerprint": fingerprint,
+        "stamp": stamp,
+        "columns": list(df.columns),
+        "categories": {}
+    }
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            arrays[CODES_PREFIX + col] = df[col].cat.codes.values.astype(np.int32)
+            meta["categories"][col] = [_to_json_value(j) for j in df[col].cat.categories]
+        elif df[col].dtype == object or pd.api.types.is_string_dtype(df[col]):
+            codes, uniques = pd.factorize(df[col])
+            arrays[CODES_PREFIX + col] = codes.astype(np.int32)
+            meta["categories"][col] = [_to_json_value(j) for j in uniques]
+        elif pd.api.types.is_integer_dtype(df[col]):
+            arrays[VALUES_PREFIX + col] = small_int(df[col].values)
+        else:
+            arrays[VALUES_PREFIX + col] = df[col].values
+    arrays[META_KEY] = np.array(json.dumps(meta))
+
+    cache_dir = os.path.dirname(cache_file)
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+
+    # Write to a temporary file and move it into place,
+    # so concurrent runs never see a partial cache file
+    tmp_file = "%s.%d.tmp"%(cache_file, os.getpid())
+    with open(tmp_file, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_file, cache_file)
+
+
+def read_cache(cache_file, fingerprint=None, columns=None, stamp=None):
+    """
+    Read a data frame from the games cache file.
+    Returns None if the cache file is missing or out of date: the cache
+    must match fingerprint, or the data stamp if stamp is given instead.
+    Only the arrays for the requested columns are read,
+    and text columns are loaded as categoricals.
+    The cache's fingerprint is stored in the data frame's attrs.
+    """
+    if not os.path.exists(cache_file):
+        return None
+    try:
+        with np.load(cache_file, allow_pickle=False) as npz:
+            meta = json.loads(str(npz[META_KEY]))
+            if meta.get("format") != CACHE_FORMAT:
+                return None
+            if stamp is not None:
+                if meta.get("stamp") != stamp:
+                    return None
+            elif meta["fingerprint"] != fingerprint:
+                return None
+            if columns is None:
+                columns = meta["columns"]
+            data = {}
+            for col in columns:
+                if col in meta["categories"]:
+                    # Missing values have code -1
+                    data[col] = pd.Categorical.from_codes(npz[CODES_PREFIX + col], meta["categories"][col])
+                else:
+                    data[col] = npz[VALUES_PREFIX + col]
+    except (OSError, KeyError, ValueError):
+        # Treat a damaged or incompatible cache file as a cache miss
+        return None
+    df = pd.DataFrame(data, columns=list(columns))
+    # Things computed from the game data (like the streak table) are keyed on this
+    df.attrs['fingerprint'] = meta["fingerprint"]
+    return df
+
+
+def _to_json_value(x):
+    """Convert NumPy scalars to plain Python values for JSON"""
+    return x.item() if hasattr(x, 'item') else x
@@ -0,0 +1,209 @@
+import os
+import json
+import pandas as pd
+from .util import cache_path
+
+
+"""
+The StreakState class keeps track of every team's winning and losing
+streaks, season by season, so that streaks can be updated one game day
+at a time instead of being recomputed from the whole data set.
+
+For each team and season, the state holds the streak that is still going
+(its days, and whether it is a winning or losing streak) plus the days of
+every completed winning and losing streak. Adding a day's games only
+touches the teams that played that day: each game either extends a team's
+current streak, or closes it and starts a new one.
+
+The state covers games against all opponents; queries against a subset
+of versus teams still need the full StreakData path.
+
+The state is used by scripts/fetch_games_data.py (which saves it next to
+the game store, as streak_state.json) and by the live tracker (live.py).
+StreakData, StreakFinder, and the command line tool do not read it. They
+query the installed game data set, not the fetched game days, and answer
+all-opponent queries from the streak table (streak_table.py), which is
+built once per game data version.
+"""
+
+
+STREAK_STATE_JSON = "streak_state.json"
+STATE_FORMAT = 1
+
+
+class StreakStateError(Exception):
+    pass
+
+
+class StreakState(object):
+    """
+    Winning and losing streaks of every team, for every season,
+    that can be updated incrementally with add_games().
+    """
+    def __init__(self):
+        # team -> season -> {"current": {"won": bool, "days": [...]},
+        #                    "won": [[days], ...], "lost": [[days], ...]}
+        self.teams = {}
+        # Last (season, day) added
+        self.last = None
+
+    @classmethod
+    def from_games(cls, df):
+        """Build the state from scratch from a game data frame (tie games already dropped)"""
+        state = cls()
+        df = df.sort_values(['season', 'day'], kind='mergesort')
+        state.add_games(df)
+        return state
+
+    def add_games(self, games):
+        """
+        Add games to the state. games is a data frame or a list of dicts
+        with (at least) the keys season, day, winningTeamNickname,
+        losingTeamNickname, homeScore, and awayScore. Tie games are skipped.
+        Games must be added in order: a team's games in a season cannot
+        be added before a day that was already added for that team.
+        """
+        keys = ['season', 'day', 'winningTeamNickname', 'losingTeamNickname', 'homeScore', 'awayScore']
+        if isinstance(games, pd.DataFrame):
+            rows = games[keys].itertuples(index=False)
+        else:
+            rows = ([g[k] for k in keys] for g in games)
+
+        for season, day, winner, loser, home_score, away_score in rows:
+            if home_score == away_score:
+                continue
+            season, day = int(season), int(day)
+            self._add_result(winner, season, day, True)
+            self._add_result(loser, season, day, False)
+            if self.last is None or (season, day) > tuple(self.last):
+                self.last = (season, day)
+
+    def _add_result(self, team, season, day, won):
+        """Extend or close the current streak for one team's game"""
+        seasons = self.teams.setdefault(team, {})
+        if season not in seasons:
+            seasons[season] = {"current": None, "won": [], "lost": []}
+        state = seasons[season]
+
+        current = state["current"]
+        if current is None:
+            state["current"] = {"won": won, "days": [day]}
+        elif day < current["days"][-1]:
+            raise StreakStateError(
+                "Game for %s on season %d day %d was added after day %d; rebuild the streak state"%(
+                    team, season+1, day+1, current["days"][-1]+1
+                )
+            )
+        elif current["won"] == won:
+            # The streak continues
+            current["days"].append(day)
+        else:
+            # End of the streak, start a new one
+            state["won" if current["won"] else "lost"].append(current["days"])
+            state["current"] = {"won": won, "days": [day]}
+
+    def streaks(self, winning=True, min=3, teams=None, seasons=None):
+        """
+        Get winning (or losing) streaks of at least min games as a data frame
+        with the same columns and order as StreakData.find_streaks
+        (except for the Game Rows column).
+
+        teams is a list of team nicknames (all teams if not given), and sets
+        the order of streaks that tie on length, season, and start day.
+        seasons is a list of 0-indexed seasons (all seasons if not given).
+        """
+        if teams is None:
+            teams = sorted(self.teams.keys())
+        kind = "won" if winning else "lost"
+
+        rows = []
+        for slot, team in enumerate(teams):
+            for season, state in self.teams.get(team, {}).items():
+                if seasons is not None and season not in seasons:
+                    continue
+                runs = list(state[kind])
+                current = state["current"]
+                if current is not None and current["won"] == winning:
+                    runs.append(current["days"])
+                for days in runs:
+                    if len(days) >= max(min, 1):
+                        rows.append((len(days), season, days[0], slot, team, days))
+
+        # Longest first, then by season and start day (then team, like StreakData)
+        rows.sort(key=lambda r: (-r[0], r[1], r[2], r[3]))
+        return pd.DataFrame({
+            "Team Name": [r[4] for r in rows],
+            "Streak Length": [r[0] for r in rows],
+            "Streak Season": [r[1] for r in rows],
+            "Streak Start": [r[2] for r in rows],
+            "Streak Days": [list(r[5]) for r in rows]
+        })
+
+    def to_dict(self):
+        return {
+            "format": STATE_FORMAT,
+            "last": self.last,
+            "teams": {
+                team: {str(season): state for season, state in seasons.items()}
+                for team, seasons in self.teams.items()
+            }
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        if d.get("format") != STATE_FORMAT:
+            raise StreakStateError("Unsupported streak state format: %s"%(d.get("format")))
+        state = cls()
+        state.last = tuple(d["last"]) if d["last"] is not None else None
+        state.teams = {
+            team: {int(season): s for season, s in seasons.items()}
+            for team, seasons in d["teams"].items()
+        }
+        return state
+
+    def save(self, filename=None):
+        """Save the state to a JSON file (in the cache directory by default)"""
+        if filename is None:
+            filename = os.path.join(cache_path(), STREAK_STATE_JSON)
+        dirname = os.path.dirname(os.path.abspath(filename))
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+        tmp_file = "%s.%d.tmp"%(filename, os.getpid())
+        with open(tmp_file, 'w') as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_file, filename)
+
+    @classmethod
+    def load(cls, filename=None):
+        """Load the state from a JSON file (in the cache directory by default)"""
+        if filename is None:
+            filename = os.path.join(cache_path(), STREAK_STATE_JSON)
+        with open(filename, 'r') as f:
+            return cls.from_dict(json.load(f))
+
+
+def apply_games(state, games):
+    """
+    Add a day's games to a streak state, in memory (nothing is loaded or
+    saved, so a caller adding many days saves the state once at the end).
+    Returns the state.
+    """
+    state.add_games(games)
+    return state
+
+
+def update_streak_state(games, filename=None):
+    """
+    Add a day's games to the saved streak state and save it again.
+    If there is no saved state yet, a new one is started.
+    Returns the updated StreakState.
+    This loads and saves the whole state: to add many days, load it once,
+    call apply_games() for each day, and save it once.
+    """
+    try:
+        state = StreakState.load(filename)
+    except FileNotFoundError:
+        state = StreakState()
+    apply_games(state, games)
+    state.save(filename)
+    return state
@@ -0,0 +1,320 @@
+import sys
+import json
+import time
+import heapq
+import configargparse
+from .incremental import StreakState
+
+
+"""
+streak-finder live follows the blaseball.com streamData feed (a stream
+of server-sent events with the state of the current day's games) and keeps
+every team's current winning or losing streak up to date as games end:
+
+    streak-finder live --alert-at 5 --alert-at 10 --top 10
+
+It prints an alert when a streak reaches one of the --alert-at lengths,
+and when a streak becomes longer than the --top'th longest finished
+streak of all time.
+
+The streaks start from the game data set (or from a saved streak state,
+see incremental.py), and each completed game is added to them in constant
+time (see LiveTracker), instead of finding every streak again.
+
+Events can be recorded with --record and played back (faster than real
+time) by benchmarks/fake_blaseball_server.py --replay.
+"""
+
+
+API_URL = "https://www.blaseball.com"
+STREAM_PATH = "/events/streamData"
+
+# Game data columns needed to build the streak state
+STATE_GAME_COLUMNS = ['season', 'day', 'winningTeamNickname', 'losingTeamNickname', 'homeScore', 'awayScore']
+
+DEFAULT_ALERT_AT = [5, 10]
+DEFAULT_TOP = 10
+
+
+def state_game(game):
+    """
+    Turn a game from the feed (same format as the game data API)
+    into a game for StreakState.add_games. Returns None for tie games.
+    """
+    if game['homeScore'] == game['awayScore']:
+        return None
+    home_won = game['homeScore'] > game['awayScore']
+    return {
+        'season': game['season'],
+        'day': game['day'],
+        'winningTeamNickname': game['homeTeamNickname'] if home_won else game['awayTeamNickname'],
+        'losingTeamNickname': game['awayTeamNickname'] if home_won else game['homeTeamNickname'],
+        'homeScore': game['homeScore'],
+        'awayScore': game['awayScore']
+    }
+
+
+class LiveTracker(object):
+    """
+    Every team's current streak, updated one completed game at a time
+    (see add_game), plus the lengths of the longest finished winning and
+    losing streaks, kept in min-heaps of size top, so that each game is
+    checked for alerts without looking at any other streaks.
+    """
+    def __init__(self, state, alert_at=DEFAULT_ALERT_AT, top=DEFAULT_TOP):
+        """
+        state is a StreakState with the games played so far.
+        alert_at is a list of streak lengths to alert on, and top is the
+        number of longest streaks of all time to alert on (0 for none).
+        """
+        self.state = state
+        self.alert_at = set(alert_at)
+        self.top = top
+        # Games up to this (season, day) were already in the state
+        self.seeded_through = tuple(state.last) if state.last is not None else None
+        # team -> the latest season the team has played in
+        self.latest = {team: max(seasons) for team, seasons in state.teams.items() if len(seasons)>0}
+        # Ids of the completed games added for the latest day (the feed repeats them)
+        self.done_day = None
+        self.done = set()
+
+        # Lengths of the longest finished winning (True) and losing (False) streaks
+        self.finished = {True: [], False: []}
+        for team, seasons in state.teams.items():
+            for season, s in seasons.items():
+                for days in s["won"]:
+                    self._finish(True, len(days))
+                for days in s["lost"]:
+                    self._finish(False, len(days))
+                # The last streak of an earlier season is finished too
+                if s["current"] is not None and season < self.latest[team]:
+                    self._finish(s["current"]["won"], len(s["current"]["days"]))
+
+        # Teams whose current streak is already one of the longest (no new alert)
+        self.top_alerted = set()
+        for team in self.latest:
+            current = self.current_streak(team)
+            if current is not None and self._is_top(*current):
+                self.top_alerted.add(team)
+
+    def _finish(self, won, length):
+        """Add the length of a finished streak to the longest streaks"""
+        heap = self.finished[won]
+        if len(heap) < self.top:
+            heapq.heappush(heap, length)
+        elif self.top > 0 and length > heap[0]:
+            heapq.heapreplace(heap, length)
+
+    def _is_top(self, won, length):
+        """
+        Whether a streak is longer than the top'th longest finished streak
+        (a streak as long as that one comes after it, like a later streak
+        of the same length in the streak tables)
+        """
+        heap = self.finished[won]
+        return self.top > 0 and len(heap) >= self.top and length > heap[0]
+
+    def current_streak(self, team):
+        """Get (won, length) of a team's current streak, or None if the team has not played"""
+        season = self.latest.get(team)
+        if season is None:
+            return None
+        current = self.state.teams[team][season]["current"]
+        if current is None:
+            return None
+        return current["won"], len(current["days"])
+
+    def add_game(self, game):
+        """
+        Add a completed game from the feed to the streaks, and return
+        a list of alerts (see make_alert). Tie games, games that were
+        already added, and games from days before the latest day added
+        are skipped.
+        """
+        g = state_game(game)
+        if g is None:
+            return []
+        season, day = g['season'], g['day']
+        if self.seeded_through is not None and (season, day) <= self.seeded_through:
+            return []
+        if self.state.last is not None and (season, day) < tuple(self.state.last):
+            return []
+        if (season, day) != self.done_day:
+            self.done_day = (season, day)
+            self.done = set()
+        if game['id'] in self.done:
+            return []
+        self.done.add(game['id'])
+
+        teams = [(g['winningTeamNickname'], True), (g['losingTeamNickname'], False)]
+        previous = [(self.current_streak(team), self.latest.get(team)) for team, _ in teams]
+        self.state.add_games([g])
+
+        alerts = []
+        for (team, won), (streak, streak_season) in zip(teams, previous):
+            # This game ends the team's streak (or starts a new season)
+            if streak is not None and (streak_season < season or streak[0] != won):
+                self._finish(*streak)
+                self.top_alerted.discard(team)
+            self.latest[team] = season
+
+            _, length = self.current_streak(team)
+            if length in self.alert_at:
+                alerts.append(make_alert("streak", team, won, length, season, day))
+            if team not in self.top_alerted and self._is_top(won, length):
+                self.top_alerted.add(team)
+                rank = 1 + sum(1 for j in self.finished[won] if j >= length)
+                alerts.append(make_alert("top", team, won, length, season, day, rank))
+        return alerts
+
+    def add_event(self, data):
+        """
+        Add the completed games in one streamData event (the parsed JSON)
+        to the streaks, and return a list of alerts.
+        """
+        games = data.get("value", data).get("games", {})
+        alerts = []
+        for game in games.get("schedule", []):
+            if game.get("gameComplete"):
+                alerts += self.add_game(game)
+        return alerts
+
+
+def make_alert(kind, team, won, length, season, day, rank=None):
+    """
+    Make an alert dict, with 1-indexed season and day (as displayed).
+    kind is "streak" (the streak reached an --alert-at length)
+    or "top" (the streak is now one of the longest of all time, at rank).
+    """
+    alert = {
+        "alert": kind,
+        "team": team,
+        "winning": won,
+        "length": length,
+        "season": season+1,
+        "day": day+1
+    }
+    if rank is not None:
+        alert["rank"] = rank
+    return alert
+
+
+def format_alert(alert):
+    """Turn an alert dict into a line of text"""
+    line = "Season %d Day %d: %d Game %s Streak by the %s"%(
+        alert["season"], alert["day"], alert["length"],
+        "Winning" if alert["winning"] else "Losing", alert["team"]
+    )
+    if alert["alert"] == "top":
+        line += " is No. %d of all time"%(alert["rank"])
+    return line
+
+
+def load_state(filename=None):
+    """
+    Get the StreakState to start from: load it from filename if given,
+    otherwise build it from the game data set.
+    """
+    if filename:
+        return StreakState.load(filename)
+    from .games_cache import load_games
+    return StreakState.from_games(load_games(STATE_GAME_COLUMNS))
+
+
+def stream_events(url, record=None):
+    """
+    Read a server-sent event stream (reconnecting if the connection drops)
+    and yield the parsed JSON data of each event. If record is an open file,
+    each event is also written to it as a line of JSON with the time it
+    arrived (the format fake_blaseball_server.py --replay reads).
+    """
+    import sseclient
+    for event in sseclient.SSEClient(url):
+        if not event.data:
+            continue
+        try:
+            data = json.loads(event.data)
+        except ValueError:
+            continue
+        if record is not None:
+            record.write(json.dumps({"time": time.time(), "data": data}) + "\n")
+            record.flush()
+        yield data
+
+
+def main(sysargs = None):
+    """Follow the live feed and print streak alerts (streak-finder live)"""
+    if sysargs is None:
+        sysargs = sys.argv[1:]
+
+    p = configargparse.ArgParser(prog='streak-finder live')
+    p.add('-c',
+          '--config',
+          required=False,
+          is_config_file=True,
+          help='config file path')
+    p.add('--api-url',
+          required=False,
+          default=API_URL,
+          help='Base URL of the API with the streamData feed (defaults to %s)'%(API_URL))
+    p.add('--alert-at',
+          required=False,
+          type=int,
+          action='append',
+          help='Alert when a streak reaches this many games (use flag multiple times for multiple lengths, defaults to 5 and 10)')
+    p.add('--top',
+          required=False,
+          type=int,
+          default=DEFAULT_TOP,
+          help='Alert when a streak becomes one of the N longest of all time (defaults to %d, use 0 for no alerts)'%(DEFAULT_TOP))
+    p.add('--json',
+          action='store_true',
+          default=False,
+          help='Print alerts as JSON, one per line')
+    p.add('--state',
+          required=False,
+          type=str,
+          default='',
+          help='Start from a saved streak state file (defaults to building it from the game data)')
+    p.add('--save-state',
+          required=False,
+          type=str,
+          default='',
+          help='Save the streak state to this file on exit')
+    p.add('--record',
+          required=False,
+          type=str,
+          default='',
+          help='Append every event received to this file (for replaying with benchmarks/fake_blaseball_server.py)')
+    p.add('--max-events',
+          required=False,
+          type=int,
+          default=0,
+          help='Stop after this many events (defaults to 0, never stop)')
+    options = p.parse_args(sysargs)
+
+    print("Loading streaks", file=sys.stderr)
+    tracker = LiveTracker(load_state(options.state), options.alert_at or DEFAULT_ALERT_AT, options.top)
+
+    url = options.api_url.rstrip('/') + STREAM_PATH
+    print("Following %s"%(url), file=sys.stderr)
+    record = open(options.record, 'a') if options.record else None
+    try:
+        n_events = 0
+        for data in stream_events(url, record):
+            for alert in tracker.add_event(data):
+                print(json.dumps(alert) if options.json else format_alert(alert), flush=True)
+            n_events += 1
+            if options.max_events and n_events >= options.max_events:
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if record is not None:
+            record.close()
+        if options.save_state:
+            tracker.state.save(options.save_state)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+import os
+import sys
+import json
+import hashlib
+from io import StringIO
+from .util import cache_path, get_data_stamp
+
+
+"""
+The ResultCache class stores the output of streak-finder queries on disk,
+so running the same query again just prints the stored output, without
+loading pandas or the game data.
+
+Each result is stored in its own file, named by a hash of the query options
+(after defaults are filled in and divisions/leagues are turned into teams),
+the output format, and a stamp of the installed game data (see
+util.get_data_stamp), so results are never reused across data versions.
+When the cache grows past its size limit, the least recently used results
+are removed. Hit and miss counts are kept in the cache directory, as one
+line per lookup appended to a counts file, so that runs at the same time
+never lose each other's counts.
+
+Note: like util.py, this module is imported before a query runs,
+so it should not import pandas.
+"""
+
+
+RESULTS_DIR = "results"
+RESULT_SUFFIX = ".txt"
+# Counts file (one "hits" or "misses" line per lookup)
+COUNTS_LOG = "counts.log"
+# Counts file of older versions (read, but no longer written)
+STATS_JSON = "stats.json"
+
+DEFAULT_MAX_MB = 64
+
+
+class ResultCache(object):
+    """
+    On-disk cache of query output, with least recently used eviction.
+    """
+    def __init__(self, path=None, max_bytes=DEFAULT_MAX_MB*1024*1024):
+        """
+        path is the cache directory (a results directory in the cache
+        directory by default), max_bytes is the most space results can use.
+        """
+        if path is None:
+            path = os.path.join(cache_path(), RESULTS_DIR)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.counts_file = os.path.join(path, COUNTS_LOG)
+        self.stats_file = os.path.join(path, STATS_JSON)
+
+    def key(self, options):
+        """
+        Get the cache key for a query, given the options namespace
+        (after command.normalize_options has been called on it).
+        """
+        from . import __version__
+        query = {
+            # Duplicates are dropped, but order is kept: it is part of the output
+            "team": list(dict.fromkeys(options.team)),
+            "versus_team": list(dict.fromkeys(options.versus_team)),
+            "season": [str(j) for j in options.season],
+            "winning": bool(options.winning),
+            "min": options.min,
+            "top": getattr(options, 'top', 0) or 0,
+            "home": bool(getattr(options, 'home', False)),
+            "away": bool(getattr(options, 'away', False)),
+            "our_pitcher": list(dict.fromkeys(getattr(options, 'our_pitcher', None) or [])),
+            "versus_pitcher": list(dict.fromkeys(getattr(options, 'versus_pitcher', None) or [])),
+            "long": bool(options.long),
+            "fullname": bool(options.fullname),
+            "markdown": bool(options.markdown),
+            "matrix": bool(getattr(options, 'matrix', False)),
+            "csv": bool(getattr(options, 'csv', False)),
+            "data": self.data_stamp(options),
+            "version": __version__
+        }
+        return hashlib.sha1(json.dumps(query, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def data_stamp(self, options):
+        """Get a stamp of the game data a query reads (the array store's fingerprint, for --store)"""
+        store = getattr(options, 'store', '') or ''
+        if store:
+            from .array_store import ArrayStore
+            return ["store", store, ArrayStore(store).fingerprint]
+        return get_data_stamp()
+
+    def result_file(self, key):
+        return os.path.join(self.path, key + RESULT_SUFFIX)
+
+    def get(self, key):
+        """Get the stored output for a key, or None if it is not in the cache"""
+        result_file = self.result_file(key)
+        try:
+            with open(result_file, 'r', encoding='utf-8') as f:
+                text = f.read()
+        except OSError:
+            self._count("misses")
+            return None
+        # Mark the result as recently used
+        try:
+            os.utime(result_file)
+        except OSError:
+            pass
+        self._count("hits")
+        return text
+
+    def put(self, key, text):
+        """Store the output for a key, then evict old results if the cache is too big"""
+        data = text.encode('utf-8')
+        if len(data) > self.max_bytes:
+            return
+        try:
+            if not os.path.exists(self.path):
+                os.makedirs(self.path)
+            result_file = self.result_file(key)
+            tmp_file = "%s.%d.tmp"%(result_file, os.getpid())
+            with open(tmp_file, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_file, result_file)
+            self.evict()
+        except OSError:
+            # The cache is an optimization, so a read-only cache directory is not an error
+            pass
+
+    def evict(self):
+        """Remove the least recently used results until the cache fits in max_bytes"""
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith(RESULT_SUFFIX):
+                st = os.stat(os.path.join(self.path, name))
+                entries.append((st.st_mtime_ns, st.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass
+            total -= size
+
+    def stats(self):
+        """Get the hit and miss counts, and the number and total size of stored results"""
+        try:
+            with open(self.stats_file, 'r') as f:
+                stats = json.load(f)
+        except (OSError, ValueError):
+            stats = {}
+        counts = {"hits": stats.get("hits", 0), "misses": stats.get("misses", 0)}
+        try:
+            with open(self.counts_file, 'r') as f:
+                for line in f:
+                    # (a line without a newline is a write still in progress)
+                    name = line[:-1] if line.endswith("\n") else None
+                    if name in counts:
+                        counts[name] += 1
+        except OSError:
+            pass
+        sizes = []
+        if os.path.exists(self.path):
+            sizes = [
+                os.path.getsize(os.path.join(self.path, name))
+                for name in os.listdir(self.path) if name.endswith(RESULT_SUFFIX)
+            ]
+        return {
+            "hits": counts["hits"],
+            "misses": counts["misses"],
+            "results": len(sizes),
+            "bytes": sum(sizes)
+        }
+
+    def _count(self, name):
+        """
+        Add one to a counter, by appending a line to the counts file.
+        The line is written with a single append-mode write, so processes
+        counting at the same time never overwrite each other's counts
+        (there is no read-modify-write of a shared file).
+        """
+        try:
+            if not os.path.exists(self.path):
+                os.makedirs(self.path, exist_ok=True)
+            fd = os.open(self.counts_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, (name + "\n").encode('ascii'))
+            finally:
+                os.close(fd)
+        except OSError:
+            pass
+
+
+class TeeStdout(object):
+    """
+    A context manager that passes everything written to stdout through,
+    and also keeps a copy of it (see getvalue).
+    If writing to stdout fails (e.g., a closed pipe), complete is False.
+    """
+    def __enter__(self):
+        self._stdout = sys.stdout
+        self._copy = StringIO()
+        self.complete = True
+        sys.stdout = self
+        return self
+
+    def __exit__(self, *args):
+        sys.stdout = self._stdout
+
+    def write(self, s):
+        try:
+            self._stdout.write(s)
+        except BrokenPipeError:
+            self.complete = False
+            raise
+        return self._copy.write(s)
+
+    def flush(self):
+        try:
+            self._stdout.flush()
+        except BrokenPipeError:
+            self.complete = False
+            raise
+
+    def fileno(self):
+        return self._stdout.fileno()
+
+    def getvalue(self):
+        return self._copy.getvalue()
@@ -0,0 +1,309 @@
+import sys
+import json
+import time
+import argparse
+import threading
+import configargparse
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from .finder import StreakFinder, RECORD_GAME_COLUMNS
+from .streak_data import VENUE_GAME_COLUMNS, PITCHER_GAME_COLUMNS
+from .util import get_team_index, get_data_stamp, ENGINES
+
+
+"""
+The streak server loads the game data once and answers streak
+queries over a small local HTTP/JSON API:
+
+    streak-finder serve --port 8080
+
+    curl 'http://localhost:8080/streaks?team=Tigers&season=3&season=4&min=5'
+    curl 'http://localhost:8080/streaks?league=Evil&losing=1&min=8&long=1'
+    curl 'http://localhost:8080/health'
+
+Query parameters for /streaks mirror the command line flags:
+team, division, league, versus_team, versus_division, versus_league,
+season, our_pitcher, and versus_pitcher can be repeated; winning/losing,
+home/away, min, top, long (include each streak's games), and fullname
+(add team full names) take one value.
+
+Requests are handled on a thread pool. The server checks the game data
+files every few seconds and reloads the data when they change.
+"""
+
+
+# Query parameters that can be given more than once
+LIST_PARAMS = ['team', 'division', 'league', 'versus_team', 'versus_division', 'versus_league', 'season',
+               'our_pitcher', 'versus_pitcher']
+# Query parameters that are true/false flags
+FLAG_PARAMS = ['winning', 'losing', 'home', 'away', 'long', 'fullname']
+# Mutually exclusive groups of query parameters (same as the command line flags)
+EXCLUSIVE_PARAMS = [
+    ['winning', 'losing'],
+    ['home', 'away'],
+    ['team', 'division', 'league'],
+    ['versus_team', 'versus_division', 'versus_league']
+]
+
+TRUE_VALUES = ['1', 'true', 'yes', 'on', '']
+
+
+class QueryError(Exception):
+    pass
+
+
+class StreakServer(object):
+    """
+    Holds a warm StreakFinder plus a cache of recent responses,
+    and swaps in a new StreakFinder when the game data changes.
+    """
+    def __init__(self, engine='rle', reload_interval=5.0, cache_size=256):
+        self.engine = engine
+        self.reload_interval = reload_interval
+        self.cache_size = cache_size
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """(Re)load the game data and clear the response cache"""
+        stamp = get_data_stamp()
+        # Only load the game data columns the responses and filters use
+        finder = StreakFinder(engine=self.engine, columns=RECORD_GAME_COLUMNS + VENUE_GAME_COLUMNS + PITCHER_GAME_COLUMNS)
+        finder.team_index = get_team_index(reload=True)
+        # Load (or build) the streak table and the filter indexes before serving any queries
+        finder.games.streak_table
+        finder.games.venue_index
+        finder.games.pitcher_index
+        with self.lock:
+            self.stamp = stamp
+            self.finder = finder
+            self.responses = OrderedDict()
+            self.loaded_at = time.time()
+
+    def check_reload(self):
+        """Reload the game data if the data files have changed"""
+        if get_data_stamp() != self.stamp:
+            self.load()
+            return True
+        return False
+
+    def watch(self):
+        """Check the game data files for changes every reload_interval seconds (runs in a thread)"""
+        while True:
+            time.sleep(self.reload_interval)
+            try:
+                self.check_reload()
+            except Exception as e:
+                # Keep serving the data we already have
+                print("Error reloading game data: %s"%(e), file=sys.stderr)
+
+    def streaks(self, params):
+        """
+        Answer a streak query, given a dict of query parameters
+        (parameter name to list of values). Returns a JSON-ready dict.
+        """
+        with self.lock:
+            finder = self.finder
+            responses = self.responses
+
+        options = self.make_options(params, finder.team_index)
+        key = json.dumps(vars(options), sort_keys=True)
+        with self.lock:
+            if key in responses:
+                responses.move_to_end(key)
+                return responses[key]
+
+        result = finder.query(options)
+        records = result.to_records(games=options.long)
+        if options.fullname:
+            for record in records:
+                record["fullName"] = finder.team_index.full_name(record["team"])
+        response = {
+            "query": {
+                "teams": result.teams,
+                "versusTeams": result.versus_teams,
+                "seasons": result.seasons,
+                "winning": result.winning,
+                "min": result.min,
+                "top": result.top,
+                "venue": result.venue,
+                "ourPitchers": result.our_pitchers,
+                "versusPitchers": result.versus_pitchers
+            },
+            "count": len(records),
+            "streaks": records
+        }
+
+        with self.lock:
+            responses[key] = response
+            while len(responses) > self.cache_size:
+                responses.popitem(last=False)
+        return response
+
+    def make_options(self, params, team_index):
+        """
+        Turn query parameters into an options namespace like the one
+        command.main creates, validating them the way the command line
+        flags are validated.
+        """
+        from .command import normalize_options
+
+        unknown = set(params) - set(LIST_PARAMS + FLAG_PARAMS + ['min', 'top'])
+        if len(unknown)>0:
+            raise QueryError("Unknown query parameter(s): %s"%(", ".join(sorted(unknown))))
+        for group in EXCLUSIVE_PARAMS:
+            given = [j for j in group if j in params]
+            if len(given)>1:
+                raise QueryError("Query parameters are mutually exclusive: %s"%(", ".join(given)))
+
+        options = argparse.Namespace()
+        for name in LIST_PARAMS:
+            setattr(options, name, params.get(name))
+        for name in FLAG_PARAMS:
+            setattr(options, name, name in params and params[name][-1].lower() in TRUE_VALUES)
+        try:
+            options.min = int(params.get('min', ['3'])[-1])
+        except ValueError:
+            raise QueryError("min must be an integer")
+        try:
+            options.top = int(params.get('top', ['0'])[-1])
+        except ValueError:
+            raise QueryError("top must be an integer")
+        if options.top < 0:
+            raise QueryError("top must be 0 (all streaks) or more")
+
+        # Same choices as the command line flags
+        choices = {
+            'team': team_index.teams,
+            'versus_team': team_index.teams,
+            'division': team_index.divisions,
+            'versus_division': team_index.divisions,
+            'league': team_index.leagues,
+            'versus_league': team_index.leagues
+        }
+        for name, valid in choices.items():
+            for value in getattr(options, name) or []:
+                if value not in valid:
+                    raise QueryError("Invalid %s: %s"%(name, value))
+
+        # View options that do not apply to JSON output
+        options.short = not options.long
+        options.nickname = not options.fullname
+        options.text = True
+        options.markdown = False
+        options.output = ''
+        options.engine = self.engine
+
+        try:
+            normalize_options(options, team_index)
+        except Exception as e:
+            raise QueryError(str(e))
+        return options
+
+    def health(self):
+        with self.lock:
+            return {
+                "status": "ok",
+                "loadedAt": self.loaded_at,
+                "games": int(self.finder.games.df.shape[0]),
+                "cachedResponses": len(self.responses)
+            }
+
+
+class StreakRequestHandler(BaseHTTPRequestHandler):
+    """HTTP request handler for the streak server (set the server attribute streak_server)"""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query, keep_blank_values=True)
+        streak_server = self.server.streak_server
+        try:
+            if url.path == '/streaks':
+                self.send_json(200, streak_server.streaks(params))
+            elif url.path == '/health':
+                self.send_json(200, streak_server.health())
+            else:
+                self.send_json(404, {"error": "Not found: %s"%(url.path)})
+        except QueryError as e:
+            self.send_json(400, {"error": str(e)})
+        except Exception as e:
+            self.send_json(500, {"error": str(e)})
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def main(sysargs = None):
+    """Run the streak server (streak-finder serve)"""
+    if sysargs is None:
+        sysargs = sys.argv[1:]
+
+    p = configargparse.ArgParser(prog='streak-finder serve')
+    p.add('-c',
+          '--config',
+          required=False,
+          is_config_file=True,
+          help='config file path')
+    p.add('--host',
+          required=False,
+          default='127.0.0.1',
+          help='Address to listen on (defaults to 127.0.0.1)')
+    p.add('--port',
+          required=False,
+          type=int,
+          default=8080,
+          help='Port to listen on (defaults to 8080)')
+    p.add('--engine',
+          required=False,
+          choices=ENGINES,
+          default='rle',
+          help='Streak detection engine (see streak-finder --help)')
+    p.add('--reload-interval',
+          required=False,
+          type=float,
+          default=5.0,
+          help='Seconds between checks for updated game data (defaults to 5)')
+    p.add('--cache-size',
+          required=False,
+          type=int,
+          default=256,
+          help='Number of recent responses to keep in memory (defaults to 256)')
+    p.add('--verbose',
+          action='store_true',
+          default=False,
+          help='Log every request to stderr')
+    options = p.parse_args(sysargs)
+
+    streak_server = StreakServer(
+        engine=options.engine,
+        reload_interval=options.reload_interval,
+        cache_size=options.cache_size
+    )
+
+    watcher = threading.Thread(target=streak_server.watch, daemon=True)
+    watcher.start()
+
+    httpd = ThreadingHTTPServer((options.host, options.port), StreakRequestHandler)
+    httpd.streak_server = streak_server
+    httpd.verbose = options.verbose
+    print("Serving streaks on http://%s:%d/streaks"%(options.host, options.port), file=sys.stderr)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,11 @@
 import os
+import numpy as np
 import pandas as pd
-import blaseball_core_game_data as gd
+from concurrent.futures import ProcessPoolExecutor
+from .games_cache import load_games
+from .array_store import ArrayStore
+from .timings import Timings
+from .util import ENGINES
 
 
 """
@@ -11,22 +16,233 @@ necessary information.
 """
 
 
+# Game data columns needed to find streaks
+STREAK_GAME_COLUMNS = ['season', 'day', 'winningTeamNickname', 'losingTeamNickname']
+# Game data columns needed for the home/away and pitcher filters
+VENUE_GAME_COLUMNS = ['homeTeamNickname', 'awayTeamNickname']
+PITCHER_GAME_COLUMNS = ['winningPitcherName', 'losingPitcherName']
+
+# Process pools for --jobs, kept open between queries (see get_process_pool)
+_process_pools = {}
+
+
 class NoStreaksException(Exception):
     pass
 
-class StreakData(object):
+
+class TeamGames(object):
     """
-    Class representing a data frame with game data.
+    The games played by each of our teams (against any of the versus teams),
+    stored as positional index arrays into the game data frame instead of
+    as a copy of the data frame for each team.
+
+    All arrays have one entry per (team, game) pair and are sorted by
+    team, season, and day:
+    - slots: index of the team in the list of teams
+    - rows: position of the game in the game data frame
+    - parts: True if the game is part of a streak (our team won if
+      looking for winning streaks, or lost if looking for losing streaks)
+    """
+    def __init__(self, teams, slots, rows, parts):
+        self.teams = teams
+        self.slots = slots
+        self.rows = rows
+        self.parts = parts
+        # Where each team's block of games starts and ends
+        self._bounds = np.searchsorted(slots, np.arange(len(teams)+1))
+
+    def __getitem__(self, team):
+        """Get the positions of the games played by a team"""
+        i = self.teams.index(team)
+        return self.rows[self._bounds[i]:self._bounds[i+1]]
+
+    def __contains__(self, team):
+        return team in self.teams
+
+    def keys(self):
+        return list(self.teams)
+
+    def items(self):
+        return [(team, self[team]) for team in self.teams]
+
+
+class PositionIndex(object):
+    """
+    Inverted index from the values of a game data column (e.g., pitcher
+    names) to the positions of the games with that value, in order.
+    The positions for all values are kept in one array, sorted by value.
+    """
+    def __init__(self, values):
+        codes, uniques = pd.factorize(values)
+        self.value_codes = {value: code for code, value in enumerate(uniques)}
+        # Stable sort keeps the positions of each value in order
+        # (missing values have code -1, and end up before the first bound)
+        self.positions = np.argsort(codes, kind='stable')
+        self._bounds = np.searchsorted(codes[self.positions], np.arange(len(uniques)+1))
+
+    def __getitem__(self, value):
+        """Get the positions of the games with a value (empty if there are none)"""
+        code = self.value_codes.get(value)
+        if code is None:
+            return self.positions[:0]
+        return self.positions[self._bounds[code]:self._bounds[code+1]]
+
+    def lookup(self, values):
+        """Get the positions of the games with any of values, in order"""
+        return np.sort(np.concatenate([self[v] for v in dict.fromkeys(values)] + [self.positions[:0]]))
+
+
+class GameData(object):
     """
-    def __init__(self, options):
-        """Load the data set into self.df"""
-        self.df = pd.read_json(gd.get_games_data())
+    The game data set (tie games dropped), loaded once, plus lookups
+    that every streak query can share: integer codes for the winning
+    and losing team of every game, and an index of games by
+    (team, season, day).
+    """
+    def __init__(self, df=None, columns=None, store=None):
+        """
+        Load the data set into self.df, unless a data frame is given.
+        If columns is given, only those columns (plus the columns
+        needed to find streaks) are loaded.
+        If store (an ArrayStore, or the path of one) is given, self.df
+        is backed by the store's memory-mapped arrays instead (see array_store.py).
+        """
+        # Array store the game data is read from (None for other data)
+        self.store = None
+        # Fingerprint of the game data set (None for other data frames).
+        # It is never taken from a data frame that is passed in: pandas
+        # copies attrs to every filtered or reordered frame, so a subset of
+        # the loaded data set would carry the whole data set's fingerprint
+        # (and get its streak table, with row positions of the whole set).
+        self.fingerprint = None
+        if store is not None:
+            self.store = store if isinstance(store, ArrayStore) else ArrayStore(store)
+            if columns is None:
+                columns = self.store.columns
+            df = self.store.frame(list(dict.fromkeys(STREAK_GAME_COLUMNS + list(columns))))
+            self.fingerprint = self.store.fingerprint
+        elif df is None:
+            if columns is not None:
+                columns = list(dict.fromkeys(STREAK_GAME_COLUMNS + list(columns)))
+            df = load_games(columns)
+            self.fingerprint = df.attrs.get('fingerprint')
+        self.df = df.reset_index(drop=True)
+        n = self.df.shape[0]
+
+        if self.store is not None:
+            # The store's team codes are shared by the winning and losing
+            # team columns, so they are used as they are (without reading them)
+            self.team_names = np.array(self.store.team_names, dtype=object)
+            self.winner_codes = self.store.array('winningTeamNickname')
+            self.loser_codes = self.store.array('losingTeamNickname')
+            self.seasons = self.store.seasons
+        else:
+            # Encode the team on each side of every game as an integer code,
+            # so filtering on teams does not need any string comparisons
+            codes, self.team_names = pd.factorize(np.concatenate([
+                np.asarray(self.df['winningTeamNickname']),
+                np.asarray(self.df['losingTeamNickname'])
+            ]))
+            self.winner_codes = codes[:n]
+            self.loser_codes = codes[n:]
+            # All (0-indexed) seasons in the data set
+            self.seasons = sorted(int(j) for j in pd.unique(self.df['season']))
+        self.team_codes = {team: code for code, team in enumerate(self.team_names)}
+
+        # Lookup of (team, season, day) to game (see game_index)
+        self._game_index = None
+        # Every streak of every team (see streak_table)
+        self._streak_table = None
+        # Inverted indexes for the home/away and pitcher filters (see venue_index, pitcher_index)
+        self._venue_index = None
+        self._pitcher_index = None
+
+    def season_rows(self, seasons):
+        """
+        Get the positions of the games in any of seasons (0-indexed), in order.
+        Games in an array store are sorted by season, so this only reads
+        the rows of those seasons.
+        """
+        if self.store is not None:
+            return self.store.season_rows(seasons)
+        return np.flatnonzero(np.isin(self.df['season'].values, seasons))
+
+    @property
+    def game_index(self):
+        """
+        Dict mapping (team nickname, season, day) to the position
+        of that team's game on that day in self.df.
+        This is built the first time it is used.
+        """
+        if self._game_index is None:
+            seasons = self.df['season'].values.tolist()
+            days = self.df['day'].values.tolist()
+            positions = range(self.df.shape[0])
+            self._game_index = {}
+            for key in ['winningTeamNickname', 'losingTeamNickname']:
+                teams = self.df[key].values.tolist()
+                self._game_index.update(zip(zip(teams, seasons, days), positions))
+        return self._game_index
+
+    @property
+    def venue_index(self):
+        """
+        Dict mapping 'home' and 'away' to a PositionIndex of the games
+        by the nickname of the home (or away) team.
+        This is built the first time it is used.
+        """
+        if self._venue_index is None:
+            self._venue_index = {
+                'home': PositionIndex(self.df['homeTeamNickname']),
+                'away': PositionIndex(self.df['awayTeamNickname'])
+            }
+        return self._venue_index
+
+    @property
+    def pitcher_index(self):
+        """
+        Dict mapping the winning and losing pitcher columns
+        to a PositionIndex of the games by pitcher name.
+        This is built the first time it is used.
+        """
+        if self._pitcher_index is None:
+            self._pitcher_index = {col: PositionIndex(self.df[col]) for col in PITCHER_GAME_COLUMNS}
+        return self._pitcher_index
 
-        # Drop tie games
-        self.df = self._filter_ties()
+    @property
+    def streak_table(self):
+        """
+        StreakTable with every winning and losing streak of every team
+        (see streak_table.py). This is loaded (or built) the first time it is used.
+        """
+        if self._streak_table is None:
+            from .streak_table import get_streak_table
+            self._streak_table = get_streak_table(self)
+        return self._streak_table
+
+
+class StreakData(object):
+    """
+    Class representing a streak query on a data frame with game data.
+    """
+    def __init__(self, options, games=None, timings=None):
+        """
+        Set up a streak query. If games (a GameData object) is not given,
+        the data set is loaded. To run many queries on the same data,
+        load a GameData object once and pass it to each StreakData.
+        The time each stage takes is recorded in timings (a Timings object,
+        a new one if not given).
+        """
+        self.timings = timings if timings is not None else Timings()
+        if games is None:
+            with self.timings.stage("load") as stage:
+                games = GameData()
+                stage.rows = games.df.shape[0]
+        self.games = games
+        self.df = games.df
 
-        # Fiter data based on seasons provided by user (and store seasons for later)
-        self.df, self.seasons = self._season_filter_df(options.season)
+        # Store the seasons to filter game data on
+        self.seasons = self._season_filter(options.season)
 
         # Winning or losing streak
         self.winning = options.winning
@@ -34,70 +250,402 @@ class StreakData(object):
         # Min number of wins for streak
         self.min = options.min
 
+        # Only games where our team was at home (or away)
+        self.home = getattr(options, 'home', False)
+        self.away = getattr(options, 'away', False)
+        if self.home and self.away:
+            raise Exception("Error: choose one of home and away")
+
+        # Only games where our team's (or the versus team's) pitcher was one of these
+        self.our_pitchers = list(getattr(options, 'our_pitcher', None) or [])
+        self.versus_pitchers = list(getattr(options, 'versus_pitcher', None) or [])
+
+        # Only keep the longest top streaks (0 means keep all of them)
+        self.top = getattr(options, 'top', 0) or 0
+        if self.top < 0:
+            raise Exception("Error: the number of top streaks must be 0 (all streaks) or more")
+
+        # Streak detection engine (rle is vectorized, loop is the original row-by-row version)
+        self.engine = getattr(options, 'engine', 'rle')
+        if self.engine not in ENGINES:
+            raise Exception("Error: unrecognized streak engine %s, choose from: %s"%(self.engine, ", ".join(ENGINES)))
+
+        # Answer queries against all opponents from the streak table
+        self.streak_table = getattr(options, 'streak_table', True)
+
+        # Number of worker processes for the rle engine (0 means one per core)
+        self.jobs = getattr(options, 'jobs', 1)
+        if self.jobs == 0:
+            self.jobs = os.cpu_count() or 1
+        if self.jobs < 0:
+            raise Exception("Error: the number of jobs must be 0 (one per core) or more")
+
         # Get all data about games with our teams and versus teams
-        self.our_teams = options.team
-        self.their_teams = options.versus_team
+        # (dropping duplicates, e.g., from overlapping divisions)
+        self.our_teams = list(dict.fromkeys(options.team))
+        self.their_teams = list(dict.fromkeys(options.versus_team))
 
         if self.winning:
             self.our_key = 'winningTeamNickname'
             self.their_key = 'losingTeamNickname'
+            self.our_codes = games.winner_codes
+            self.their_codes = games.loser_codes
+            self.our_pitcher_key = 'winningPitcherName'
+            self.their_pitcher_key = 'losingPitcherName'
         else:
             self.our_key = 'losingTeamNickname'
             self.their_key = 'winningTeamNickname'
+            self.our_codes = games.loser_codes
+            self.their_codes = games.winner_codes
+            self.our_pitcher_key = 'losingPitcherName'
+            self.their_pitcher_key = 'winningPitcherName'
+        self.team_names = games.team_names
+        self.team_codes = games.team_codes
 
-    def _filter_ties(self):
-        mask = self.df.loc[self.df['homeScore']!=self.df['awayScore']]
-        return mask
+    @classmethod
+    def from_store(cls, options, path, timings=None):
+        """
+        Set up a streak query on an array store (see array_store.py).
+        Only the columns the query needs are opened, and they are read
+        straight from the memory-mapped arrays, so memory use is bounded
+        by the seasons the query looks at, not by the size of the store.
+        """
+        timings = timings if timings is not None else Timings()
+        with timings.stage("load") as stage:
+            games = GameData(columns=filter_columns(options), store=path)
+            stage.rows = games.df.shape[0]
+        return cls(options, games=games, timings=timings)
 
-    def _season_filter_df(self, user_input_seasons):
+    def _season_filter(self, user_input_seasons):
         """
-        Filter game data on season number(s).
+        Get the season number(s) to filter game data on.
         The seasons provided in the input are one-indexed.
         The dataframe's season numbers (from the blaseball.com API) are zero-indexed.
         """
         if 'all' in user_input_seasons:
             # Get all unique 0-indexed season values
-            seasons = list(set(self.df['season'].values))
+            seasons = list(self.games.seasons)
         else:
             # User provides 1-indexed season values, so convert to 0-indexed
             seasons = [int(s)-1 for s in user_input_seasons]
-        mask = self.df.loc[self.df['season'].isin(seasons)]
-        return mask, seasons
+        return seasons
+
+    @property
+    def game_index(self):
+        """See GameData.game_index"""
+        return self.games.game_index
 
     def find_streaks(self):
         """
         Find streaks, compile a dataframe with streak info,
         and return it along with team name-team game data dict.
+        Queries against all opponents are answered from the streak table
+        (see GameData.streak_table), and return None instead of the team data.
         """
+        if self.use_streak_table():
+            with self.timings.stage("streak_table") as stage:
+                table = self.games.streak_table
+                stage.rows = sum(len(t['length']) for t in table.tables.values())
+            with self.timings.stage("lookup") as stage:
+                streak_df = table.streaks(self.games, self.our_teams, self.seasons, self.winning, self.min, self.top)
+                stage.rows = streak_df.shape[0]
+                streak_df = self.sort_streaks(streak_df)
+            return (streak_df, None)
+
         # Filter step
-        our_data = self.filter_step(self.our_teams, self.their_teams)
+        with self.timings.stage("filter") as stage:
+            our_data = self.filter_step(self.our_teams, self.their_teams)
+            stage.rows = len(our_data.rows)
         # Data aggregation step
-        streak_df = self.aggregate_step(our_data)
+        with self.timings.stage("aggregate") as stage:
+            streak_df = self.aggregate_step(our_data)
+            stage.rows = streak_df.shape[0]
 
         return (streak_df, our_data)
 
     def filter_step(self, our_teams, their_teams):
         """
-        Filter game data on team(s)
+        Filter game data on season(s) and team(s), in a single pass for all of our teams.
+
+        Each game in the seasons we are looking at is stacked as two rows, one from
+        the point of view of each team (team, opponent, part of streak), and rows where
+        the team is one of our teams and the opponent is one of their teams are kept.
+        Stacked rows are numbered by the position of the game in self.df (plus the
+        number of games, for the other team). Returns a TeamGames object with the
+        positions of each team's games in self.df.
+
+        The home/away and pitcher filters are applied by intersecting the kept
+        rows with the rows each filter allows (see game_filter_rows).
         """
-        our_key = self.our_key
-        their_key = self.their_key
-        our_data = {}
-        for our_team in our_teams:
-            our_mask = (self.df[our_key]==our_team) & (self.df[their_key].isin(their_teams))
-            their_mask = (self.df[our_key].isin(their_teams)) & (self.df[their_key]==our_team)
-            our_df = self.df.loc[our_mask | their_mask]
-            our_data[our_team] = our_df
-        return our_data
+        n = self.df.shape[0]
+        n_codes = len(self.team_names)
+
+        # Map team codes to the team's slot in our_teams (-1 if not one of ours).
+        # Code n_codes, for missing team names, is never one of ours or theirs.
+        our_slot = np.full(n_codes+1, -1)
+        for i, our_team in enumerate(our_teams):
+            if our_team in self.team_codes:
+                our_slot[self.team_codes[our_team]] = i
+        is_theirs = np.zeros(n_codes+1, dtype=bool)
+        is_theirs[[self.team_codes[t] for t in their_teams if t in self.team_codes]] = True
+
+        # Only look at games in the seasons we are looking at
+        season_rows = self.games.season_rows(self.seasons)
+        our_codes, their_codes = self.our_codes[season_rows], self.their_codes[season_rows]
+
+        # First the games from the point of view of the team with our key
+        # (part of the streak), then from the point of view of the other team
+        team = np.concatenate([our_codes, their_codes]).astype(np.intp)
+        opponent = np.concatenate([their_codes, our_codes]).astype(np.intp)
+        stacked = np.concatenate([season_rows, season_rows + n])
+        # Missing team names have code -1, which would index the last team
+        team[team < 0] = n_codes
+        opponent[opponent < 0] = n_codes
+
+        slots = our_slot[team]
+        keep = np.flatnonzero((slots >= 0) & is_theirs[opponent])
+        slots, stacked = slots[keep], stacked[keep]
+        # (stacked rows are in order, so this keeps them in order)
+        for allowed in self.game_filter_rows(our_teams):
+            allowed = np.isin(stacked, allowed, assume_unique=True)
+            slots, stacked = slots[allowed], stacked[allowed]
+        parts = stacked < n
+        rows = np.where(parts, stacked, stacked - n)
+
+        # Sort by team slot, then season, then day (lexsort is stable, last key is primary)
+        order = np.lexsort((
+            self.df['day'].values[rows],
+            self.df['season'].values[rows],
+            slots
+        ))
+        return TeamGames(list(our_teams), slots[order], rows[order], parts[order])
+
+    def has_game_filters(self):
+        """Whether any of the home/away and pitcher filters are set"""
+        return self.home or self.away or len(self.our_pitchers)>0 or len(self.versus_pitchers)>0
+
+    def game_filter_rows(self, our_teams):
+        """
+        Get the rows of filter_step's stacked games (first n rows from the point
+        of view of the team with our key, last n from the other team) that each
+        of the home/away and pitcher filters allows, using the inverted indexes
+        of GameData instead of comparing names in every game.
+        Returns a list with a sorted array of rows for each filter that is set.
+        """
+        n = self.df.shape[0]
+        filters = []
+        if self.home or self.away:
+            index = self.games.venue_index['home' if self.home else 'away']
+            allowed = [index.positions[:0]]
+            for team in our_teams:
+                if team in self.team_codes:
+                    positions = index[team]
+                    # Use the bottom half row if the team is not on our key in that game
+                    allowed.append(positions + n*(self.our_codes[positions]!=self.team_codes[team]))
+            filters.append(np.sort(np.concatenate(allowed)))
+        if len(self.our_pitchers)>0 or len(self.versus_pitchers)>0:
+            index = self.games.pitcher_index
+            # Our team's pitcher is on our key in the top half, and on their key in the bottom half
+            if len(self.our_pitchers)>0:
+                filters.append(np.concatenate([
+                    index[self.our_pitcher_key].lookup(self.our_pitchers),
+                    index[self.their_pitcher_key].lookup(self.our_pitchers) + n
+                ]))
+            if len(self.versus_pitchers)>0:
+                filters.append(np.concatenate([
+                    index[self.their_pitcher_key].lookup(self.versus_pitchers),
+                    index[self.our_pitcher_key].lookup(self.versus_pitchers) + n
+                ]))
+        return filters
+
+    def find_head_to_head(self):
+        """
+        Find the longest and current head-to-head streak of each of our
+        teams against each of their teams (see head_to_head_step).
+        """
+        with self.timings.stage("head_to_head") as stage:
+            longest, current, games = self.head_to_head_step(self.our_teams, self.their_teams)
+            stage.rows = int(np.count_nonzero(games))
+        return longest, current, games
+
+    def head_to_head_step(self, our_teams, their_teams):
+        """
+        Find head-to-head streaks for every pair of teams in one pass.
+
+        The games between one of our teams and one of their teams are sorted
+        by pair of teams (in either order), season, and day. A new run starts
+        wherever the pair changes, or the team on our key (the winner if looking
+        for winning streaks, the loser if looking for losing streaks) changes.
+        Runs carry over from one season to the next, since a pair of teams only
+        plays a few games each season.
+
+        Returns three arrays with one row per team in our_teams and one column
+        per team in their_teams: the longest streak of the team against the
+        opponent, its current streak (the run that includes the last game
+        the two teams played, 0 if the opponent has it), and the number of
+        games the two teams played.
+        """
+        if self.has_game_filters():
+            raise Exception("Error: the head-to-head matrix can not be filtered on home/away or pitchers")
+        n_codes = len(self.team_names)
+
+        # Teams not in the game data get code n_codes (an empty row and column)
+        our_idx = np.array([self.team_codes.get(t, n_codes) for t in our_teams], dtype=int)
+        their_idx = np.array([self.team_codes.get(t, n_codes) for t in their_teams], dtype=int)
+        is_ours = np.zeros(n_codes+1, dtype=bool)
+        is_ours[our_idx] = True
+        is_theirs = np.zeros(n_codes+1, dtype=bool)
+        is_theirs[their_idx] = True
+
+        # team is the team on our key (part of the streak), opp is the other team
+        # (as plain integers: array store codes can be too small to make pair codes)
+        season_rows = self.games.season_rows(self.seasons)
+        team = self.our_codes[season_rows].astype(np.intp)
+        opp = self.their_codes[season_rows].astype(np.intp)
+        # Games with a missing team name (code -1) are dropped first,
+        # since code -1 would index the last team
+        known = np.flatnonzero((team >= 0) & (opp >= 0))
+        team, opp, season_rows = team[known], opp[known], season_rows[known]
+        keep = np.flatnonzero((is_ours[team] & is_theirs[opp]) | (is_ours[opp] & is_theirs[team]))
+        team, opp, keep = team[keep], opp[keep], season_rows[keep]
+
+        # Same code for a pair of teams either way around
+        pair = np.minimum(team, opp)*n_codes + np.maximum(team, opp)
+        order = np.lexsort((
+            self.df['day'].values[keep],
+            self.df['season'].values[keep],
+            pair
+        ))
+        team, opp, pair = team[order], opp[order], pair[order]
+
+        longest = np.zeros((n_codes+1, n_codes+1), dtype=np.int64)
+        current = np.zeros((n_codes+1, n_codes+1), dtype=np.int64)
+        games = np.zeros((n_codes+1, n_codes+1), dtype=np.int64)
+        n = len(team)
+        if n > 0:
+            new_run = np.empty(n, dtype=bool)
+            new_run[0] = True
+            new_run[1:] = (pair[1:]!=pair[:-1]) | (team[1:]!=team[:-1])
+            starts = np.flatnonzero(new_run)
+            lengths = np.diff(np.append(starts, n))
+            np.maximum.at(longest, (team[starts], opp[starts]), lengths)
+
+            # The last run of each pair is that pair's current streak
+            last = np.append(pair[starts[1:]]!=pair[starts[:-1]], True)
+            current[team[starts[last]], opp[starts[last]]] = lengths[last]
+
+            np.add.at(games, (team, opp), 1)
+            np.add.at(games, (opp, team), 1)
+
+        cells = np.ix_(our_idx, their_idx)
+        return longest[cells], current[cells], games[cells]
 
     def aggregate_step(self, our_data):
         """
         Aggregate wins into streaks, and return a data frame with streak info
         """
+        if self.engine == 'loop':
+            streaks = self._aggregate_loop(our_data)
+        else:
+            streaks = self._aggregate_rle(our_data)
+        return self.sort_streaks(streaks)
+
+    def sort_streaks(self, streaks):
+        """
+        Sort streaks longest first, then by season and start day
+        (and keep only the first self.top, if set)
+        """
+        if streaks.shape[0]==0:
+            raise NoStreaksException("No streaks found")
+        streaks = streaks.sort_values(['Streak Length', 'Streak Season', 'Streak Start'], ascending=[False, True, True])
+        if self.top:
+            streaks = streaks.head(self.top)
+        return streaks
+
+    def use_streak_table(self):
+        """
+        Whether this query can be answered from the streak table:
+        the rle engine, against every team in the game data,
+        with no home/away or pitcher filters, and not on an array store
+        (the table covers every game, which would read the whole store).
+        """
+        if self.engine != 'rle' or not self.streak_table or self.has_game_filters():
+            return False
+        if self.games.store is not None:
+            return False
+        return set(self.their_teams).issuperset(self.team_names)
+
+    def _aggregate_rle(self, our_data):
+        """
+        Find streaks for all teams and seasons at once using run-length encoding.
+
+        The games in our_data are sorted by team, season, and day. A new run starts
+        wherever the team, the season, or the part-of-streak flag changes; runs of
+        streak games at least self.min long are streaks.
+
+        If self.jobs is more than 1, the games are split into that many shards
+        (never splitting a team's season) and the shards are run on a process pool.
+
+        If self.top is set, only the top streaks are kept (see top_runs), before
+        their days and game rows are collected.
+        """
+        seasons = self.df['season'].values[our_data.rows]
+        days = self.df['day'].values[our_data.rows]
+
+        if self.jobs > 1:
+            starts, lengths, streak_days = self._find_runs_parallel(our_data, seasons, days)
+        else:
+            starts, lengths, streak_days = find_streak_runs(our_data.slots, seasons, days, our_data.parts, self.min, self.top)
+        if len(starts)==0:
+            return pd.DataFrame()
+
+        return pd.DataFrame({
+            "Team Name": [our_data.teams[j] for j in our_data.slots[starts]],
+            "Streak Length": lengths,
+            "Streak Season": seasons[starts].astype(np.int64),
+            "Streak Start": days[starts].astype(np.int64), # makes sorting easier
+            "Streak Days": streak_days,
+            "Game Rows": [our_data.rows[s:s+n] for s, n in zip(starts, lengths)]
+        })
+
+    def _find_runs_parallel(self, our_data, seasons, days):
+        """
+        Run find_streak_starts on shards of the games in a process pool.
+        Workers get plain NumPy arrays and send back only the start and
+        length arrays of their streaks (not the days of each streak), and
+        the shards are put back together in order, so the result is the same
+        as a single find_streak_runs call. With self.top, each worker keeps
+        its own top streaks, and the top streaks of all shards are picked
+        from those.
+        """
+        slots, parts = our_data.slots, our_data.parts
+        bounds = shard_bounds(slots, seasons, self.jobs)
+        pool = get_process_pool(self.jobs)
+        futures = [
+            pool.submit(find_streak_starts, slots[a:b], seasons[a:b], days[a:b], parts[a:b], self.min, self.top)
+            for a, b in zip(bounds[:-1], bounds[1:])
+        ]
+        starts, lengths = [], []
+        for a, future in zip(bounds[:-1], futures):
+            shard_starts, shard_lengths = future.result()
+            starts.append(shard_starts + a)
+            lengths.append(shard_lengths)
+        starts, lengths = np.concatenate(starts), np.concatenate(lengths)
+        if self.top:
+            keep = top_runs(lengths, seasons[starts], days[starts], self.top)
+            starts, lengths = starts[keep], lengths[keep]
+        return starts, lengths, streak_day_lists(days, starts, lengths)
+
+    def _aggregate_loop(self, our_data):
+        """
+        Find streaks by iterating over each team's games one row at a time.
+        This is the original implementation, kept to check the rle engine against.
+        """
         our_key = self.our_key
         their_key = self.their_key
+        team_dfs = {}
         for our_team in self.our_teams:
-            our_df = our_data[our_team]
+            our_df = self.df.iloc[our_data[our_team]]
             if our_df.shape[0]==0:
                 continue
 
@@ -106,52 +654,174 @@ class StreakData(object):
             postreak_lambda = lambda row: 1 if row[our_key]==our_team else 0
             postreak_col = our_df.apply(postreak_lambda, axis=1)
             our_df = our_df.assign(**{'partOfStreak': postreak_col.values})
-            our_data[our_team] = our_df
+            team_dfs[our_team] = our_df
 
-        # As we find streaks, add them to a dataframe with colums:
+        # As we find streaks, add them to a list of rows with colums:
         # - Streaking Team Name (str)
         # - Streak Length (int)
         # - Streak Days (list)
-        streaks = pd.DataFrame()
+        # - Game Rows (positions of the games in self.df)
+        streaks = []
 
         for our_team in self.our_teams:
-            our_df = our_data[our_team]
+            if our_team not in team_dfs:
+                continue
+            our_df = team_dfs[our_team]
 
             # Need to iterate over each season
-            #this_season = self.seasons[0]
             for this_season in self.seasons:
 
                 our_season_df = our_df.loc[our_df['season']==this_season]
+                our_season_df = our_season_df.sort_values('day', kind='mergesort')
 
                 streak_length = 0
                 streak_days = []
-                for i, row in our_season_df.iterrows():
-                    # Note: we need to handle multiple seasons
-                    # Either we filter the DF and iterate over unique season values here,
-                    # or we do it somewhere else...
-                    # What about teams? Do we iterate over teams?
-                    if row['partOfStreak']==1:
+                # Iterate over each game, plus one extra step to close out
+                # a streak that is still going at the end of the season
+                rows = [row for _, row in our_season_df.iterrows()] + [None]
+                for row in rows:
+                    if row is not None and row['partOfStreak']==1:
                         # The streak continues!
                         # Increase streak counter by 1
                         streak_length += 1
                         streak_days.append(row['day'])
                     else:
                         # End of the streak
-                        if len(streak_days)>=self.min:
-                            # Add it to a new row in our streaks dataframe
-                            new_row = pd.DataFrame({
+                        if streak_days and len(streak_days)>=self.min:
+                            game_rows = [self.game_index[(our_team, this_season, d)] for d in streak_days]
+                            streaks.append({
                                 "Team Name": our_team,
                                 "Streak Length": streak_length,
                                 "Streak Season": this_season,
                                 "Streak Start": streak_days[0], # makes sorting easier
-                                "Streak Days": [streak_days]
+                                "Streak Days": streak_days,
+                                "Game Rows": np.array(game_rows)
                             })
-                            streaks = streaks.append(new_row)
                         # Reset
                         streak_length = 0
                         streak_days = []
-        if streaks.shape[0]==0:
-            raise NoStreaksException("No streaks found")
-        streaks = streaks.sort_values(['Streak Length', 'Streak Season', 'Streak Start'], ascending=[False, True, True])
-        return streaks
+        return pd.DataFrame(streaks)
+
+
+def filter_columns(options):
+    """
+    Get the game data columns needed for the home/away
+    and pitcher filters set in an options namespace.
+    """
+    columns = []
+    if getattr(options, 'home', False) or getattr(options, 'away', False):
+        columns += VENUE_GAME_COLUMNS
+    if getattr(options, 'our_pitcher', None) or getattr(options, 'versus_pitcher', None):
+        columns += PITCHER_GAME_COLUMNS
+    return columns
+
+
+def find_runs(team_codes, seasons, parts, min_length):
+    """
+    Run-length encode the part-of-streak flags, given arrays
+    sorted by team and season. Returns the start position
+    and length of every run of streak games (parts==True)
+    that is at least min_length games long.
+    """
+    n = len(parts)
+    if n==0:
+        return np.array([], dtype=int), np.array([], dtype=int)
+
+    # A run starts on the first game, and wherever the team,
+    # the season, or the part-of-streak flag changes
+    new_run = np.empty(n, dtype=bool)
+    new_run[0] = True
+    new_run[1:] = (team_codes[1:]!=team_codes[:-1]) | (seasons[1:]!=seasons[:-1]) | (parts[1:]!=parts[:-1])
+
+    starts = np.flatnonzero(new_run)
+    lengths = np.diff(np.append(starts, n))
+
+    keep = parts[starts] & (lengths>=max(min_length, 1))
+    return starts[keep], lengths[keep]
+
+
+def find_streak_starts(team_codes, seasons, days, parts, min_length, top=0):
+    """
+    Find streaks with find_runs, given arrays sorted by team, season,
+    and day. Returns the start position and length of each streak.
+    If top is set, only the top streaks are returned (see top_runs).
+    (This is what the process pool workers run for --jobs.)
+    """
+    starts, lengths = find_runs(team_codes, seasons, parts, min_length)
+    if top:
+        keep = top_runs(lengths, seasons[starts], days[starts], top)
+        starts, lengths = starts[keep], lengths[keep]
+    return starts, lengths
 
+
+def streak_day_lists(days, starts, lengths):
+    """Get a list of the days in each streak, from the streaks' start positions and lengths"""
+    # Slicing one list is much faster than converting each slice of the array
+    days = days.tolist()
+    return [days[s:s+n] for s, n in zip(starts.tolist(), lengths.tolist())]
+
+
+def find_streak_runs(team_codes, seasons, days, parts, min_length, top=0):
+    """
+    Find streaks with find_streak_starts, given arrays sorted by team,
+    season, and day. Returns the start position and length of each streak,
+    plus a list of the days in each streak.
+    """
+    starts, lengths = find_streak_starts(team_codes, seasons, days, parts, min_length, top)
+    return starts, lengths, streak_day_lists(days, starts, lengths)
+
+
+def top_runs(lengths, seasons, starts, top):
+    """
+    Pick the top streaks: the first top streaks when sorted longest first,
+    then by season and start day, with ties kept in their original order
+    (the same as StreakData.sort_streaks). Returns their positions in
+    the given arrays, in the original order.
+
+    The length of the top-th longest streak is found first (without
+    sorting), and only streaks at least that long are sorted.
+    """
+    n = len(lengths)
+    if top <= 0 or n <= top:
+        return np.arange(n)
+    # Shorter streaks than this can not make the list
+    cutoff = np.partition(lengths, n-top)[n-top]
+    candidates = np.flatnonzero(lengths >= cutoff)
+    # lexsort is stable, so ties stay in their original order
+    order = np.lexsort((
+        starts[candidates],
+        seasons[candidates],
+        -lengths[candidates].astype(np.int64)
+    ))
+    return np.sort(candidates[order[:top]])
+
+
+def shard_bounds(team_codes, seasons, n_shards):
+    """
+    Split arrays sorted by team and season into (at most) n_shards
+    pieces of about the same size, cutting only where the team or the
+    season changes. Returns the positions where the pieces start,
+    plus the total length at the end.
+    """
+    n = len(team_codes)
+    if n==0:
+        return np.array([0, 0])
+    # Positions where a (team, season) group starts
+    groups = np.flatnonzero(np.concatenate([
+        [True],
+        (team_codes[1:]!=team_codes[:-1]) | (seasons[1:]!=seasons[:-1])
+    ]))
+    targets = (np.arange(1, n_shards)*n)//n_shards
+    cuts = groups[np.minimum(np.searchsorted(groups, targets), len(groups)-1)]
+    return np.unique(np.concatenate([[0], cuts[cuts>0], [n]]))
+
+
+def get_process_pool(jobs):
+    """
+    Get a process pool with the given number of workers. Pools are
+    created the first time they are needed and then reused, so a
+    session running many queries only starts its workers once.
+    """
+    if jobs not in _process_pools:
+        _process_pools[jobs] = ProcessPoolExecutor(max_workers=jobs)
+    return _process_pools[jobs]
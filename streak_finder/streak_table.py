@@ -0,0 +1,186 @@
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from .util import cache_path
+
+
+"""
+The StreakTable class holds every winning and losing streak (of any
+length) by every team in every season of the game data set. Queries
+against all opponents (most queries) are answered by filtering this
+table on team, season, and length, instead of finding the streaks again.
+
+The table is built once per version of the game data and stored in the
+cache directory, keyed on the game data fingerprint (see games_cache.py),
+so it is rebuilt whenever the game data changes.
+"""
+
+
+STREAK_TABLE_NPZ = "streak_table.npz"
+META_KEY = "__meta__"
+
+# Arrays stored for each of the winning and losing tables
+TABLE_ARRAYS = ['team', 'season', 'start', 'length', 'offset', 'rows']
+
+
+class StreakTable(object):
+    """
+    Every winning and losing streak by every team in every season.
+
+    For each of winning (True) and losing (False), self.tables[winning]
+    is a dict of arrays with one entry per streak, sorted by team, season,
+    and start day:
+    - team: index of the team in self.team_names
+    - season, start, length: season (0-indexed), first day (0-indexed),
+      and number of games of the streak
+    - offset: where the streak's games start in the rows array
+    plus one array with one entry per game in any streak:
+    - rows: positions of the games in the game data frame, streak by streak
+    """
+    def __init__(self, fingerprint, team_names, tables):
+        self.fingerprint = fingerprint
+        self.team_names = list(team_names)
+        self.team_codes = {team: code for code, team in enumerate(self.team_names)}
+        self.tables = tables
+
+    @classmethod
+    def build(cls, games):
+        """Find every streak in a GameData object and make a StreakTable"""
+        from .streak_data import StreakData, find_runs
+
+        team_names = list(games.team_names)
+        tables = {}
+        for winning in [True, False]:
+            options = argparse.Namespace(
+                team=team_names,
+                versus_team=team_names,
+                season=['all'],
+                winning=winning,
+                min=1
+            )
+            sd = StreakData(options, games=games)
+            our_data = sd.filter_step(sd.our_teams, sd.their_teams)
+            seasons = games.df['season'].values[our_data.rows]
+            starts, lengths = find_runs(our_data.slots, seasons, our_data.parts, 1)
+
+            # Keep only the games that are part of a streak, streak by streak
+            offsets = np.cumsum(lengths) - lengths
+            in_streak = np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+            tables[winning] = {
+                'team': our_data.slots[starts].astype(np.int32),
+                'season': seasons[starts].astype(np.int32),
+                'start': games.df['day'].values[our_data.rows[starts]].astype(np.int32),
+                'length': lengths.astype(np.int32),
+                'offset': offsets.astype(np.int64),
+                'rows': our_data.rows[in_streak].astype(np.int64)
+            }
+        return cls(games.fingerprint, team_names, tables)
+
+    def streaks(self, games, our_teams, seasons, winning, min, top=0):
+        """
+        Get the streaks of at least min games by any of our_teams in any of
+        seasons (0-indexed), against all opponents. Returns a data frame with
+        the same columns and order as StreakData.find_streaks (unsorted).
+        If top is set, only the top streaks are returned (see top_runs).
+        """
+        from .streak_data import top_runs
+
+        table = self.tables[bool(winning)]
+
+        # Map table team codes to the team's slot in our_teams (-1 if not one of ours)
+        our_slot = np.full(len(self.team_names), -1)
+        for i, our_team in enumerate(our_teams):
+            if our_team in self.team_codes:
+                our_slot[self.team_codes[our_team]] = i
+
+        slots = our_slot[table['team']]
+        keep = np.flatnonzero(
+            (slots >= 0) & np.isin(table['season'], seasons) & (table['length'] >= max(min, 1))
+        )
+        # Same order as the rle engine: by our_teams order, then season and start day
+        keep = keep[np.lexsort((table['start'][keep], table['season'][keep], slots[keep]))]
+        if top:
+            keep = keep[top_runs(table['length'][keep], table['season'][keep], table['start'][keep], top)]
+        if len(keep)==0:
+            return pd.DataFrame()
+
+        lengths = table['length'][keep]
+        offsets = table['offset'][keep]
+        rows = table['rows']
+        days = games.df['day'].values
+        game_rows = [rows[s:s+n] for s, n in zip(offsets.tolist(), lengths.tolist())]
+        return pd.DataFrame({
+            "Team Name": [our_teams[j] for j in slots[keep]],
+            "Streak Length": lengths.astype(np.int64),
+            "Streak Season": table['season'][keep].astype(np.int64),
+            "Streak Start": table['start'][keep].astype(np.int64), # makes sorting easier
+            "Streak Days": [days[r].tolist() for r in game_rows],
+            "Game Rows": game_rows
+        })
+
+    def save(self, filename=None):
+        """Save the table to an .npz file (in the cache directory by default)"""
+        if filename is None:
+            filename = os.path.join(cache_path(), STREAK_TABLE_NPZ)
+        arrays = {}
+        for winning, table in self.tables.items():
+            for name in TABLE_ARRAYS:
+                arrays["%s:%s"%("winning" if winning else "losing", name)] = table[name]
+        meta = {"fingerprint": self.fingerprint, "team_names": self.team_names}
+        arrays[META_KEY] = np.array(json.dumps(meta))
+
+        dirname = os.path.dirname(os.path.abspath(filename))
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+        tmp_file = "%s.%d.tmp"%(filename, os.getpid())
+        with open(tmp_file, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_file, filename)
+
+    @classmethod
+    def load(cls, fingerprint, filename=None):
+        """
+        Load the table from an .npz file (in the cache directory by default).
+        Returns None if the file is missing or was built from other game data.
+        """
+        if filename is None:
+            filename = os.path.join(cache_path(), STREAK_TABLE_NPZ)
+        if not os.path.exists(filename):
+            return None
+        try:
+            with np.load(filename, allow_pickle=False) as npz:
+                meta = json.loads(str(npz[META_KEY]))
+                if meta["fingerprint"] != fingerprint:
+                    return None
+                tables = {}
+                for winning in [True, False]:
+                    tables[winning] = {
+                        name: npz["%s:%s"%("winning" if winning else "losing", name)]
+                        for name in TABLE_ARRAYS
+                    }
+        except (OSError, KeyError, ValueError):
+            # Treat a damaged or incompatible file as missing
+            return None
+        return cls(fingerprint, meta["team_names"], tables)
+
+
+def get_streak_table(games):
+    """
+    Get the StreakTable for a GameData object: load it from the cache
+    directory if it was built from the same game data, otherwise build it
+    (and save it, if the game data has a fingerprint).
+    """
+    if games.fingerprint is not None:
+        table = StreakTable.load(games.fingerprint)
+        if table is not None:
+            return table
+    table = StreakTable.build(games)
+    if games.fingerprint is not None:
+        try:
+            table.save()
+        except OSError:
+            # The table is an optimization, so a read-only install is not an error
+            pass
+    return table
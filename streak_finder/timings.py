@@ -0,0 +1,68 @@
+import time
+
+
+"""
+The Timings class records how long each stage of a streak query takes
+(loading the game data, filtering, finding streaks, rendering), and how
+many rows each stage produced. The command line tool prints them with
+--timings, and the Python API returns them with each StreakResult:
+
+    result = finder.find_streaks(teams=['Tigers'])
+    print(result.timings.to_dict())
+"""
+
+
+class Stage(object):
+    """
+    One timed stage. Use it as a context manager;
+    set rows inside the with block to record a row count.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.seconds = None
+        self.rows = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.seconds = time.perf_counter() - self._start
+
+
+class Timings(object):
+    """
+    Timings and row counts for the stages of a streak query, in the order they ran.
+    """
+    def __init__(self):
+        self.stages = []
+
+    def stage(self, name):
+        """Start timing a stage (use with a with statement)"""
+        s = Stage(name)
+        self.stages.append(s)
+        return s
+
+    def extend(self, other):
+        """Add the stages of another Timings object"""
+        self.stages += other.stages
+
+    def total(self):
+        return sum(s.seconds or 0.0 for s in self.stages)
+
+    def to_dict(self):
+        """Get the stages as a list of dicts with keys stage, seconds, and rows"""
+        return [{"stage": s.name, "seconds": s.seconds, "rows": s.rows} for s in self.stages]
+
+    def report(self):
+        """Get the stages as a text table"""
+        lines = []
+        template = "%-20s %10s %10s"
+        lines.append(template%("Stage", "ms", "Rows"))
+        lines.append("-"*42)
+        for s in self.stages:
+            rows = "" if s.rows is None else "%d"%(s.rows)
+            lines.append(template%(s.name, "%.2f"%(1000*(s.seconds or 0.0)), rows))
+        lines.append("-"*42)
+        lines.append(template%("total", "%.2f"%(1000*self.total()), ""))
+        return "\n".join(lines)
@@ -1,12 +1,26 @@
 import json
 import os
-import blaseball_core_game_data as gd
+import sys
+from io import StringIO
+
+
+"""
+Note: this module is imported on every run of the command line tool,
+including runs that only print --help or --version, so it should not
+import pandas or blaseball_core_game_data at module level.
+"""
 
 
 root_path = os.path.abspath(os.path.join(os.path.dirname(__file__)))
 data_path = os.path.abspath(os.path.join(root_path, 'data'))
 
 SHORT2LONG_JSON = os.path.join(data_path, "short2long.json")
+TEAM_INDEX_JSON = "team_index.json"
+
+GD_PACKAGE = "blaseball-core-game-data"
+
+# Streak detection engines (see StreakData.aggregate_step)
+ENGINES = ['rle', 'loop']
 
 DALE_SAFE = "Dale" # for command line
 DALE_UTF8 = "Dal\u00e9" # for display
@@ -15,96 +29,306 @@ FULL_DALE_SAFE = "Miami Dale" # for command line
 FULL_DALE_UTF8 = "Miami Dal\u00e9" # for display
 
 
-def get_league_division_team_data():
+def cache_path():
     """
-    Get a list of leagues, divisions, and teams.
-    This is for use in creating CLI flag values,
-    so we replace Dal\u00e9 with Dale.
+    Get the directory where cached data is stored.
+    This can be overridden with the STREAK_FINDER_CACHE_DIR environment variable.
     """
-    tds = json.loads(gd.get_teams_data())
+    return os.environ.get("STREAK_FINDER_CACHE_DIR", os.path.join(data_path, "cache"))
+
 
-    leagues = set()
-    divisions = set()
-    teams = set()
-    for i in range(len(tds)):
-        td = tds[i]
-        leagues_ = sorted(list(td['leagues'].keys()))
-        divisions_ = sorted(list(td['divisions'].keys()))
-        leagues = leagues.union(leagues_)
-        divisions = divisions.union(leagues_)
+def get_gd_version():
+    """
+    Get the installed version of the blaseball_core_game_data package.
 
-        teams_ = []
-        for league_ in leagues_:
-            teams_ += td['leagues'][league_]
-        teams = teams.union(teams_)
+    This looks for the package's install metadata (.dist-info, .egg-info, or .egg)
+    on sys.path instead of using importlib.metadata, which is slow to import,
+    and falls back to importing the package itself.
+    """
+    prefix = GD_PACKAGE.replace('-', '_') + '-'
+    for path in sys.path:
+        try:
+            names = [os.path.basename(path)] + os.listdir(path or '.')
+        except OSError:
+            continue
+        for name in names:
+            if name.startswith(prefix) and name.endswith(('.dist-info', '.egg-info', '.egg')):
+                stem, _ = os.path.splitext(name)
+                return stem[len(prefix):].split('-')[0]
+    import blaseball_core_game_data as gd
+    return getattr(gd, '__version__', 'unknown')
 
-    leagues = sorted(list(leagues))
-    teams = sorted(list(teams))
-    divisions = sorted(list(divisions))
 
-    return (leagues, divisions, teams)
+def get_data_stamp():
+    """
+    Get a cheap stamp (no hashing or parsing) of the game data files in the
+    installed blaseball_core_game_data package: the package version plus the
+    size and modification time of each data file. This changes whenever the
+    game data is updated or reinstalled.
+    The package is located without importing it.
+    """
+    from importlib.util import find_spec
+    stamp = [get_gd_version()]
+    spec = find_spec(GD_PACKAGE.replace('-', '_'))
+    if spec is None or spec.origin is None:
+        return tuple(stamp)
+    gd_dir = os.path.dirname(os.path.abspath(spec.origin))
+    for dirpath, dirnames, filenames in os.walk(gd_dir):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.endswith('.json'):
+                st = os.stat(os.path.join(dirpath, filename))
+                stamp.append((filename, st.st_size, st.st_mtime_ns))
+    return tuple(stamp)
 
 
-def league_to_teams(league):
+class TeamIndex(object):
     """
-    For a given league, return a list of all teams in that league.
-    We replace Dal\u00e9 with Dale (see above).
+    Index of the leagues, divisions, and teams in each season,
+    plus maps between team nicknames, full names, and emoji.
+
+    Team names are stored in their command line safe form
+    (Dale instead of Dal\u00e9, see sanitize_dale).
     """
-    tds = json.loads(gd.get_teams_data())
-    teams = []
-    if season is None:
-        for i in range(len(tds)):
-            td = tds[i]
-            leagues = sorted(list(td['leagues'].keys()))
-            if league in leagues:
-                teams = sorted(list(td['leagues'][league]))
-                break
-    else:
-        td = tds[season]
-        leagues = sorted(list(td['leagues'].keys()))
-        if league in leagues:
-            teams = sorted(list(td['leagues'][league]))
+    def __init__(self, seasons, full_names, emoji=None):
+        """
+        seasons is a list (one item per season, 0-indexed) of nested dicts:
+        {league: {division: [teams]}}
 
-    if len(teams)==0:
-        raise Exception("Error: Could not find any teams in league %s"%(league))
-    return teams
+        full_names maps team nicknames to full names,
+        emoji maps team nicknames to team emoji.
 
+        Full names of teams that are not in full_names, and emoji, come
+        from the game data set. They are only loaded the first time one is
+        asked for (see add_game_teams), so that building the index does not
+        load the game data.
+        """
+        self.seasons = seasons
+        self.nickname_to_full = dict(full_names)
+        self.full_to_nickname = {v: k for k, v in self.nickname_to_full.items()}
+        self.nickname_to_emoji = dict(emoji or {})
+        self._game_teams_added = False
+
+        # (league or division name, season) -> sorted list of teams
+        self._league_teams = {}
+        self._division_teams = {}
+        leagues = set()
+        divisions = set()
+        teams = set()
+        for season, league_data in enumerate(seasons):
+            for league, division_data in league_data.items():
+                league_teams = set()
+                for division, division_teams in division_data.items():
+                    league_teams.update(division_teams)
+                    self._division_teams[(division, season)] = sorted(division_teams)
+                    # If no season is given, use the first season with this division
+                    self._division_teams.setdefault((division, None), sorted(division_teams))
+                    divisions.add(division)
+                self._league_teams[(league, season)] = sorted(league_teams)
+                self._league_teams.setdefault((league, None), sorted(league_teams))
+                leagues.add(league)
+                teams.update(league_teams)
+
+        self.leagues = sorted(list(leagues))
+        self.divisions = sorted(list(divisions))
+        self.teams = sorted(list(teams))
+
+    @classmethod
+    def from_teams_data(cls, tds, full_names, emoji=None):
+        """
+        Create a TeamIndex from the teams data set in blaseball_core_game_data,
+        which is a list of dicts (one per season) with two keys:
+        leagues (league name to list of teams) and divisions
+        (division name to list of teams).
+        """
+        seasons = []
+        for td in tds:
+            league_data = {}
+            for league, league_teams in td['leagues'].items():
+                league_teams = set(sanitize_dale(t) for t in league_teams)
+                league_data[league] = {}
+                for division, division_teams in td['divisions'].items():
+                    division_teams = [sanitize_dale(t) for t in division_teams]
+                    if league_teams.issuperset(division_teams):
+                        league_data[league][division] = sorted(division_teams)
+                # Teams that are not in any division in this league
+                rest = league_teams.difference(*league_data[league].values())
+                if len(rest)>0:
+                    league_data[league][""] = sorted(list(rest))
+            seasons.append(league_data)
+        return cls(seasons, full_names, emoji)
+
+    def to_dict(self):
+        return {
+            'seasons': self.seasons,
+            'full_names': self.nickname_to_full,
+            'emoji': self.nickname_to_emoji
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d['seasons'], d['full_names'], d['emoji'])
+
+    def league_to_teams(self, league, seasons=None):
+        """
+        For a given league, return a list of all teams in that league.
+        If seasons (a list of 0-indexed seasons) is given, return all teams
+        in the league in any of those seasons; otherwise use the first
+        season with that league.
+        """
+        return self._lookup(self._league_teams, league, seasons, "league")
+
+    def division_to_teams(self, division, seasons=None):
+        """
+        For a given division, return a list of all teams in that division.
+        If seasons (a list of 0-indexed seasons) is given, return all teams
+        in the division in any of those seasons; otherwise use the first
+        season with that division.
+        """
+        return self._lookup(self._division_teams, division, seasons, "division")
 
-def division_to_teams(division):
+    def _lookup(self, group_teams, name, seasons, label):
+        if seasons is None:
+            teams = group_teams.get((name, None), [])
+        else:
+            teams = set()
+            for season in seasons:
+                teams.update(group_teams.get((name, season), []))
+            teams = sorted(list(teams))
+        if len(teams)==0:
+            raise Exception("Error: Could not find any teams in %s %s"%(label, name))
+        return teams
+
+    def add_game_teams(self):
+        """
+        Add the full names (of teams without one) and emoji of the teams
+        in the game data set. This loads the game data, so it only runs
+        once, the first time a name or emoji is missing.
+        """
+        if self._game_teams_added:
+            return
+        self._game_teams_added = True
+        full_names, emoji = game_team_names()
+        for nickname, full_name in full_names.items():
+            if nickname not in self.nickname_to_full:
+                self.nickname_to_full[nickname] = full_name
+                self.full_to_nickname.setdefault(full_name, nickname)
+        for nickname, team_emoji in emoji.items():
+            self.nickname_to_emoji.setdefault(nickname, team_emoji)
+
+    def full_name(self, nickname):
+        """Get a team's full name from its nickname"""
+        if nickname not in self.nickname_to_full:
+            self.add_game_teams()
+        return self.nickname_to_full.get(nickname, nickname)
+
+    def full_names(self, nicknames):
+        """Get a dict mapping each of a list of team nicknames to its full name"""
+        return {nickname: self.full_name(nickname) for nickname in nicknames}
+
+    def nickname(self, full_name):
+        """Get a team's nickname from its full name"""
+        if full_name not in self.full_to_nickname:
+            self.add_game_teams()
+        return self.full_to_nickname.get(full_name, full_name)
+
+    def emoji(self, nickname):
+        """Get a team's emoji from its nickname"""
+        if nickname not in self.nickname_to_emoji:
+            self.add_game_teams()
+        return self.nickname_to_emoji.get(nickname, "")
+
+
+# The TeamIndex is loaded once per process (see get_team_index)
+_team_index = None
+
+
+def all_teams(team_index, team_names=None):
     """
-    For a given division, return a list of all teams in that league.
-    We replace Dal\u00e9 with Dale (see above).
+    Get the list of all teams, for queries that do not pick teams: the teams
+    in the team index, unless team_names (the teams in an array store) has
+    teams that are not in it (e.g., a simulated league), then team_names.
     """
-    tds = json.loads(gd.get_teams_data())
-    teams = []
-    if season is None:
-        for i in range(len(tds)):
-            td = tds[i]
-            divisions = sorted(list(td['divisions'].keys()))
-            if division in divisions:
-                teams = sorted(list(td['divisions'][division]))
-                break
-    else:
-        td = tds[season]
-        divisions = sorted(list(td['divisions'].keys()))
-        if division in divisions:
-            teams = sorted(list(td['divisions'][division]))
+    if team_names is not None and not set(team_names).issubset(team_index.teams):
+        return list(team_names)
+    return list(team_index.teams)
 
-    if len(teams)==0:
-        raise Exception("Error: Could not find any teams in division %s"%(division))
-    return teams
 
+def get_team_index(reload=False):
+    """
+    Get the TeamIndex for the installed game data.
+
+    The index is stored in the cache directory, so that the command line
+    tool does not have to parse the teams data set on every run, and it is
+    rebuilt when the installed blaseball_core_game_data version changes.
+    Once loaded, the same TeamIndex is returned for the rest of the process
+    (unless reload is True).
+    """
+    global _team_index
+    if _team_index is not None and not reload:
+        return _team_index
+
+    index_file = os.path.join(cache_path(), TEAM_INDEX_JSON)
+    gd_version = get_gd_version()
+    try:
+        with open(index_file, 'r') as f:
+            d = json.load(f)
+        if d['version'] == gd_version:
+            _team_index = TeamIndex.from_dict(d)
+            return _team_index
+    except (OSError, ValueError, KeyError):
+        pass
+
+    _team_index = build_team_index()
+    d = _team_index.to_dict()
+    d['version'] = gd_version
+    try:
+        if not os.path.exists(cache_path()):
+            os.makedirs(cache_path())
+        tmp_file = "%s.%d.tmp"%(index_file, os.getpid())
+        with open(tmp_file, 'w') as f:
+            json.dump(d, f)
+        os.replace(tmp_file, index_file)
+    except OSError:
+        # The index is an optimization, so a read-only install is not an error
+        pass
+    return _team_index
+
+
+def build_team_index():
+    """
+    Build a TeamIndex from the teams data set, using team full names
+    from the nickname to full name data file. This does not load the
+    game data set (see TeamIndex.add_game_teams).
+    """
+    import blaseball_core_game_data as gd
+    tds = json.loads(gd.get_teams_data())
 
-def get_short2long():
-    """Get the map of team nicknames to team full names"""
-    short2long = None
     if os.path.exists(SHORT2LONG_JSON):
         with open(SHORT2LONG_JSON, 'r') as f:
-            short2long = json.load(f)
+            full_names = json.load(f)
     else:
         raise FileNotFoundError("Missing team nickname to full name data file: %s"%(SHORT2LONG_JSON))
-    return short2long
 
+    return TeamIndex.from_teams_data(tds, full_names)
+
+
+def game_team_names():
+    """
+    Get the full names and emoji of the teams in the game data set,
+    as two dicts keyed on team nickname.
+    """
+    from .games_cache import load_games
+    full_names = {}
+    emoji = {}
+    for side in ['home', 'away']:
+        cols = [side + 'TeamNickname', side + 'TeamName', side + 'TeamEmoji']
+        games = load_games(columns=cols).drop_duplicates()
+        for nickname, full_name, team_emoji in games.itertuples(index=False):
+            nickname = sanitize_dale(nickname)
+            full_names.setdefault(nickname, sanitize_dale(full_name))
+            emoji.setdefault(nickname, team_emoji)
+    return full_names, emoji
 
 
 def sanitize_dale(s):
@@ -1,25 +1,105 @@
+import io
 import os
 import sys
-from .util import sanitize_dale, get_short2long, get_league_division_team_data
-from .streak_data import StreakData, NoStreaksException
+import csv
+import time
+import numpy as np
+from .util import sanitize_dale, get_team_index
+
+
+NO_STREAKS_MESSAGE = "\nNo streaks matching the specified criteria were found. Try a lower value for --min, or more versus teams.\n"
+NOTE_1_INDEXED = "\nNote: all days and seasons displayed are 1-indexed."
+NOTE_HEAD_TO_HEAD = (
+    "\nNote: head-to-head streaks count consecutive games between two teams, and carry over"
+    "\nfrom one season to the next. The current streak is the row team's streak going into its"
+    "\nnext game against the column team. A - means the two teams did not play each other."
+)
+
+# Head-to-head matrices to render: (title, HeadToHeadResult attribute)
+MATRIX_TABLES = [("Longest", "longest"), ("Current", "current")]
+
+# Rendered text is written out in chunks of about this many characters
+OUTPUT_BUFFER_SIZE = 64*1024
+
+
+def view_columns(options):
+    """
+    Get the game data columns the views need (besides the columns
+    used to find streaks) to render a report with the given options.
+    """
+    if options.short or getattr(options, 'matrix', False):
+        return []
+    if options.nickname:
+        return ['awayTeamNickname', 'awayScore', 'homeScore', 'homeTeamNickname']
+    return ['awayTeamName', 'awayScore', 'homeScore', 'homeTeamName']
+
+
+def game_column(column):
+    """
+    Get a game data column as (array, None), or as (codes, values) for
+    categorical columns, so that looking up a few games does not turn the
+    whole column into an array of text (missing values have code -1,
+    which picks the NaN at the end of values).
+    """
+    if hasattr(column, 'cat'):
+        values = np.append(np.asarray(column.cat.categories, dtype=object), np.nan)
+        return column.array.codes, values
+    return np.asarray(column), None
+
+
+def write_chunks(f, chunks, buffer_size=OUTPUT_BUFFER_SIZE):
+    """
+    Write an iterable of text chunks to the file object f,
+    joining small chunks into writes of about buffer_size characters.
+    """
+    buf = []
+    size = 0
+    for chunk in chunks:
+        buf.append(chunk)
+        size += len(chunk)
+        if size >= buffer_size:
+            f.write("".join(buf))
+            buf = []
+            size = 0
+    if len(buf) > 0:
+        f.write("".join(buf))
+    f.flush()
 
 
 class View(object):
     """
     Base class for view classes, so that all they have to do
-    is define a short_table and long_table method.
+    is define a short_table and long_table method
+    (and a matrix_table method for head-to-head matrices).
+
+    Views render a StreakResult or a HeadToHeadResult (see finder.py)
+    using the view options (short/long/matrix, nicknames/full names) from
+    the command line. short_table, long_table, and matrix_table are
+    generators that yield the rendered text a piece at a time, so large
+    reports are written out as they are rendered instead of being built
+    up in memory first.
     """
-    def __init__(self, options):
+    def __init__(self, options, result):
         self.short = options.short
-        self.winning = options.winning
         self.use_nicknames = options.nickname
-        self.our_teams = options.team
-        self.their_teams = options.versus_team
-        self.min = options.min
-        self.seasons = options.season
-        _, _, self.ALLTEAMS = get_league_division_team_data()
-
-        self.streak_data = StreakData(options)
+        self.result = result
+        self.winning = result.winning
+        self.our_teams = result.teams
+        self.their_teams = result.versus_teams
+        # Head-to-head results have no min, top, or filters
+        self.min = getattr(result, 'min', None)
+        self.top = getattr(result, 'top', 0)
+        self.venue = getattr(result, 'venue', None)
+        self.our_pitchers = getattr(result, 'our_pitchers', [])
+        self.versus_pitchers = getattr(result, 'versus_pitchers', [])
+        # Render a head-to-head matrix instead of a list of streaks
+        self.matrix = getattr(options, 'matrix', False)
+        self.seasons = result.seasons
+        self.team_index = get_team_index()
+        # Teams that make up "all teams" (see util.all_teams)
+        self.ALLTEAMS = getattr(result, 'all_teams', None) or self.team_index.teams
+        # Game data columns used by streak_games (see there)
+        self._game_arrays = None
 
     def make_table_descr(self):
         """Assemble a brief description to put ahead of all of the tables""" 
@@ -29,6 +109,10 @@ class View(object):
         else:
             descr = "Losing "
         descr += "streaks "
+        if self.top:
+            descr = "Top %d %s"%(self.top, descr.lower())
+        if self.matrix:
+            descr = "Head-to-head %s"%(descr.lower())
 
         # Sanitize unicode for and comparison
         our_teams = [sanitize_dale(t) for t in self.our_teams]
@@ -45,6 +129,16 @@ class View(object):
             their_teams = ["all teams"]
         descr += "for %s versus %s "%(", ".join(our_teams), ", ".join(their_teams))
 
+        # Home/away and pitcher filters
+        if self.venue == 'home':
+            descr += "at home "
+        elif self.venue == 'away':
+            descr += "on the road "
+        if self.our_pitchers:
+            descr += "with %s pitching "%(" or ".join(self.our_pitchers))
+        if self.versus_pitchers:
+            descr += "against %s "%(" or ".join(self.versus_pitchers))
+
         # for season X
         if 'all' in self.seasons:
             descr += "for all time"
@@ -55,19 +149,110 @@ class View(object):
 
         return descr
 
+    def streak_games(self, game_rows):
+        """
+        Get the games in a streak, fetched all at once
+        using the streak's game positions (its Game Rows).
+        Returns a list of tuples with the values to print for each game:
+        (season, day, away team, away score, home score, home team)
+        """
+        if self.use_nicknames:
+            home_name_key = 'homeTeamNickname'
+            away_name_key = 'awayTeamNickname'
+        else:
+            home_name_key = 'homeTeamName'
+            away_name_key = 'awayTeamName'
+        cols = ['season', 'day', away_name_key, 'awayScore', 'homeScore', home_name_key]
+        # Plain arrays of the game data columns, made once per view
+        # (selecting columns or rows from the data frame for every streak is slow)
+        if self._game_arrays is None:
+            df = self.result.games.df
+            self._game_arrays = [game_column(df[col]) for col in cols]
+        season, day, away_name, away_score, home_score, home_name = [
+            (a[game_rows] if values is None else values[a[game_rows]]).tolist()
+            for a, values in self._game_arrays
+        ]
+        return [
+            (s+1, d+1, an, a_s, h_s, hn)
+            for s, d, an, a_s, h_s, hn in zip(season, day, away_name, away_score, home_score, home_name)
+        ]
+
+    def short_rows(self, str_template):
+        """
+        Format one row per streak for the short tables, working on whole
+        columns at once: team names are mapped with a dict lookup, and
+        day numbers are looked up in a table of 1-indexed day strings
+        instead of being formatted one at a time.
+        str_template takes (team name, length, season, days).
+        Returns a list of strings.
+        """
+        streak_df = self.result.streaks
+        names = streak_df['Team Name']
+        if not self.use_nicknames:
+            names = names.map(self.team_index.full_names(names.unique())).fillna(names)
+        lengths = streak_df['Streak Length'].tolist()
+        seasons = (streak_df['Streak Season'].to_numpy() + 1).tolist()
+
+        days = streak_df['Streak Days'].tolist()
+        max_day = max(max(d) for d in days)
+        day_strs = [str(j+1) for j in range(max_day+1)]
+        days = [", ".join([day_strs[j] for j in d]) for d in days]
+
+        return [str_template%row for row in zip(names.tolist(), lengths, seasons, days)]
+
+    def display_names(self, teams):
+        """Get the names to print for a list of team nicknames"""
+        if self.use_nicknames:
+            return list(teams)
+        return [self.team_index.full_name(t) for t in teams]
+
+    def matrix_cells(self, frame):
+        """
+        Get the cells of a head-to-head matrix (a data frame attribute of
+        a HeadToHeadResult) as a list of lists, one per team, with None
+        where the two teams did not play each other.
+        """
+        played = (self.result.games.values > 0).tolist()
+        return [
+            [v if p else None for v, p in zip(values, row_played)]
+            for values, row_played in zip(frame.values.tolist(), played)
+        ]
+
     def short_table(self):
-        """Virtual method to print a short table summarizing streaks found"""
+        """Virtual method to render a short table summarizing streaks found"""
         raise NotImplementedError("View class is a base class and does not implement short_table")
 
     def long_table(self):
-        """Virtual method to print tables with details about streaks found"""
+        """Virtual method to render tables with details about streaks found"""
         raise NotImplementedError("View class is a base class and does not implement long_table")
 
+    def matrix_table(self):
+        """Virtual method to render head-to-head streak matrices"""
+        raise NotImplementedError("View class is a base class and does not implement matrix_table")
+
+    def write(self, chunks):
+        """Write rendered text to stdout"""
+        write_chunks(sys.stdout, chunks)
+
     def table(self):
-        if self.short:
-            self.short_table()
-        else:
-            self.long_table()
+        if len(self.result)==0:
+            print(NO_STREAKS_MESSAGE)
+            return
+        try:
+            # Time rendering along with the rest of the query (see timings.py)
+            with self.result.timings.stage("render") as stage:
+                stage.rows = len(self.result)
+                if self.matrix:
+                    self.write(self.matrix_table())
+                elif self.short:
+                    self.write(self.short_table())
+                else:
+                    self.write(self.long_table())
+        except BrokenPipeError:
+            # The reader went away (e.g., output piped into head):
+            # stop rendering, and send anything still buffered to devnull
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, sys.stdout.fileno())
 
 
 class TextView(View):
@@ -76,119 +261,91 @@ class TextView(View):
     """
     def short_table(self):
         """
-        Print a short table that summarizes all of the streaks found.
+        Render a short table that summarizes all of the streaks found.
         One line/row per streak.
         """
-        # Team nickname to full name map
-        short2long = get_short2long()
-
-        try:
-            streak_df, _ = self.streak_data.find_streaks()
-        except NoStreaksException:
-            print("\nNo streaks matching the specified criteria were found. Try a lower value for --min, or more versus teams.\n")
-            sys.exit(0)
-
-        # For new columns
-        nickfull = lambda x: x if self.use_nicknames else short2long[x]
-
-        # Nicknames or full names
-        streak_df['Team Name'] = streak_df['Team Name'].apply(nickfull)
-
-        table = []
-
         str_template = "%-25s %-9s %-9s %s"
         head = str_template%("Team Name", "Length", "Season", "Days")
         line = "-"*60
         table_descr = self.make_table_descr()
 
-        table.append("\n" + table_descr + "\n")
-        table.append(head)
-        table.append(line)
-        for i, row in streak_df.iterrows():
-            row = str_template%(
-                row['Team Name'],
-                row['Streak Length'],
-                int(row['Streak Season'])+1,
-                ", ".join([str(j+1) for j in row['Streak Days']])
-            )
-            table.append(row)
+        yield "\n" + table_descr + "\n\n"
+        yield head + "\n"
+        yield line + "\n"
+        # All rows in one chunk
+        yield "\n".join(self.short_rows(str_template)) + "\n"
 
-        table_descr = self.make_table_descr()
-        print("\n".join(table))
-        print("\nNote: all days and seasons displayed are 1-indexed.")
+        yield NOTE_1_INDEXED + "\n"
 
     def long_table(self):
         """
-        Print a set of tables that summarize all games in the streaks found.
+        Render a set of tables that summarize all games in the streaks found.
         One table per streak, one row per game that is part of the streak.
         """
-        # Team nickname to full name map
-        short2long = get_short2long()
-
-        try:
-            streak_df, our_data = self.streak_data.find_streaks()
-        except NoStreaksException:
-            print("\nNo streaks matching the specified criteria were found. Try a lower value for --min, or more versus teams.\n")
-            sys.exit(0)
+        streak_df = self.result.streaks
 
         # Table description (head matter)
         table_descr = self.make_table_descr()
-        print("\n" + table_descr)
+        yield "\n" + table_descr + "\n"
 
         # Create one table per streak found
         line = "-"*60
         scorestring = "G%d: Season %d Game %d: %s %-2d @ %2d %s"
-        for i, (_, row) in enumerate(streak_df.iterrows()):
-            wl = "Winning" if self.winning else "Losing"
-            our_team = row['Team Name']
-            our_df = our_data[our_team]
-
+        wl = "Winning" if self.winning else "Losing"
+        cols = ['Team Name', 'Streak Length', 'Streak Season', 'Streak Days', 'Game Rows']
+        for name, length, season, days, game_rows in streak_df[cols].itertuples(index=False):
             table = []
             table.append("\n\n")
             table.append(line)
-            table.append("%d Game %s Streak"%(row['Streak Length'], wl))
+            table.append("%d Game %s Streak"%(length, wl))
             if self.use_nicknames:
-                tname = row['Team Name']
+                tname = name
             else:
-                tname = short2long[row['Team Name']]
+                tname = self.team_index.full_name(name)
             table.append("%s"%(tname))
-            table.append("Season %d Games %s"%(row['Streak Season']+1, ", ".join([str(j) for j in row['Streak Days']])))
+            table.append("Season %d Games %s"%(season+1, ", ".join([str(j) for j in days])))
             table.append(line)
 
-            for j, today in enumerate(row['Streak Days']):
-                this_season = int(row['Streak Season'])
-                temp = our_df.loc[(our_df['day']==today) & (our_df['season']==this_season)]
-                if self.use_nicknames:
-                    home_name_key = 'homeTeamNickname'
-                    away_name_key = 'awayTeamNickname'
-                else:
-                    home_name_key = 'homeTeamName'
-                    away_name_key = 'awayTeamName'
-                table.append(scorestring%(
-                    j+1,
-                    temp['season']+1,
-                    temp['day']+1,
-                    temp[away_name_key].values[0],
-                    temp['awayScore'].values[0],
-                    temp['homeScore'].values[0],
-                    temp[home_name_key].values[0]
-                ))
+            for j, game in enumerate(self.streak_games(game_rows)):
+                table.append(scorestring%((j+1,) + game))
             table.append(line)
             table.append("\n")
 
-            print("\n".join(table))
+            yield "\n".join(table) + "\n"
 
         # Note to user (foot matter)
-        print("\nNote: all days and seasons displayed are 1-indexed.")
+        yield NOTE_1_INDEXED + "\n"
 
+    def matrix_table(self):
+        """
+        Render head-to-head matrices of the longest and current streaks.
+        One row per team, one column per opponent.
+        """
+        names = self.display_names(self.our_teams)
+        opponents = self.display_names(self.their_teams)
+        name_width = max(len(j) for j in names + ["Team Name"])
+        widths = [max(len(j), 3) for j in opponents]
+
+        yield "\n" + self.make_table_descr() + "\n"
+        for title, attr in MATRIX_TABLES:
+            head = "  ".join(["Team Name".ljust(name_width)] + [o.rjust(w) for o, w in zip(opponents, widths)])
+            table = ["", "%s streak (row team versus column team)"%(title), "", head, "-"*len(head)]
+            for name, cells in zip(names, self.matrix_cells(getattr(self.result, attr))):
+                cells = ["-" if c is None else str(c) for c in cells]
+                table.append("  ".join([name.ljust(name_width)] + [c.rjust(w) for c, w in zip(cells, widths)]))
+            yield "\n".join(table) + "\n"
 
+        yield NOTE_HEAD_TO_HEAD + "\n"
 
-class MarkdownView(View):
+
+
+class FileView(View):
     """
-    MarkdownView turns a dataframe into Markdown tables.
+    Base class for views that write to an output file (--output),
+    or to stdout if there is no output file.
     """
-    def __init__(self, options):
-        super().__init__(options)
+    def __init__(self, options, result):
+        super().__init__(options, result)
 
         if options.output == '':
             self.output_file = None
@@ -206,154 +363,135 @@ class MarkdownView(View):
                 if not os.path.exists(output_file_path):
                     raise Exception("Error: directory for output file (%s) does not exist!"%(output_file_path))
 
+    def write(self, chunks):
+        """Write rendered text to the output file, or to stdout if there is no output file"""
+        if self.output_file is None:
+            write_chunks(sys.stdout, chunks)
+        else:
+            with open(self.output_file, 'w', buffering=OUTPUT_BUFFER_SIZE) as f:
+                write_chunks(f, chunks)
+
+
+class MarkdownView(FileView):
+    """
+    MarkdownView turns a dataframe into Markdown tables.
+    """
+
     def short_table(self):
         """
-        Print a short table that summarizes all of the streaks found.
+        Render a short table that summarizes all of the streaks found.
         One line/row per streak.
         """
-        # Team nickname to full name map
-        short2long = get_short2long()
-
-        try:
-            streak_df, _ = self.streak_data.find_streaks()
-        except NoStreaksException:
-            print("\nNo streaks matching the specified criteria were found. Try a lower value for --min, or more versus teams.\n")
-            sys.exit(0)
-
-        # For new columns
-        nickfull = lambda x: x if self.use_nicknames else short2long[x]
-
-        # Nicknames or full names
-        streak_df['Team Name'] = streak_df['Team Name'].apply(nickfull)
-
         description = self.make_table_descr()
 
         # -----
 
-        # This string is the final table in Markdown format
-        table = ""
+        # Head matter is spaced out more on stdout than in the output file
+        if self.output_file is None:
+            yield "\n\n\n" + description + "\n" + "\n\n\n"
+        else:
+            yield "\n\n" + description + "\n\n"
 
         # Start header line
         table_header = "| Team Name | Length | Season | Days |"
         # Start separator line (controls alignment)
         table_sep = "| ----- | ----- | ----- | ----- |"
 
-        table += table_header
-        table += "\n"
-        table += table_sep
-        table += "\n"
+        yield table_header + "\n"
+        yield table_sep + "\n"
         str_template = "| %-30s | %-10s | %-10s | %s |"
-        for i, row in streak_df.iterrows():
-            row = str_template%(
-                row['Team Name'],
-                row['Streak Length'],
-                int(row['Streak Season'])+1,
-                ", ".join([str(j+1) for j in row['Streak Days']])
-            )
-            table += row
-            table += "\n"
+        # All rows in one chunk
+        yield "\n".join(self.short_rows(str_template)) + "\n"
 
+        # Foot matter
         if self.output_file is None:
-            print("\n\n")
-            print(description)
-            print("\n\n")
-            print(table)
-            print("\n")
-            print("\nNote: all days and seasons displayed are 1-indexed.")
+            yield "\n" + "\n\n" + NOTE_1_INDEXED + "\n"
         else:
-            with open(self.output_file, 'w') as f:
-                f.write("\n\n")
-                f.write(description)
-                f.write("\n\n")
-                f.write(table)
-                f.write("\n")
-                f.write("\nNote: all days and seasons displayed are 1-indexed.")
-
+            yield "\n" + NOTE_1_INDEXED
 
     def long_table(self):
         """
-        Print a set of tables that summarize all games in the streaks found.
+        Render a set of tables that summarize all games in the streaks found.
         One table per streak, one row per game that is part of the streak.
         """
-        # Team nickname to full name map
-        short2long = get_short2long()
-
-        try:
-            streak_df, our_data = self.streak_data.find_streaks()
-        except NoStreaksException:
-            print("\nNo streaks matching the specified criteria were found. Try a lower value for --min, or more versus teams.\n")
-            sys.exit(0)
+        streak_df = self.result.streaks
 
         # Table description (head matter)
         description = self.make_table_descr()
 
         # -----
 
-        # This is the master document that compiles all other tables
-        md = ""
-
         # One description for all tables
-        md += "\n\n"
-        md += description
-        md += "\n\n"
+        yield "\n\n" + description + "\n\n"
 
         # Create one table per streak found
-        for i, (_, row) in enumerate(streak_df.iterrows()):
-            # This string is the final table
-            table = ""
-
-            wl = "Winning" if self.winning else "Losing"
-            short_name = row['Team Name']
-            long_name = short2long[short_name]
+        wl = "Winning" if self.winning else "Losing"
+        scorestring = "| G%d: Season %d Game %d: %s %-2d @ %2d %s |"
+        cols = ['Team Name', 'Streak Length', 'Streak Season', 'Streak Days', 'Game Rows']
+        for short_name, length, season, days, game_rows in streak_df[cols].itertuples(index=False):
             if self.use_nicknames:
                 this_name = short_name
             else:
-                this_name = long_name
-
-            our_df = our_data[short_name]
-
-            table_header = "| %d Game %s Streak by the %s |"%(row['Streak Length'], wl, this_name)
-            table_sep = "| ----- |"
-            
-            row1 = "| Season %d Games %s |"%(row['Streak Season']+1, ", ".join([str(j) for j in row['Streak Days']]))
-
-            table += table_header
-            table += "\n"
-            table += table_sep
-            table += "\n"
-            table += row1
-            table += "\n"
-
-            scorestring = "| G%d: Season %d Game %d: %s %-2d @ %2d %s |"
-            for j, today in enumerate(row['Streak Days']):
-                this_season = int(row['Streak Season'])
-                temp = our_df.loc[(our_df['day']==today) & (our_df['season']==this_season)]
-                if self.use_nicknames:
-                    home_name_key = 'homeTeamNickname'
-                    away_name_key = 'awayTeamNickname'
-                else:
-                    home_name_key = 'homeTeamName'
-                    away_name_key = 'awayTeamName'
-                rowstr = scorestring%(
-                    j+1,
-                    temp['season']+1,
-                    temp['day']+1,
-                    temp[away_name_key].values[0],
-                    temp['awayScore'].values[0],
-                    temp['homeScore'].values[0],
-                    temp[home_name_key].values[0]
-                )
-                table += rowstr
-                table += "\n"
-
-            # Add the final table to the master document
-            md += table + "\n\n"
-
-        md += "\nNote: all days and seasons displayed are 1-indexed."
+                this_name = self.team_index.full_name(short_name)
 
+            table = []
+            table.append("| %d Game %s Streak by the %s |"%(length, wl, this_name))
+            table.append("| ----- |")
+            table.append("| Season %d Games %s |"%(season+1, ", ".join([str(j) for j in days])))
+            for j, game in enumerate(self.streak_games(game_rows)):
+                table.append(scorestring%((j+1,) + game))
+
+            # Each table is followed by a blank line
+            yield "\n".join(table) + "\n" + "\n\n"
+
+        yield NOTE_1_INDEXED
         if self.output_file is None:
-            print(md)
-        else:
-            with open(self.output_file, 'w') as f:
-                f.write(md)
+            yield "\n"
 
+    def matrix_table(self):
+        """
+        Render head-to-head matrices of the longest and current streaks.
+        One row per team, one column per opponent.
+        """
+        names = self.display_names(self.our_teams)
+        opponents = self.display_names(self.their_teams)
+
+        yield "\n\n" + self.make_table_descr() + "\n\n"
+        for title, attr in MATRIX_TABLES:
+            table = []
+            table.append("**%s streak** (row team versus column team)"%(title))
+            table.append("")
+            table.append("| Team Name | " + " | ".join(opponents) + " |")
+            table.append("| ----- |" + " ----- |"*len(opponents))
+            for name, cells in zip(names, self.matrix_cells(getattr(self.result, attr))):
+                cells = ["-" if c is None else str(c) for c in cells]
+                table.append("| " + " | ".join([name] + cells) + " |")
+            yield "\n".join(table) + "\n\n"
+
+        yield NOTE_HEAD_TO_HEAD
+        if self.output_file is None:
+            yield "\n"
+
+
+class CsvView(FileView):
+    """
+    CsvView turns head-to-head streak matrices into CSV
+    (only head-to-head matrices can be written as CSV).
+    """
+    def matrix_table(self):
+        """
+        Render head-to-head matrices of the longest and current streaks
+        as one CSV table: a header row with the opponents, then one row
+        per team for each matrix, labeled in the Streak column.
+        Cells are empty where the two teams did not play each other.
+        """
+        names = self.display_names(self.our_teams)
+        opponents = self.display_names(self.their_teams)
+
+        buf = io.StringIO()
+        writer = csv.writer(buf, lineterminator="\n")
+        writer.writerow(["Streak", "Team Name"] + opponents)
+        for title, attr in MATRIX_TABLES:
+            for name, cells in zip(names, self.matrix_cells(getattr(self.result, attr))):
+                writer.writerow([title.lower(), name] + ["" if c is None else c for c in cells])
+        yield buf.getvalue()